@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - BOM table memory report #
+# Models synthetic recipes (okm_synthetic) and reports the memory of the combined BOM table, in bytes per row, in the typed
+# schema and in the compact schema (okm_output.compact_bom_table), with float64 and with float32 numeric columns.
+#
+#     python benchmarks/bom_memory.py --recipes 5000
+
+import argparse
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from okm_equivalence import load_inputs
+from okm_model import model_recipes
+from okm_output import bom_table, compact_bom_table, bytes_per_row, memory_report
+from okm_synthetic import write_inputs
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Geheugen per regel van de gecombineerde BOM tabel')
+    parser.add_argument('--recipes', type=int, default=2000, help='aantal recepten')
+    parser.add_argument('--float32', action='store_true', help='het rapport per kolom met float32 in plaats van float64')
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as folder:
+        recipes, lookups = load_inputs(write_inputs(folder, {'recipes': args.recipes}))
+    model_recipes(recipes, lookups)
+
+    # the recipes as the model holds them, combined without any types
+    untyped = pd.concat([recipe.data for recipe in recipes], ignore_index=True)
+    typed = bom_table(recipes)
+    compact = compact_bom_table(typed)
+    compact32 = compact_bom_table(typed, float32=True)
+
+    sizes = [bytes_per_row(table).sum() for table in [untyped, typed, compact, compact32]]
+
+    print(f'{len(typed)} regels')
+    print(pd.DataFrame({'Schema': ['recepten (object)', 'getypeerd', 'compact', 'compact, float32'], 'Bytes per regel': sizes,
+                        'MB per 1M regels': [size * 1e6 / 2**20 for size in sizes]}).to_string(index=False, float_format='{:.1f}'.format))
+    print()
+    print(memory_report(typed, compact32 if args.float32 else compact).to_string(index=False, float_format='{:.1f}'.format))
+
+
+if __name__ == '__main__':
+    main()
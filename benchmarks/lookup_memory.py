@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - lookup table memory benchmark #
+# Compares the memory and start-up time of worker processes that each get a pickled copy of the lookup tables with workers that
+# attach to the lookup tables in shared memory (okm_shared). Workers are started with 'spawn', as on Windows, so a copy is a
+# real copy and not shared copy-on-write with the parent.
+#
+# Memory is the private memory (USS) of every worker, read from /proc, so this benchmark runs on Linux only.
+#
+#     python benchmarks/lookup_memory.py --ingredients 200000 --waste-rows 1000000 --workers 4
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import okm_model
+from okm_model import lookup_tables, init_worker
+from okm_shared import shared_lookup_tables, init_shared_worker
+
+
+def synthetic_lookups(n_ingredients, n_waste_rows, seed=0):
+    """ build large lookup tables in the layout okm_processing produces """
+    rng = np.random.default_rng(seed)
+    ingredients = pd.array([str(100000 + k) for k in range(n_ingredients)], dtype='string')
+    meals = pd.array([str(500000 + k) for k in range(n_waste_rows // 10)], dtype='string')
+
+    price_weight_data = pd.DataFrame({'INGREDIENT CODE': ingredients,
+                                      'KG': pd.array(rng.uniform(0.1, 1.0, n_ingredients), dtype='Float64'),
+                                      'PRICE Q2': pd.array(rng.uniform(1.0, 10.0, n_ingredients), dtype='Float64')})
+
+    waste_data = pd.DataFrame({'MEAL CODE': meals[rng.integers(0, len(meals), n_waste_rows)],
+                               'INGREDIENT CODE': ingredients[rng.integers(0, n_ingredients, n_waste_rows)],
+                               **{col: pd.array(rng.uniform(0.0, 0.3, n_waste_rows), dtype='Float64')
+                                  for col in ['WASTE-NAV', 'WASTE-FIN', 'WASTE-USE']}})
+    waste_data['id'] = (waste_data['MEAL CODE'] + '_' + waste_data['INGREDIENT CODE']).astype('string')
+
+    codes = np.array(ingredients, dtype=object)
+    return lookup_tables(codes[: n_ingredients // 2], codes[n_ingredients // 2: n_ingredients // 2 + 100], codes[-1000:],
+                         price_weight_data, waste_data, 'PRICE Q2')
+
+
+def worker_memory(_):
+    """ touch the lookup tables of the worker and report its private memory, in MB """
+    lookups = okm_model._worker_lookups
+
+    if lookups is not None:
+        lookups.price_weight_data['PRICE Q2'].sum()
+        lookups.waste_data[['WASTE-NAV', 'WASTE-FIN', 'WASTE-USE']].sum()
+
+    private = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                private += int(line.split()[1])
+
+    time.sleep(0.5) # so every worker gets a task
+    return os.getpid(), private / 1024
+
+
+def measure(workers, initializer, initargs):
+    """ start a pool, and collect the memory of every worker """
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=initializer, initargs=initargs) as pool:
+        memory = dict(pool.map(worker_memory, range(workers)))
+
+    return time.perf_counter() - start, memory
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Geheugengebruik van workers: kopie per worker of gedeeld geheugen')
+    parser.add_argument('--ingredients', type=int, default=200000, help='aantal regels in de prijslijst')
+    parser.add_argument('--waste-rows', type=int, default=1000000, help='aantal regels in de waste tabel')
+    parser.add_argument('--workers', type=int, default=4, help='aantal processen')
+    args = parser.parse_args(args)
+
+    lookups = synthetic_lookups(args.ingredients, args.waste_rows)
+
+    baseline_seconds, baseline = measure(args.workers, None, ())
+    copy_seconds, copy = measure(args.workers, init_worker, (lookups,))
+
+    with shared_lookup_tables(lookups) as shared:
+        shared_bytes = sum(block.size for block in shared.blocks)
+        shared_seconds, attached = measure(args.workers, init_shared_worker, (shared.handle,))
+
+    results = pd.DataFrame([
+        {'Modus': 'geen tabellen', 'Start (s)': baseline_seconds, 'Prive geheugen per worker (MB)': np.mean(list(baseline.values()))},
+        {'Modus': 'kopie per worker', 'Start (s)': copy_seconds, 'Prive geheugen per worker (MB)': np.mean(list(copy.values()))},
+        {'Modus': 'gedeeld geheugen', 'Start (s)': shared_seconds, 'Prive geheugen per worker (MB)': np.mean(list(attached.values()))}])
+    results['Totaal (MB)'] = results['Prive geheugen per worker (MB)'] * args.workers
+    results.loc[2, 'Totaal (MB)'] += shared_bytes / 2**20
+
+    print(f'{args.workers} workers, {args.ingredients} prijsregels, {args.waste_rows} waste regels; '
+          f'gedeeld geheugen: {shared_bytes / 2**20:.1f} MB')
+    print(results.to_string(index=False, float_format='{:.1f}'.format))
+
+
+if __name__ == '__main__':
+    main()
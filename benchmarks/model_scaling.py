@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - modeling scaling benchmark #
+# Times okm_model.model_recipes on the same synthetic recipes (okm_synthetic) with 1 up to N worker processes, to see how the
+# modeling scales with the number of cores.
+#
+#     python benchmarks/model_scaling.py --recipes 2000 --max-workers 8
+
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from okm_equivalence import load_inputs
+from okm_model import model_recipes
+from okm_synthetic import write_inputs
+
+
+def synthetic_recipes(n_recipes, seed=0):
+    """
+    Parse synthetic inputs (okm_synthetic) with n_recipes recipes, as okm_processing reads them
+
+    Returns:
+    - Tuple of the list of recipes and the lookup_tables
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        return load_inputs(write_inputs(folder, {'recipes': n_recipes, 'seed': seed}))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Schaalbaarheid van het modelleren over meerdere processen')
+    parser.add_argument('--recipes', type=int, default=1000, help='aantal recepten')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count(), help='hoogste aantal processen')
+    args = parser.parse_args(args)
+
+    parsed, lookups = synthetic_recipes(args.recipes)
+    results = []
+
+    # every run models its own copy of the parsed recipes
+    for workers in range(1, args.max_workers + 1):
+        recipes = copy.deepcopy(parsed)
+
+        start = time.perf_counter()
+        model_recipes(recipes, lookups, workers=workers)
+        seconds = time.perf_counter() - start
+
+        results.append({'Processen': workers, 'Tijd (s)': seconds, 'Recepten per s': args.recipes / seconds,
+                        'Versnelling': results[0]['Tijd (s)'] / seconds if results else 1.0})
+        print(f'{workers} proces(sen): {seconds:.2f} s')
+
+    print(pd.DataFrame(results).to_string(index=False, float_format='{:.2f}'.format))
+
+
+if __name__ == '__main__':
+    main()
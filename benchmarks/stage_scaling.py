@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - stage benchmarks #
+# Runs every stage of the pipeline on synthetic inputs (okm_synthetic) of several sizes, and records the time and peak memory of
+# every stage (okm_profile). The stages are those of a run with the default config (okm_processing.run_pipeline), which only writes
+# the Excel output. The time of every stage is compared between the sizes: a stage whose time grows faster than its number of rows
+# (e.g. a nested loop over the rows) is flagged. If a baseline was saved on this machine, the results are compared with it too.
+#
+#     python benchmarks/stage_scaling.py                              sizes 1k, 10k and 100k BOM rows
+#     python benchmarks/stage_scaling.py --sizes 1000 1000000         any sizes, e.g. 1M rows (takes a long time)
+#     python benchmarks/stage_scaling.py --save-baseline              store the results as the baseline of this machine
+#
+# The Excel stages only run for BOMs that fit on one sheet; the other stages start from the BOM download as read_bom returns it.
+# Baselines are only comparable on the same machine (the platform and number of CPUs are stored with them), so they are not part
+# of the repository.
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from okm_bom import read_bom, split_recipes
+from okm_model import MODEL_STEPS, lookup_tables
+from okm_output import write_bom_outputs
+from okm_processing import read_price_weight_data, read_waste_data, build_product_master, split_product_data
+from okm_processing import planning_stage
+from okm_profile import run_report
+from okm_synthetic import synthetic_inputs, write_sheet, EXCEL_MAX_ROWS
+
+
+SIZES = [1000, 10000, 100000]
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'stage_scaling.json')
+
+# Stages faster than this are not compared, their times are mostly noise
+MIN_SECONDS = 0.25
+
+# Growth exponent above which a stage is flagged as growing faster than its number of rows
+GROWTH_LIMIT = 1.3
+
+
+def bom_frame(inputs):
+    """ the BOM download of synthetic inputs, as read_bom returns it (without the first row, numbers with a decimal point) """
+    bom_data_raw = pd.DataFrame(inputs.bom_rows[1:])
+
+    for col in [5, 7, 8]:
+        bom_data_raw[col] = pd.to_numeric(bom_data_raw[col].str.replace(',', '.'))
+
+    for col in [1, 2]:
+        bom_data_raw[col] = bom_data_raw[col].astype('float64')
+
+    return bom_data_raw
+
+
+def run_stages(size, folder, seed=0, trace_memory=False):
+    """
+    Run every stage on synthetic inputs with about size BOM rows
+
+    Parameters:
+    - size: number of BOM rows
+    - folder: folder for the input and output workbooks
+    - seed: seed of the synthetic inputs
+    - trace_memory: also record the peak memory allocated by Python (slower)
+
+    Returns:
+    - run_report with a record per stage
+    """
+    inputs = synthetic_inputs({'rows': size, 'seed': seed})
+    price_period = inputs.spec['price_periods'][1]
+
+    price_weight_name, waste_name = os.path.join(folder, 'prices.xlsx'), os.path.join(folder, 'waste.xlsx')
+    write_sheet(price_weight_name, 'PriceList', inputs.price_weight_rows())
+    write_sheet(waste_name, 'WASTE', inputs.waste_rows_sheet())
+
+    bom_name = None
+    if len(inputs.bom_rows) <= EXCEL_MAX_ROWS:
+        bom_name = os.path.join(folder, 'bom.xlsx')
+        write_sheet(bom_name, 'Budget', inputs.bom_rows)
+
+    bom_data_raw = bom_frame(inputs)
+    rows = inputs.row_count
+
+    with run_report(trace_memory=trace_memory) as report:
+        if bom_name is not None:
+            with report.stage('excel_load') as record:
+                read_bom(bom_name)
+                record['rows'] = rows
+
+        # the price list and the waste table are loaded and cleaned (clean_input_sheet); the BOM is not cleaned, only split
+        with report.stage('read_price_weight') as record:
+            price_weight_data = read_price_weight_data(price_weight_name, 'PriceList')
+            record['rows'] = len(price_weight_data)
+
+        with report.stage('read_waste') as record:
+            waste_data = read_waste_data(waste_name, 'WASTE')
+            record['rows'] = len(waste_data)
+
+        with report.stage('segment') as record:
+            recipes = split_recipes(bom_data_raw)
+            record['rows'] = rows
+
+        with report.stage('classify') as record:
+            product_data = split_product_data(build_product_master(recipes))
+            record['rows'] = rows
+
+        with report.stage('index') as record:
+            lookups = lookup_tables(*product_data, price_weight_data, waste_data, price_period)
+            record['rows'] = rows
+
+        # every modeling step over all recipes, in the order of the model
+        for step, (function, _) in MODEL_STEPS.items():
+            with report.stage(step) as record:
+                for recipe in recipes:
+                    function(recipe, lookups)
+                record['rows'] = rows
+
+        with report.stage('planning') as record:
+            demand_ingredient, demand_category, meals = planning_stage(recipes, waste_data)
+            record['rows'] = rows
+
+        # as in a run that only writes the Excel output, the typed BOM table is not built
+        with report.stage('excel_export') as record:
+            write_bom_outputs(os.path.join(folder, 'output.xlsx'), recipes, ['xlsx'],
+                              extra_sheets={"Maaltijden": meals,
+                                            "Inkoop per ingredient": demand_ingredient,
+                                            "Inkoop per categorie": demand_category})
+            record['rows'] = rows
+
+    return report
+
+
+def results_of(report):
+    """ the time and peak memory of every stage of a report, as {stage: {'wall_s', 'cpu_s', 'peak_rss_mb', ...}} """
+    return {record['stage']: {key: value for key, value in record.items() if key not in ['stage', 'rows', 'calls']}
+            for record in report.records}
+
+
+def scaling_table(results):
+    """
+    The time of every stage per size, with the growth of the time between the last two sizes
+
+    The growth is the exponent k in time ~ rows^k: about 1 for a stage that is linear in its rows, 2 for a quadratic one.
+    """
+    sizes = sorted(results, key=int)
+    table = pd.DataFrame({size: {stage: values['wall_s'] for stage, values in results[size].items()} for size in sizes})
+
+    if len(sizes) > 1:
+        small, large = sizes[-2], sizes[-1]
+        growth = (table[large] / table[small]).map(math.log) / math.log(int(large) / int(small))
+        table['groei'] = growth.where(table[large] >= MIN_SECONDS)
+        table[''] = ['SUPERLINEAIR' if k > GROWTH_LIMIT else '' for k in table['groei'].fillna(0)]
+
+    return table
+
+
+def compare_table(results, baseline, tolerance):
+    """ the time and peak memory of every stage and size next to the baseline, flagging stages slower than tolerance x the baseline """
+    rows = []
+
+    for size, stages in results.items():
+        for stage, values in stages.items():
+            base = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if base is None:
+                continue
+
+            ratio = values['wall_s'] / base['wall_s'] if base['wall_s'] > 0 else math.nan
+            slower = ratio > tolerance and values['wall_s'] >= MIN_SECONDS
+            rows.append({'regels': int(size), 'stage': stage, 'tijd (s)': values['wall_s'], 'baseline (s)': base['wall_s'],
+                         'factor': ratio, 'piek RSS (MB)': values.get('peak_rss_mb'),
+                         'baseline RSS (MB)': base.get('peak_rss_mb'), '': 'TRAGER' if slower else ''})
+
+    return pd.DataFrame(rows)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Tijd en geheugen van elke stap van de pipeline, op synthetische invoer van meerdere groottes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='aantallen BOM regels (standaard: 1000 10000 100000)')
+    parser.add_argument('--seed', type=int, default=0, help='seed van de synthetische invoer')
+    parser.add_argument('--trace-memory', action='store_true', help='ook de piek van het door Python gealloceerde geheugen (trager)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline bestand (JSON)')
+    parser.add_argument('--save-baseline', action='store_true', help='de resultaten opslaan als nieuwe baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='factor boven de baseline waarboven een stap als trager wordt gemeld')
+    parser.add_argument('--output', help='de resultaten ook opslaan in dit JSON bestand')
+    args = parser.parse_args(args)
+
+    results = {}
+
+    for size in args.sizes:
+        print(f'\n## {size} BOM regels ##')
+
+        with tempfile.TemporaryDirectory() as folder:
+            report = run_stages(size, folder, args.seed, args.trace_memory)
+
+        results[str(size)] = results_of(report)
+
+    run = {'cpus': os.cpu_count(), 'platform': platform.platform(), 'python': platform.python_version(),
+           'pandas': pd.__version__, 'seed': args.seed, 'sizes': results}
+
+    print('\n## Tijd per stap (s) ##')
+    print(scaling_table(results).to_string(float_format='{:.3f}'.format, na_rep=''))
+
+    print('\n## Piek RSS per stap (MB) ##')
+    memory = pd.DataFrame({size: {stage: values.get('peak_rss_mb') for stage, values in stages.items()} for size, stages in results.items()})
+    print(memory.to_string(float_format='{:.0f}'.format, na_rep=''))
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        comparison = compare_table(results, baseline, args.tolerance)
+        if len(comparison):
+            print(f'\n## Vergeleken met de baseline ({baseline.get("platform")}, {baseline.get("cpus")} cpu\'s) ##')
+            print(comparison.to_string(index=False, float_format='{:.3f}'.format, na_rep=''))
+
+    elif not args.save_baseline:
+        print(f'\nGeen baseline op deze machine ({args.baseline}); opslaan met --save-baseline')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2)
+        print(f'\nBaseline opgeslagen: {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
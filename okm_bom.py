@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - BOM download #
+# Reading the NAV recipe download ('Recepten download NAV') and splitting it into recipes.
+#
+# A recipe starts at the row with 'Omschrijving' in the fifth column (the next row holds the recipe id and name) and ends at the
+# first row after it with 'Kostenaandeel voor dit artikel' in the fourth column.
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from okm_model import recipe
+from okm_state import recipe_fingerprint
+
+
+BOM_COLUMNS = {0: "id_nr", 1: "nr", 2: "Niveau", 3: "hf_nr", 4: "Omschrijving", 5: "Aantal (Basis)", 6: "Basiseenheid", 7: "Materiaalkosten"}
+
+BOM_TYPES = {"id_nr": str, "nr": int, "Niveau": int, "hf_nr": str, "Omschrijving": str, "Aantal (Basis)": float, "Basiseenheid": str,
+             "Materiaalkosten": float}
+
+# Columns of the download that make up the structure of a recipe: level, item, quantity and unit
+STRUCTURE_COLUMNS = [2, 3, 5, 6]
+
+
+def read_bom(bom_name, bom_sheet_name='Budget'):
+    """ read the BOM download, as is """
+    return pd.read_excel(bom_name, sheet_name=bom_sheet_name, skiprows=1, header=None, decimal=",")
+
+
+def recipe_bounds(bom_data_raw):
+    """
+    Find where every recipe is in the BOM download, in one pass over the marker columns
+
+    Parameters:
+    - bom_data_raw: BOM download, as returned by read_bom
+
+    Returns:
+    - List of (recipe id, recipe name, first row, end row) tuples; the BOM rows of a recipe are bom_data_raw.iloc[first row:end row]
+    """
+    starts = np.flatnonzero((bom_data_raw[4] == 'Omschrijving').to_numpy())
+    ends = np.flatnonzero((bom_data_raw[3] == 'Kostenaandeel voor dit artikel').to_numpy())
+
+    # every recipe ends at the first end marker after its start; a recipe without one is left out
+    end_positions = np.searchsorted(ends, starts)
+    bounds = []
+
+    for i, end_position in zip(starts, end_positions):
+        if end_position < len(ends):
+            bounds.append((bom_data_raw[3][i + 1], bom_data_raw[4][i + 1], i + 2, ends[end_position]))
+
+    return bounds
+
+
+def parse_recipe(bom_data_raw, recipe_id, recipe_name, start_idx, end_idx):
+    """
+    Build a recipe from its rows in the BOM download
+
+    Parameters:
+    - bom_data_raw: BOM download, as returned by read_bom
+    - recipe_id, recipe_name, start_idx, end_idx: as returned by recipe_bounds
+
+    Returns:
+    - recipe, with its fingerprint set
+    """
+    recipe_data = bom_data_raw.iloc[start_idx:end_idx].drop(range(8, 13), axis='columns').reset_index()
+    recipe_data = recipe_data.rename(columns=BOM_COLUMNS)
+    recipe_data = recipe_data.astype(BOM_TYPES)
+    recipe_data.insert(loc=2, column="Product Naam", value=[recipe_name for i in range(len(recipe_data))])
+
+    return recipe(name=recipe_name, id=recipe_id, data=recipe_data, fingerprint=recipe_fingerprint(recipe_data))
+
+
+def split_recipes(bom_data_raw):
+    """
+    Split the BOM download into recipes
+
+    Returns:
+    - List of recipes, in the order of the download
+    """
+    return [parse_recipe(bom_data_raw, *bounds) for bounds in recipe_bounds(bom_data_raw)]
+
+
+# ### Structural fingerprints ###
+# The structure of a recipe is the sequence of its rows' level, item, quantity and unit; descriptions, sequence numbers and costs
+# are left out. The rows of the whole download are hashed at once, a recipe's fingerprint is the hash of its rows' hashes.
+
+def structure_hashes(bom_data_raw):
+    """
+    Hash the structure columns of every row of the BOM download
+
+    Returns:
+    - Array of uint64 row hashes
+    """
+    structure = bom_data_raw[STRUCTURE_COLUMNS].astype('string')
+
+    return pd.util.hash_pandas_object(structure, index=False).to_numpy()
+
+
+def structure_fingerprints(bom_data_raw, bounds=None):
+    """
+    Fingerprint the structure of every recipe in the BOM download, without parsing the recipes
+
+    Parameters:
+    - bom_data_raw: BOM download, as returned by read_bom
+    - bounds: as returned by recipe_bounds, found if not given
+
+    Returns:
+    - Dict of recipe id to a (fingerprint, bounds) tuple; of a recipe that is more than once in the download, the first is kept
+    """
+    bounds = recipe_bounds(bom_data_raw) if bounds is None else bounds
+    row_hashes = structure_hashes(bom_data_raw)
+    fingerprints = {}
+
+    for bound in bounds:
+        recipe_id, _, start_idx, end_idx = bound
+        fingerprint = hashlib.sha256(row_hashes[start_idx:end_idx].tobytes()).hexdigest()
+        fingerprints.setdefault(str(recipe_id), (fingerprint, bound))
+
+    return fingerprints
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - BOM structure diff #
+# Shows which recipes changed structure between two NAV BOM downloads (items added or removed, quantity, unit or level changes),
+# before repricing.
+#
+# The structure of every recipe in both downloads is fingerprinted without parsing the recipes (see okm_bom). Only recipes whose
+# fingerprint differs are parsed and compared row by row, so comparing two downloads is linear in their size.
+#
+#     python okm_bom_diff.py "250410 Recepten download NAV 10-4.xlsx" "250416 Recepten download NAV 16-4.xlsx"
+
+import argparse
+
+import pandas as pd
+
+from okm_bom import read_bom, parse_recipe, structure_fingerprints
+from okm_output import bom_excel_writer
+
+
+DIFF_COLUMNS = ['Meal ID', 'Meal Name', 'Wijziging', 'Ingredient ID', 'Ingredient Name', 'Oud', 'Nieuw']
+
+# Compared columns of a row, with the change they are reported as
+ROW_CHANGES = {'Niveau': 'Niveau gewijzigd', 'Aantal (Basis)': 'Aantal gewijzigd', 'Basiseenheid': 'Eenheid gewijzigd'}
+
+
+def keyed_rows(recipe):
+    """ the rows of a parsed recipe, keyed on the item and its occurrence within the recipe """
+    rows = recipe.data[['hf_nr', 'Omschrijving'] + list(ROW_CHANGES)].copy()
+    rows['occurrence'] = rows.groupby('hf_nr', sort=False).cumcount()
+
+    return rows
+
+
+def diff_recipe(old_recipe, new_recipe):
+    """
+    Compare the rows of a recipe in the old and new download
+
+    Returns:
+    - List of changes, as dicts with the DIFF_COLUMNS
+    """
+    merged = keyed_rows(new_recipe).merge(keyed_rows(old_recipe), on=['hf_nr', 'occurrence'], how='outer',
+                                          suffixes=('', ' oud'), indicator=True, sort=False)
+    changes = []
+
+    def change(kind, row, old, new):
+        name = row['Omschrijving'] if pd.notna(row['Omschrijving']) else row['Omschrijving oud']
+        changes.append({'Meal ID': new_recipe.id, 'Meal Name': new_recipe.name, 'Wijziging': kind, 'Ingredient ID': row['hf_nr'],
+                        'Ingredient Name': name, 'Oud': old, 'Nieuw': new})
+
+    for _, row in merged.iterrows():
+        if row['_merge'] == 'left_only':
+            change('Item toegevoegd', row, None, row['Aantal (Basis)'])
+        elif row['_merge'] == 'right_only':
+            change('Item verwijderd', row, row['Aantal (Basis) oud'], None)
+        else:
+            for col, kind in ROW_CHANGES.items():
+                old, new = row[col + ' oud'], row[col]
+                # an empty cell in both downloads (e.g. a missing unit) is not a change
+                if not (pd.isna(old) and pd.isna(new)) and old != new:
+                    change(kind, row, old, new)
+
+    # same rows, in a different order (e.g. an item moved to another HF)
+    if not changes:
+        changes.append({'Meal ID': new_recipe.id, 'Meal Name': new_recipe.name, 'Wijziging': 'Volgorde gewijzigd',
+                        'Ingredient ID': None, 'Ingredient Name': None, 'Oud': None, 'Nieuw': None})
+
+    return changes
+
+
+def diff_boms(old_raw, new_raw):
+    """
+    Compare the structure of the recipes in two BOM downloads
+
+    Parameters:
+    - old_raw, new_raw: BOM downloads, as returned by okm_bom.read_bom
+
+    Returns:
+    - Tuple of a DataFrame with one row per change and a dict with the number of unchanged, changed, added and removed recipes
+    """
+    old_fingerprints = structure_fingerprints(old_raw)
+    new_fingerprints = structure_fingerprints(new_raw)
+
+    changes = []
+    counts = {'Ongewijzigd': 0, 'Gewijzigd': 0, 'Toegevoegd': 0, 'Verwijderd': 0}
+
+    for recipe_id, (fingerprint, bounds) in new_fingerprints.items():
+        if recipe_id not in old_fingerprints:
+            counts['Toegevoegd'] += 1
+            changes.append({'Meal ID': bounds[0], 'Meal Name': bounds[1], 'Wijziging': 'Recept toegevoegd'})
+
+        elif old_fingerprints[recipe_id][0] == fingerprint:
+            counts['Ongewijzigd'] += 1 # not parsed
+
+        else:
+            counts['Gewijzigd'] += 1
+            changes += diff_recipe(parse_recipe(old_raw, *old_fingerprints[recipe_id][1]), parse_recipe(new_raw, *bounds))
+
+    for recipe_id, (_, bounds) in old_fingerprints.items():
+        if recipe_id not in new_fingerprints:
+            counts['Verwijderd'] += 1
+            changes.append({'Meal ID': bounds[0], 'Meal Name': bounds[1], 'Wijziging': 'Recept verwijderd'})
+
+    return pd.DataFrame(changes, columns=DIFF_COLUMNS), counts
+
+
+def print_diff(changes, counts):
+    """ print the changes, per recipe """
+    print(', '.join(f'{kind}: {count}' for kind, count in counts.items()))
+
+    for (meal_id, meal_name), recipe_changes in changes.groupby(['Meal ID', 'Meal Name'], sort=False):
+        print(f'\n{meal_id} {meal_name}')
+
+        for row in recipe_changes.itertuples(index=False):
+            if pd.isna(row[3]):
+                print(f'    {row.Wijziging}')
+            else:
+                old, new = ('-' if pd.isna(value) else value for value in (row.Oud, row.Nieuw))
+                print(f'    {row.Wijziging}: {row[3]} {row[4]} ({old} -> {new})')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Vergelijk de receptstructuur van twee NAV BOM downloads')
+    parser.add_argument('old', help='oude BOM download')
+    parser.add_argument('new', help='nieuwe BOM download')
+    parser.add_argument('--sheet', default='Budget', help='tabblad van de BOM (standaard: Budget)')
+    parser.add_argument('--output', help='Excel bestand om de wijzigingen ook in op te slaan')
+    args = parser.parse_args(args)
+
+    changes, counts = diff_boms(read_bom(args.old, args.sheet), read_bom(args.new, args.sheet))
+    print_diff(changes, counts)
+
+    if args.output:
+        with bom_excel_writer(args.output) as writer:
+            writer.write_sheet(changes, 'Wijzigingen')
+        print(f'Wijzigingen opgeslagen: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - stage cache #
+# The intermediate results of a run (the parsed BOM, the cleaned price & waste tables and the modeled recipes) are kept on disk,
+# under a key made of the hashes of the input files and the parameters the stage depends on:
+#
+#     <cache_dir>/<stage>/<key>/...
+#
+# A stage whose key is in the cache is loaded instead of run, so a run resumes from the first stage whose inputs changed; e.g.
+# a run with only another output mapping or output format loads the modeled recipes and only writes the outputs. Entries are
+# never changed once written, and the cache directory can be deleted at any time; stage_cache.prune deletes the entries the
+# current inputs no longer use (okm_watch does so after every run). The run state (okm_state) refers to the entry with the
+# modeled recipes of the last run; once that entry is gone, the next run models every recipe again.
+#
+# Tables are stored as Parquet. Recipes are stored as one table of all their rows and one table with a row per recipe.
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from okm_model import recipe
+
+
+# Bump when parsing or modeling changes, so results of an older version are not loaded
+CACHE_VERSION = 1
+
+# Suffix of the column holding the text values of a column with numbers and text (e.g. 'Kan niet berekenen')
+TEXT_SUFFIX = ' (tekst)'
+
+
+def cache_key(stage, *parts):
+    """
+    Build the key of a stage from the hashes and parameters it depends on
+
+    Parameters:
+    - stage: name of the stage
+    - parts: file hashes, keys of earlier stages and parameter values (anything with a stable repr)
+
+    Returns:
+    - Hex digest
+    """
+    return hashlib.sha256(repr((CACHE_VERSION, stage) + parts).encode('utf-8')).hexdigest()
+
+
+# ### Columnar recipes ###
+# The modeled columns hold numbers, None and sentinel texts in one (object) column. In the cache such a column is split into a
+# float column and a text column; numbers without text stay a float column when read back.
+
+def encode_rows(rows):
+    """ split the columns with both numbers and text of the rows of all recipes, for storing them as Parquet """
+    encoded = {}
+
+    for col in rows.columns:
+        column = rows[col]
+
+        if column.dtype == object and column.map(lambda value: isinstance(value, str)).any():
+            is_text = column.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+            encoded[col] = pd.to_numeric(column.where(~is_text), errors='coerce').astype('float64')
+            encoded[col + TEXT_SUFFIX] = column.where(is_text).astype('string')
+
+        elif column.dtype == object:
+            encoded[col] = pd.to_numeric(column, errors='coerce').astype('float64')
+
+        else:
+            encoded[col] = column
+
+    return pd.DataFrame(encoded)
+
+
+def decode_rows(rows, start, end):
+    """ the rows of one recipe, with the text columns merged back into their number columns """
+    data = rows.iloc[start:end].reset_index(drop=True)
+
+    for col in [col for col in data.columns if col.endswith(TEXT_SUFFIX)]:
+        text = data.pop(col)
+        target = col[:-len(TEXT_SUFFIX)]
+
+        if text.notna().any():
+            values = data[target].astype(object).where(data[target].notna(), None)
+            data[target] = values.where(text.isna(), text.astype(object))
+
+    return data
+
+
+def recipes_to_tables(recipes):
+    """
+    Store a list of recipes as two tables
+
+    Returns:
+    - Tuple of the rows of all recipes and a table with the id, name, keys, number of rows and totals of every recipe
+    """
+    rows = encode_rows(pd.concat([r.data for r in recipes], ignore_index=True)) if recipes else pd.DataFrame()
+    index = pd.DataFrame({'id': [r.id for r in recipes],
+                          'name': [r.name for r in recipes],
+                          'fingerprint': [getattr(r, 'fingerprint', None) for r in recipes],
+                          'result_key': [getattr(r, 'result_key', None) for r in recipes],
+                          'rows': [len(r.data) for r in recipes],
+                          'totals': [json.dumps(getattr(r, 'totals', None)) for r in recipes]})
+
+    return rows, index
+
+
+def recipes_from_tables(rows, index):
+    """ rebuild the list of recipes stored by recipes_to_tables """
+    recipes = []
+    ends = np.cumsum(index['rows'].to_numpy())
+
+    for k, row in enumerate(index.itertuples(index=False)):
+        r = recipe(name=row.name, id=row.id, data=decode_rows(rows, ends[k] - row.rows, ends[k]))
+
+        for attribute in ['fingerprint', 'result_key']:
+            if getattr(row, attribute) is not None and not pd.isna(getattr(row, attribute)):
+                setattr(r, attribute, getattr(row, attribute))
+
+        totals = json.loads(row.totals)
+        if totals is not None:
+            r.totals = totals
+
+        recipes.append(r)
+
+    return recipes
+
+
+# ### Cache ###
+
+class stage_cache:
+    """ the intermediate results of runs, on disk, by stage and key """
+
+    def __init__(self, cache_dir : str) -> None:
+        """ initialise an instance of stage_cache"""
+        self.cache_dir = cache_dir
+
+    def path(self, stage : str, key : str) -> str:
+        """ the directory of a cache entry """
+        return os.path.join(self.cache_dir, stage, key)
+
+    def has(self, stage : str, key : str) -> bool:
+        """ whether a stage result is in the cache """
+        return os.path.exists(os.path.join(self.path(stage, key), 'entry.json'))
+
+    def load(self, stage : str, key : str):
+        """ load a stage result, a DataFrame or a list of recipes """
+        path = self.path(stage, key)
+
+        with open(os.path.join(path, 'entry.json'), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+
+        if entry['kind'] == 'recipes':
+            return recipes_from_tables(pd.read_parquet(os.path.join(path, 'rows.parquet')),
+                                       pd.read_parquet(os.path.join(path, 'recipes.parquet')))
+
+        return pd.read_parquet(os.path.join(path, 'table.parquet'))
+
+    def save(self, stage : str, key : str, value) -> None:
+        """ save a stage result, a DataFrame or a list of recipes """
+        path = self.path(stage, key)
+
+        if os.path.exists(path):
+            return
+
+        # written to a directory of its own and moved in place at once, so an interrupted save never leaves a partial entry
+        temp_path = os.path.join(self.cache_dir, stage, f'.{key}.{uuid.uuid4().hex}')
+        os.makedirs(temp_path)
+
+        try:
+            if isinstance(value, pd.DataFrame):
+                kind = 'table'
+                value.to_parquet(os.path.join(temp_path, 'table.parquet'), index=False)
+            else:
+                kind = 'recipes'
+                rows, index = recipes_to_tables(value)
+                rows.to_parquet(os.path.join(temp_path, 'rows.parquet'), index=False)
+                index.to_parquet(os.path.join(temp_path, 'recipes.parquet'), index=False)
+
+            with open(os.path.join(temp_path, 'entry.json'), 'w', encoding='utf-8') as f:
+                json.dump({'version': CACHE_VERSION, 'stage': stage, 'kind': kind}, f)
+
+            os.rename(temp_path, path)
+
+        except OSError:
+            if not os.path.exists(path):
+                raise
+
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    def prune(self, keep) -> int:
+        """
+        Delete the entries that are no longer referenced
+
+        Parameters:
+        - keep: (stage, key) tuples of the entries to keep
+
+        Returns:
+        - Number of entries deleted
+        """
+        keep = set(keep)
+        deleted = 0
+
+        if not os.path.isdir(self.cache_dir):
+            return deleted
+
+        for stage in os.listdir(self.cache_dir):
+            if not os.path.isdir(os.path.join(self.cache_dir, stage)):
+                continue
+
+            # entries that are still being saved ('.<key>.<id>') are left alone
+            for key in os.listdir(os.path.join(self.cache_dir, stage)):
+                if not key.startswith('.') and (stage, key) not in keep:
+                    shutil.rmtree(self.path(stage, key), ignore_errors=True)
+                    deleted += 1
+
+        return deleted
+
+    def get(self, stage : str, key : str, compute):
+        """
+        Load a stage result from the cache, or compute it and add it to the cache
+
+        Parameters:
+        - stage: name of the stage
+        - key: key of the stage, see cache_key
+        - compute: function without arguments computing the stage result
+
+        Returns:
+        - The stage result
+        """
+        if self.has(stage, key):
+            print(f'Uit de cache: {stage}')
+            return self.load(stage, key)
+
+        value = compute()
+        self.save(stage, key, value)
+
+        return value
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - output diff #
+# Compares two output runs (e.g. v6 against v7, or Q1 against Q2) row by row, to explain cost movements.
+#
+# Rows are matched on (Meal ID, Volgnummer, Ingredient ID). Keys and row contents are hashed once per row, so the comparison is a
+# single hash join: linear in the size of the outputs. Only the rows whose hashes differ are compared column by column, numbers
+# within a tolerance; a row is only reported as changed if a value in it is.
+#
+#     python okm_diff.py "Output v6 - Q2.xlsx" "Output v7 - Q2.xlsx" "Verschil v6 - v7.xlsx"
+
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from okm_history import COST_COLUMNS
+from okm_output import bom_excel_writer, restore_text
+
+
+KEY_COLUMNS = ['Meal ID', 'Volgnummer', 'Ingredient ID']
+
+# Columns that are not compared: the row number in the BOM download changes whenever a recipe moves in the download
+IGNORED_COLUMNS = ['Index']
+
+# Decimals numeric values are hashed on, and the largest difference between two numbers that are the same, so rounding noise in
+# the last bits (e.g. of a number read back from Excel) is not reported as a change
+DECIMALS = 9
+TOLERANCE = 10 ** -DECIMALS
+
+
+def read_run(path):
+    """
+    Read the BOM of an output run, from any of the output formats
+
+    Parameters:
+    - path: path of the output file (.xlsx, .parquet, .feather or .sqlite); the BOM of a sharded Excel output is read from all its
+      BOM sheets
+
+    Returns:
+    - DataFrame with the output headers; for the typed formats the text in 'Opmerkingen' is put back in the columns it came
+      from (see okm_output.restore_text), so every format of the same run gives the same values
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.parquet':
+        return restore_text(pd.read_parquet(path))
+
+    if extension == '.feather':
+        return restore_text(pd.read_feather(path))
+
+    if extension == '.sqlite':
+        with sqlite3.connect(path) as con:
+            bom = pd.read_sql('SELECT * FROM "BOM"', con)
+        con.close()
+        return restore_text(bom)
+
+    sheets = pd.read_excel(path, sheet_name=None)
+    bom_sheets = [name for name in sheets if name == 'BOM' or name.startswith('BOM_')]
+
+    if not bom_sheets:
+        raise ValueError(f'Geen BOM tabblad gevonden in {path}')
+
+    # the first column holds the row number within the recipe
+    return pd.concat([sheets[name].iloc[:, 1:] for name in bom_sheets], ignore_index=True)
+
+
+def row_keys(bom):
+    """
+    Hash the key of every row
+
+    A key that occurs more than once (a meal that is twice in the download) is numbered by occurrence, so every row has a unique key.
+
+    Returns:
+    - Array of uint64 keys
+    """
+    keys = bom[KEY_COLUMNS].astype('string')
+    keys['occurrence'] = keys.groupby(KEY_COLUMNS, sort=False, dropna=False).cumcount()
+
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def normalize(column, decimals=DECIMALS):
+    """
+    Split a column in its numeric values (rounded to decimals, None to not round) and its text (e.g. 'Kan niet berekenen'), to
+    compare and hash on
+
+    Returns:
+    - Tuple of a float64 Series and a string Series
+    """
+    numbers = pd.to_numeric(column, errors='coerce').astype('float64')
+    text = column.where(numbers.isna()).astype('string')
+
+    return (numbers if decimals is None else numbers.round(decimals)), text
+
+
+def row_hashes(bom, columns):
+    """
+    Hash the contents of every row, over the compared columns
+
+    Returns:
+    - Array of uint64 hashes
+    """
+    parts = {}
+
+    for col in columns:
+        parts[col + ' #'], parts[col + ' txt'] = normalize(bom[col])
+
+    return pd.util.hash_pandas_object(pd.DataFrame(parts, index=bom.index), index=False).to_numpy()
+
+
+def changed_values(old_rows, new_rows, columns):
+    """
+    List the values that differ between matched rows
+
+    Parameters:
+    - old_rows, new_rows: matched rows of the old and new run, in the same order
+    - columns: compared columns
+
+    Returns:
+    - Tuple of a DataFrame with one row per changed value, and a boolean array of the rows with a changed value
+    """
+    changes = []
+    rows_changed = np.zeros(len(new_rows), dtype=bool)
+
+    for col in columns:
+        old_numbers, old_text = normalize(old_rows[col].reset_index(drop=True), None)
+        new_numbers, new_text = normalize(new_rows[col].reset_index(drop=True), None)
+
+        same_number = ((old_numbers - new_numbers).abs() <= TOLERANCE) | (old_numbers.isna() & new_numbers.isna())
+        same_text = (old_text == new_text).fillna(False) | (old_text.isna() & new_text.isna())
+        differs = ~(same_number & same_text).to_numpy()
+        rows_changed |= differs
+
+        if differs.any():
+            changes.append(pd.DataFrame({
+                **{key: new_rows[key].to_numpy()[differs] for key in ['Meal ID', 'Meal Name', 'Volgnummer', 'Ingredient ID', 'Ingredient Name']},
+                'Kolom': col,
+                'Oud': old_rows[col].to_numpy()[differs],
+                'Nieuw': new_rows[col].to_numpy()[differs],
+                'Verschil': (new_numbers - old_numbers).to_numpy()[differs]}))
+
+    if not changes:
+        return pd.DataFrame(columns=['Meal ID', 'Meal Name', 'Volgnummer', 'Ingredient ID', 'Ingredient Name', 'Kolom', 'Oud', 'Nieuw',
+                                     'Verschil']), rows_changed
+
+    # the changes of a row together, in the order of the new run
+    return pd.concat(changes, ignore_index=True).sort_values(['Meal ID', 'Volgnummer'], kind='stable', ignore_index=True), rows_changed
+
+
+def meal_costs(bom):
+    """
+    Material costs per meal: the sum of its level 1 rows (an HF carries the costs of its children)
+
+    Returns:
+    - DataFrame indexed by Meal ID, with the Meal Name and the COST_COLUMNS
+    """
+    level_1 = bom[pd.to_numeric(bom['Level'], errors='coerce') == 1]
+    costs = level_1[COST_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    costs['Meal ID'] = level_1['Meal ID'].astype('string')
+    costs['Meal Name'] = level_1['Meal Name']
+
+    return costs.groupby('Meal ID', sort=False).agg(**{'Meal Name': ('Meal Name', 'first'),
+                                                       **{col: (col, 'sum') for col in COST_COLUMNS}})
+
+
+def diff_runs(old, new):
+    """
+    Compare the BOM of two output runs
+
+    Parameters:
+    - old: BOM of the old run, as returned by read_run
+    - new: BOM of the new run, as returned by read_run
+
+    Returns:
+    - Dict with the 'added', 'removed' and 'changed' rows, the cost deltas per meal ('meals') and a 'summary'
+    """
+    columns = [col for col in new.columns if col in old.columns and col not in KEY_COLUMNS + IGNORED_COLUMNS]
+
+    old = old.reset_index(drop=True).assign(_key=row_keys(old), _hash=row_hashes(old, columns))
+    new = new.reset_index(drop=True).assign(_key=row_keys(new), _hash=row_hashes(new, columns))
+
+    # hash join on the row keys
+    matched = new[['_key', '_hash']].reset_index().merge(old[['_key', '_hash']].reset_index(), on='_key', how='outer',
+                                                        suffixes=('_new', '_old'), indicator=True)
+
+    added = new.loc[matched.loc[matched['_merge'] == 'left_only', 'index_new'].astype('int64')]
+    removed = old.loc[matched.loc[matched['_merge'] == 'right_only', 'index_old'].astype('int64')]
+
+    both = matched[(matched['_merge'] == 'both') & (matched['_hash_new'] != matched['_hash_old'])].sort_values('index_new')
+    changed, rows_changed = changed_values(old.loc[both['index_old'].astype('int64')], new.loc[both['index_new'].astype('int64')],
+                                           columns)
+    both = both[rows_changed]
+
+    # cost deltas per meal, with the number of added, removed and changed rows
+    old_costs, new_costs = meal_costs(old), meal_costs(new)
+    meals = new_costs[['Meal Name']].combine_first(old_costs[['Meal Name']])
+
+    for col in COST_COLUMNS:
+        meals[col + ' oud'] = old_costs[col]
+        meals[col + ' nieuw'] = new_costs[col]
+        meals[col + ' delta'] = new_costs[col].reindex(meals.index).fillna(0) - old_costs[col].reindex(meals.index).fillna(0)
+
+    meals['Regels toegevoegd'] = added['Meal ID'].astype('string').value_counts().reindex(meals.index, fill_value=0)
+    meals['Regels verwijderd'] = removed['Meal ID'].astype('string').value_counts().reindex(meals.index, fill_value=0)
+    meals['Regels gewijzigd'] = (new.loc[both['index_new'].astype('int64'), 'Meal ID'].astype('string').value_counts()
+                                 .reindex(meals.index, fill_value=0))
+    meals['Status'] = np.select([~meals.index.isin(old_costs.index), ~meals.index.isin(new_costs.index),
+                                 meals[['Regels toegevoegd', 'Regels verwijderd', 'Regels gewijzigd']].sum(axis=1) > 0],
+                                ['Nieuw', 'Verwijderd', 'Gewijzigd'], 'Ongewijzigd')
+
+    # only the meals that moved are kept, largest cost movement first
+    delta = COST_COLUMNS[-1] + ' delta'
+    meals = (meals[(meals['Status'] != 'Ongewijzigd') | (meals[delta].abs() > TOLERANCE)]
+             .sort_values(delta, key=abs, ascending=False)
+             .rename_axis('Meal ID').reset_index())
+
+    summary = pd.DataFrame({'Omschrijving': ['Regels oud', 'Regels nieuw', 'Regels toegevoegd', 'Regels verwijderd', 'Regels gewijzigd',
+                                             'Gewijzigde waarden', 'Maaltijden gewijzigd', f'{COST_COLUMNS[-1]} delta'],
+                            'Waarde': [len(old), len(new), len(added), len(removed), len(both), len(changed), len(meals),
+                                       meals[delta].sum()]})
+
+    return {'added': added.drop(columns=['_key', '_hash']),
+            'removed': removed.drop(columns=['_key', '_hash']),
+            'changed': changed,
+            'meals': meals,
+            'summary': summary}
+
+
+def write_diff(path, diff):
+    """ write the diff to a workbook, one sheet per part """
+    with bom_excel_writer(path) as writer:
+        writer.write_sheet(diff['summary'], 'Samenvatting')
+        writer.write_sheet(diff['meals'], 'Kosten per maaltijd')
+        writer.write_sheet(diff['changed'], 'Gewijzigd')
+        writer.write_sheet(diff['added'], 'Toegevoegd')
+        writer.write_sheet(diff['removed'], 'Verwijderd')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Vergelijk twee OKM output runs')
+    parser.add_argument('old', help='output van de oude run (.xlsx, .parquet, .feather of .sqlite)')
+    parser.add_argument('new', help='output van de nieuwe run')
+    parser.add_argument('output', help='Excel bestand voor het verschil')
+    args = parser.parse_args(args)
+
+    diff = diff_runs(read_run(args.old), read_run(args.new))
+    write_diff(args.output, diff)
+
+    print(diff['summary'].to_string(index=False))
+    print(f'Verschil opgeslagen: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
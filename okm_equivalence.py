@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - equivalence check #
+# Runs the reference steps (okm_reference, row by row) and an optimized engine on the same recipes, one step at a time, and
+# compares every column after every step. An engine is a module with a MODEL_STEPS dict with the step names of okm_model;
+# by default okm_model itself:
+#
+#     python okm_equivalence.py --recipes 500 --errors 0.02              synthetic inputs (okm_synthetic)
+#     python okm_equivalence.py --config okm_jobs.toml                   the inputs of the first job of a config
+#     python okm_equivalence.py --engine okm_vectorized                  another engine
+#
+# Numbers are equal within a relative and an absolute tolerance; texts, among which the sentinels ('Kan niet berekenen',
+# 'Dubbele waste info', 'Geen bijbehorend HF', 'Ongeclassificeerd item', ...), must be exactly equal, and a missing value
+# (None, NaN) only equals a missing value. A difference is reported at the step where it first shows up; the steps after it
+# work on the engine's own results, so a difference may carry on into later columns. Columns only the engine adds (e.g.
+# 'Grammage HF (berekend)') are not compared.
+#
+# Every item is classified from the BOM, so the synthetic inputs have no unclassified items; with 'unclassified' a share of
+# the items is left out of the product master to cover those cases too. The exit code is 1 if there are differences.
+
+import argparse
+import copy
+import importlib
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import okm_reference
+from okm_model import lookup_tables
+from okm_processing import read_recipes, read_price_weight_data, read_waste_data, build_product_master, split_product_data
+from okm_processing import run_config, read_config, job_configs
+from okm_synthetic import write_inputs
+
+
+DEFAULT_RTOL = 1e-9
+DEFAULT_ATOL = 1e-12
+
+
+def text_mask(column):
+    """ whether every value of a column is text """
+    return column.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+
+
+def compare_column(reference, engine, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL):
+    """
+    Compare a column of the reference with the same column of the engine
+
+    Parameters:
+    - reference, engine: Series of the same length, with numbers, texts and missing values
+    - rtol, atol: relative and absolute tolerance for numbers
+
+    Returns:
+    - Tuple of a boolean array of the differing rows, a boolean array of the differing rows where either value is text, and
+      the largest absolute difference between numbers (0 if none)
+    """
+    reference = reference.astype(object).reset_index(drop=True)
+    engine = engine.astype(object).reset_index(drop=True)
+
+    reference_text, engine_text = text_mask(reference), text_mask(engine)
+    text_differs = (reference_text | engine_text) & ~(reference_text & engine_text & (reference.astype(str) == engine.astype(str)).to_numpy())
+
+    reference_numbers = pd.to_numeric(reference.where(~reference_text), errors='coerce').to_numpy(dtype=float)
+    engine_numbers = pd.to_numeric(engine.where(~engine_text), errors='coerce').to_numpy(dtype=float)
+
+    both_numbers = ~reference_text & ~engine_text
+    reference_missing, engine_missing = np.isnan(reference_numbers), np.isnan(engine_numbers)
+    close = np.isclose(reference_numbers, engine_numbers, rtol=rtol, atol=atol) | (reference_missing & engine_missing)
+    number_differs = both_numbers & ~close
+
+    differences = np.abs(reference_numbers - engine_numbers)[both_numbers & ~reference_missing & ~engine_missing]
+    max_difference = float(differences.max()) if len(differences) else 0.0
+
+    return text_differs | number_differs, text_differs, max_difference
+
+
+def compare_engines(recipes, lookups, engine_steps=None, reference_steps=None, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL):
+    """
+    Run the reference and the engine on copies of the recipes, step by step, and compare every column after every step
+
+    Parameters:
+    - recipes: list of parsed recipes, left as they are
+    - lookups: lookup_tables, shared by both
+    - engine_steps: MODEL_STEPS of the engine, defaults to okm_model.MODEL_STEPS
+    - reference_steps: MODEL_STEPS of the reference, defaults to okm_reference.MODEL_STEPS
+    - rtol, atol: relative and absolute tolerance for numbers
+
+    Returns:
+    - DataFrame with a row per step and column, for the columns the step added or changed in the reference and the columns
+      whose number of differences changed at the step; with the number of rows, the number of texts (sentinels) in the
+      reference, the number of differing rows, of which with text, the largest difference and the first differing row (recipe,
+      row number, reference value, engine value)
+    """
+    if engine_steps is None:
+        from okm_model import MODEL_STEPS as engine_steps
+
+    reference_steps = okm_reference.MODEL_STEPS if reference_steps is None else reference_steps
+
+    missing = set(reference_steps) - set(engine_steps)
+    if missing:
+        raise ValueError(f'De engine mist de stap(pen): {sorted(missing)}')
+
+    reference_recipes, engine_recipes = copy.deepcopy(recipes), copy.deepcopy(recipes)
+    compared = {} # column -> number of differing rows after the previous step
+    previous_table = None
+    rows = []
+
+    for step, (reference_function, _) in reference_steps.items():
+        engine_function = engine_steps[step][0]
+
+        for recipe in reference_recipes:
+            reference_function(recipe, lookups)
+        for recipe in engine_recipes:
+            engine_function(recipe, lookups)
+
+        reference_table = pd.concat([recipe.data for recipe in reference_recipes], ignore_index=True)
+        engine_table = pd.concat([recipe.data for recipe in engine_recipes], ignore_index=True)
+
+        for column in reference_table.columns:
+            if column not in engine_table.columns:
+                if column not in compared:
+                    rows.append({'stap': step, 'kolom': column, 'regels': len(reference_table), 'tekst in referentie': np.nan,
+                                 'verschillen': len(reference_table),
+                                 'waarvan tekst': 0, 'max verschil': np.nan, 'eerste verschil': 'kolom ontbreekt in de engine'})
+                    compared[column] = len(reference_table)
+                continue
+
+            differs, text_differs, max_difference = compare_column(reference_table[column], engine_table[column], rtol, atol)
+            count = int(differs.sum())
+
+            changed = previous_table is None or column not in previous_table.columns or \
+                compare_column(previous_table[column], reference_table[column], rtol, atol)[0].any()
+
+            if column in compared and compared[column] == count and not changed:
+                continue
+
+            first = ''
+            if count:
+                i = int(np.flatnonzero(differs)[0])
+                first = (f'recept {reference_table["id_nr"][i]} regel {reference_table["nr"][i]}: '
+                         f'{reference_table[column][i]!r} != {engine_table[column][i]!r}')
+
+            rows.append({'stap': step, 'kolom': column, 'regels': len(reference_table),
+                         'tekst in referentie': int(text_mask(reference_table[column].astype(object)).sum()), 'verschillen': count,
+                         'waarvan tekst': int(text_differs.sum()), 'max verschil': max_difference, 'eerste verschil': first})
+            compared[column] = count
+
+        previous_table = reference_table
+
+    return pd.DataFrame(rows, columns=['stap', 'kolom', 'regels', 'tekst in referentie', 'verschillen', 'waarvan tekst',
+                                       'max verschil', 'eerste verschil'])
+
+
+def step_summary(comparison):
+    """ the comparison per step: number of columns checked, and number of columns and rows that differ """
+    summary = comparison.groupby('stap', sort=False).agg(kolommen=('kolom', 'size'),
+                                                        kolommen_met_verschil=('verschillen', lambda counts: int((counts > 0).sum())),
+                                                        verschillen=('verschillen', 'sum'))
+    return summary.reset_index()
+
+
+def leave_out_items(product_data, share, seed=0):
+    """ leave a share of the items of every category out of the product master, so they are unclassified """
+    rng = np.random.default_rng(seed)
+    return tuple(codes[rng.random(len(codes)) >= share] for codes in product_data)
+
+
+def load_inputs(config, unclassified=0.0, seed=0):
+    """
+    Read the inputs of a run configuration
+
+    Returns:
+    - Tuple of the parsed recipes and the lookup_tables
+    """
+    config = run_config(config)
+
+    recipes = read_recipes(config['bom_name'], config['bom_sheet_name'])
+    price_weight_data = read_price_weight_data(config['price_weight_name'], config['price_weight_sheet_name'])
+    waste_data = read_waste_data(config['waste_name'], config['waste_sheet_name'])
+
+    product_data = split_product_data(build_product_master(recipes))
+    if unclassified:
+        product_data = leave_out_items(product_data, unclassified, seed)
+
+    return recipes, lookup_tables(*product_data, price_weight_data, waste_data, config['price_period'])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Vergelijk de referentie stappen met een geoptimaliseerde engine')
+    parser.add_argument('--config', help='TOML of JSON configuratie; de invoer van de eerste job wordt gebruikt in plaats van synthetische invoer')
+    parser.add_argument('--engine', default='okm_model', help='module met de MODEL_STEPS van de engine (standaard: okm_model)')
+    parser.add_argument('--recipes', type=int, default=300, help='aantal synthetische recepten')
+    parser.add_argument('--depth', type=int, default=3, help='diepste niveau van de synthetische recepten')
+    parser.add_argument('--errors', type=float, default=0.02, help='kans op elke soort fout in de synthetische invoer')
+    parser.add_argument('--unclassified', type=float, default=0.01, help='deel van de items dat uit de productmaster wordt gelaten')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rtol', type=float, default=DEFAULT_RTOL, help='relatieve tolerantie voor getallen')
+    parser.add_argument('--atol', type=float, default=DEFAULT_ATOL, help='absolute tolerantie voor getallen')
+    args = parser.parse_args(args)
+
+    engine_steps = importlib.import_module(args.engine).MODEL_STEPS
+
+    with tempfile.TemporaryDirectory() as folder:
+        if args.config:
+            config = job_configs(read_config(args.config))[0][1]
+        else:
+            config = write_inputs(folder, {'recipes': args.recipes, 'depth': args.depth, 'seed': args.seed,
+                                           **{rate: args.errors for rate in ['duplicate_waste_rate', 'duplicate_weight_rate',
+                                                                             'missing_weight_rate', 'orphan_rate']}})
+
+        recipes, lookups = load_inputs(config, args.unclassified, args.seed)
+
+    comparison = compare_engines(recipes, lookups, engine_steps, rtol=args.rtol, atol=args.atol)
+
+    print(f'\n## {args.engine} vergeleken met okm_reference: {len(recipes)} recepten ##')
+    print(comparison.to_string(index=False, float_format='{:.3g}'.format, na_rep=''))
+    print()
+    print(step_summary(comparison).to_string(index=False))
+
+    differences = int(comparison['verschillen'].sum())
+    print(f'\n{"Geen verschillen" if differences == 0 else f"{differences} verschillen"} (rtol {args.rtol:g}, atol {args.atol:g})')
+
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
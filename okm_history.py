@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - run history #
+# Every run's BOM is appended to a local store, partitioned by period and run timestamp:
+#
+#     <history_dir>/period=Q2/run=20250416T093000.123456/bom.parquet
+#
+# Runs are never overwritten: a run that starts in the same microsecond as an earlier one gets the next free microsecond. The trend queries only read the partitions (periods & runs) and columns they need.
+
+import datetime
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+PARTITIONING = ds.partitioning(pa.schema([('period', pa.string()), ('run', pa.string())]), flavor='hive')
+
+COST_COLUMNS = ['Materiaalkosten 1.0 (P BOM + Q BOM) (€)',
+                'Materiaalkosten 2.0 (P actueel) (€)',
+                'Materiaalkosten 3.0 (P actueel + Q Waste update) (€)']
+
+
+def append_run(history_dir, table, period, run_timestamp=None):
+    """
+    Append the BOM of a run to the history
+
+    Parameters:
+    - history_dir: directory of the history store
+    - table: typed BOM table, as returned by okm_output.bom_table
+    - period: period the run belongs to, e.g. 'Q2'
+    - run_timestamp: datetime of the run, defaults to now
+
+    Returns:
+    - Path of the file written
+    """
+    run_timestamp = run_timestamp or datetime.datetime.now()
+
+    # append only: an existing run is never overwritten, the run moves to the next free microsecond instead
+    while True:
+        run_dir = os.path.join(history_dir, f'period={period}', f'run={run_timestamp:%Y%m%dT%H%M%S.%f}')
+        try:
+            os.makedirs(run_dir, exist_ok=False)
+            break
+        except FileExistsError:
+            run_timestamp += datetime.timedelta(microseconds=1)
+
+    path = os.path.join(run_dir, 'bom.parquet')
+    table.to_parquet(path, index=False)
+
+    return path
+
+
+def list_runs(history_dir):
+    """
+    List the runs in the history, from the directory names only
+
+    Returns:
+    - DataFrame with the 'period' and 'run' of every run, sorted
+    """
+    runs = []
+
+    if os.path.isdir(history_dir):
+        for period_dir in os.listdir(history_dir):
+            if period_dir.startswith('period='):
+                for run_dir in os.listdir(os.path.join(history_dir, period_dir)):
+                    if run_dir.startswith('run='):
+                        runs.append({'period': period_dir[len('period='):], 'run': run_dir[len('run='):]})
+
+    return pd.DataFrame(runs, columns=['period', 'run']).sort_values(['period', 'run']).reset_index(drop=True)
+
+
+def read_history(history_dir, columns, periods=None, all_runs=False, filter=None):
+    """
+    Read columns of the BOM of the selected runs from the history
+
+    Parameters:
+    - history_dir: directory of the history store
+    - columns: BOM columns to read
+    - periods: periods to read, defaults to all periods
+    - all_runs: read every run of a period, instead of only the latest
+    - filter: extra pyarrow.dataset filter expression on the BOM columns
+
+    Returns:
+    - DataFrame with the 'period', 'run' and the requested columns
+    """
+    runs = list_runs(history_dir)
+
+    if periods is not None:
+        runs = runs[runs['period'].isin(periods)]
+    if not all_runs:
+        runs = runs.groupby('period').tail(1)
+
+    if len(runs) == 0:
+        return pd.DataFrame(columns=['period', 'run'] + columns)
+
+    # only the files of the selected runs are opened
+    files = [os.path.join(history_dir, f'period={period}', f'run={run}', 'bom.parquet') for period, run in runs.itertuples(index=False)]
+    dataset = ds.dataset(files, format='parquet', partitioning=PARTITIONING, partition_base_dir=history_dir)
+
+    return dataset.to_table(columns=['period', 'run'] + columns, filter=filter).to_pandas()
+
+
+def meal_cost_trend(history_dir, meal_ids=None, periods=None, all_runs=False):
+    """
+    Material costs per meal, per period
+
+    The costs of a meal are the sum of its level 1 rows (an HF carries the costs of its children).
+
+    Parameters:
+    - history_dir: directory of the history store
+    - meal_ids: meals to include, defaults to all meals
+    - periods: periods to include, defaults to all periods
+    - all_runs: include every run of a period, instead of only the latest
+
+    Returns:
+    - DataFrame with one row per period, run and meal
+    """
+    filter = ds.field('Level') == 1
+    if meal_ids is not None:
+        filter = filter & ds.field('Meal ID').isin([str(meal_id) for meal_id in meal_ids])
+
+    history = read_history(history_dir, ['Meal ID', 'Meal Name'] + COST_COLUMNS, periods, all_runs, filter)
+
+    return (history.groupby(['period', 'run', 'Meal ID'], sort=True)
+            .agg(**{'Meal Name': ('Meal Name', 'first'), **{col: (col, 'sum') for col in COST_COLUMNS}})
+            .reset_index())
+
+
+def ingredient_cost_trend(history_dir, ingredient_ids=None, periods=None, all_runs=False):
+    """
+    Price, quantity and material costs per ingredient, per period, over all meals
+
+    Parameters:
+    - history_dir: directory of the history store
+    - ingredient_ids: ingredients to include, defaults to all ingredients
+    - periods: periods to include, defaults to all periods
+    - all_runs: include every run of a period, instead of only the latest
+
+    Returns:
+    - DataFrame with one row per period, run and ingredient
+    """
+    filter = ds.field('Categorie Master') != 'Halffabrikaat'
+    if ingredient_ids is not None:
+        filter = filter & ds.field('Ingredient ID').isin([str(ingredient_id) for ingredient_id in ingredient_ids])
+
+    price = 'Ingredientprijs p.e. (Actueel) (€)'
+    quantity = 'Aantal uitval USE (#)'
+    columns = ['Meal ID', 'Ingredient ID', 'Ingredient Name', price, quantity] + COST_COLUMNS
+    history = read_history(history_dir, columns, periods, all_runs, filter)
+
+    return (history.groupby(['period', 'run', 'Ingredient ID'], sort=True)
+            .agg(**{'Ingredient Name': ('Ingredient Name', 'first'),
+                    price: (price, 'mean'),
+                    quantity: (quantity, 'sum'),
+                    'Aantal maaltijden': ('Meal ID', 'nunique'), # an ingredient can be more than once in a meal
+                    **{col: (col, 'sum') for col in COST_COLUMNS}})
+            .reset_index())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - code interning #
+# Item and meal codes are strings in every input. Every code seen in the lookup tables is interned once to a dense int32 number,
+# and the lookup tables are indexed on those numbers: which categories an item is in, where its rows in the price & weight table
+# are, and where the waste rows of a meal & item are. The codes of a recipe are translated once per lookup index (see
+# okm_model.recipe_codes) and kept on the recipe, so every modeling step only looks up integers; the strings stay in the recipes
+# for the output. Classifying the items into the product master and the reference steps (okm_reference) still work on the
+# strings.
+
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+# Category flags of an item; an item can (in a faulty product master) be in more than one category
+INGREDIENT = 1
+PACKAGING = 2
+HF = 4
+
+
+class code_table:
+    """ interns codes (strings) to dense int32 numbers, in order of first appearance """
+
+    def __init__(self, strings=()) -> None:
+        """ initialise an instance of code_table, with the codes already known (in code order) """
+        self.strings = list(strings)
+        self.positions = {string: code for code, string in enumerate(self.strings)}
+        self._index = None
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def intern(self, values) -> np.ndarray:
+        """
+        Intern codes, adding the codes that are not known yet
+
+        Parameters:
+        - values: sequence of codes; missing values get -1
+
+        Returns:
+        - Array of int32 codes
+        """
+        for value in pd.unique(pd.Series(values, dtype=object).dropna()):
+            if value not in self.positions:
+                self.positions[value] = len(self.strings)
+                self.strings.append(value)
+                self._index = None
+
+        return self.lookup(values)
+
+    def lookup(self, values) -> np.ndarray:
+        """ the int32 codes of known codes, -1 for unknown and missing codes """
+        if self._index is None:
+            self._index = pd.Index(self.strings, dtype=object)
+
+        return self._index.get_indexer(pd.Index(values, dtype=object)).astype('int32')
+
+    def decode(self, codes) -> np.ndarray:
+        """ the strings of int32 codes, None for -1 """
+        codes = np.asarray(codes)
+        strings = np.asarray(self.strings + [None], dtype=object)
+
+        return strings[np.where(codes >= 0, codes, len(self.strings))]
+
+
+def first_rows(keys):
+    """
+    Index the rows of a table on a key column
+
+    Parameters:
+    - keys: integer key of every row, negative for rows without a key
+
+    Returns:
+    - Tuple of the sorted distinct keys, the first row of every key and the number of rows of every key
+    """
+    rows = np.flatnonzero(keys >= 0)
+    unique_keys, first, counts = np.unique(keys[rows], return_index=True, return_counts=True)
+
+    return unique_keys, rows[first].astype('int32'), counts.astype('int32')
+
+
+def find_rows(keys, index_keys, first, count):
+    """
+    Look keys up in an index built by first_rows
+
+    Returns:
+    - Tuple of the first row and the number of rows of every key, (-1, 0) for keys without rows
+    """
+    if len(index_keys) == 0:
+        return np.full(len(keys), -1, dtype='int32'), np.zeros(len(keys), dtype='int32')
+
+    positions = np.searchsorted(index_keys, keys).clip(max=len(index_keys) - 1)
+    found = (keys >= 0) & (index_keys[positions] == keys)
+
+    return np.where(found, first[positions], -1), np.where(found, count[positions], 0)
+
+
+class lookup_index:
+    """ integer indexes on the lookup tables """
+
+    def __init__(self, codes : code_table, flags : np.ndarray, price_keys : np.ndarray, price_first : np.ndarray,
+                 price_count : np.ndarray, waste_keys : np.ndarray, waste_first : np.ndarray, waste_count : np.ndarray,
+                 token : str = None) -> None:
+        """ initialise an instance of lookup_index; the token tells which index the codes kept on a recipe belong to """
+        self.token = uuid.uuid4().hex if token is None else token
+        self.codes = codes
+        self.flags = flags
+        self.price_keys = price_keys
+        self.price_first = price_first
+        self.price_count = price_count
+        self.waste_keys = waste_keys
+        self.waste_first = waste_first
+        self.waste_count = waste_count
+
+    def item_codes(self, items) -> np.ndarray:
+        """ the int32 codes of the items of a recipe ('hf_nr'), -1 for items not in any lookup table """
+        return self.codes.lookup(items)
+
+    def item_flags(self, codes) -> np.ndarray:
+        """ the category flags of items, 0 for items that are in no category """
+        return np.where(codes >= 0, self.flags[codes], 0)
+
+    def price_rows(self, codes):
+        """ the first row in the price & weight table, and the number of rows, of every item """
+        return find_rows(np.asarray(codes, dtype='int64'), self.price_keys, self.price_first, self.price_count)
+
+    def waste_rows(self, meal, codes):
+        """ the first row in the waste table, and the number of rows, of every item of a meal """
+        meal_code = self.codes.lookup([str(meal)])[0]
+        keys = np.where((codes >= 0) & (meal_code >= 0), (np.int64(meal_code) << 32) | np.asarray(codes, dtype='int64'), -1)
+
+        return find_rows(keys, self.waste_keys, self.waste_first, self.waste_count)
+
+
+def build_lookup_index(product_data_ingredient, product_data_packaging, product_data_HF, price_weight_data, waste_data):
+    """
+    Intern the item and meal codes of the lookup tables and index the tables on them
+
+    Parameters:
+    - product_data_ingredient, product_data_packaging, product_data_HF: arrays of the item codes per category
+    - price_weight_data: price & weight table, with the 'INGREDIENT CODE' column
+    - waste_data: waste table, with the 'MEAL CODE' and 'INGREDIENT CODE' columns
+
+    Returns:
+    - lookup_index
+    """
+    codes = code_table()
+
+    category_codes = [(flag, codes.intern(items)) for flag, items in [(INGREDIENT, product_data_ingredient),
+                                                                       (PACKAGING, product_data_packaging),
+                                                                       (HF, product_data_HF)]]
+    price_codes = codes.intern(price_weight_data['INGREDIENT CODE'])
+    meal_codes = codes.intern(waste_data['MEAL CODE'])
+    waste_item_codes = codes.intern(waste_data['INGREDIENT CODE'])
+
+    flags = np.zeros(len(codes), dtype='uint8')
+    for flag, item_codes in category_codes:
+        flags[item_codes[item_codes >= 0]] |= flag
+
+    waste_keys = np.where((meal_codes >= 0) & (waste_item_codes >= 0),
+                          (meal_codes.astype('int64') << 32) | waste_item_codes.astype('int64'), -1)
+
+    return lookup_index(codes, flags, *first_rows(price_codes.astype('int64')), *first_rows(waste_keys))
@@ -0,0 +1,584 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - modeling steps #
+# The per-recipe modeling steps of the OKM model. Every step adds or overwrites one or more columns of a recipe and can be
+# re-run on its own, so that a run can recompute only the steps (and recipes) that depend on a changed input.
+
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import pandas as pd
+import numpy as np
+
+from okm_intern import INGREDIENT, PACKAGING, HF, lookup_index, build_lookup_index
+
+
+# ### Objects ###
+
+class recipe:
+    """ a recipe """
+
+    def __init__(self, name : str, id : str, data : pd.DataFrame, fingerprint : str = None) -> None:
+        """ initialise an instance of recipe"""
+        self.name = name
+        self.id = id
+        self.data = data
+        self.fingerprint = fingerprint
+        self.result_key = None
+        self.totals = None
+        self.codes = None # (token of the lookup index, int32 codes of the items), see recipe_codes
+
+    def __str__(self) -> str:
+        """ set the string representation of a recipe """
+        return f'{self.id} {self.name}'
+
+
+class lookup_tables:
+    """ the input tables the modeling steps look up information in """
+
+    def __init__(self, product_data_ingredient : np.ndarray, product_data_packaging : np.ndarray, product_data_HF : np.ndarray,
+                 price_weight_data : pd.DataFrame, waste_data : pd.DataFrame, price_period : str, index : lookup_index = None) -> None:
+        """ initialise an instance of lookup_tables; the integer index on the tables is built if it is not given """
+        self.product_data_ingredient = product_data_ingredient
+        self.product_data_packaging = product_data_packaging
+        self.product_data_HF = product_data_HF
+        self.price_weight_data = price_weight_data
+        self.waste_data = waste_data
+        self.price_period = price_period
+
+        if index is None:
+            index = build_lookup_index(product_data_ingredient, product_data_packaging, product_data_HF, price_weight_data, waste_data)
+        self.index = index
+
+
+def recipe_codes(recipe, lookups):
+    """
+    The int32 codes of the items of a recipe ('hf_nr') in the lookup index. They are looked up once and kept on the recipe for
+    the other steps; a recipe modeled with other lookup tables before (e.g. reused from the previous run) is looked up again.
+    """
+    codes = getattr(recipe, 'codes', None)
+
+    if codes is None or codes[0] != lookups.index.token or len(codes[1]) != len(recipe.data):
+        codes = (lookups.index.token, lookups.index.item_codes(recipe.data['hf_nr']))
+        recipe.codes = codes
+
+    return codes[1]
+
+
+# ## Modeling ##
+
+# ### Add categories ###
+
+def add_categories(recipe, lookups):
+    """
+    Add the 'Categorie' column, based on the product master
+    """
+    flags = lookups.index.item_flags(recipe_codes(recipe, lookups))
+    categories = []
+
+    for flag in flags:
+        if flag & INGREDIENT:
+            categories.append('Ingredient')
+
+        elif flag & HF:
+            categories.append('Halffabrikaat')
+
+        elif flag & PACKAGING:
+            categories.append('Verpakking')
+
+        else:
+            categories.append('Ongeclassificeerd')
+
+    recipe.data['Categorie'] = categories
+
+
+# ### New prices ###
+
+def add_new_prices(recipe, lookups):
+    """
+    Add the 'Nieuwe prijs' column.
+    From price list for ingredients & gas; 0 for packaging; and empty for HFs.
+    """
+    codes = recipe_codes(recipe, lookups)
+    flags = lookups.index.item_flags(codes)
+    price_rows, _ = lookups.index.price_rows(codes)
+    prices = lookups.price_weight_data[lookups.price_period]
+    new_prices = []
+
+    for i in range(len(recipe.data)):
+
+        if flags[i] & INGREDIENT: # ingredients
+            if price_rows[i] < 0:
+                raise IndexError(f'Ingredient {recipe.data["hf_nr"][i]} staat niet in de prijslijst')
+            new_price = prices.iloc[price_rows[i]]
+
+        elif flags[i] & PACKAGING: # packaging
+            new_price = 0
+
+        elif flags[i] & HF: # HFs
+            new_price = None
+
+        else: # unclassified
+            new_price = 'Geen nieuwe prijs'
+
+        new_prices.append(new_price)
+
+    recipe.data['Nieuwe prijs'] = new_prices
+
+
+# ### Old prices ###
+
+def add_old_prices(recipe, lookups):
+    """
+    Add the 'Oude prijs' column.
+    Old costs / old quantity for ingredients & gas; 0 for packaging; and empty for HFs.
+    """
+    flags = lookups.index.item_flags(recipe_codes(recipe, lookups))
+    old_prices = []
+
+    for i in range(len(recipe.data)):
+
+        if flags[i] & INGREDIENT: # ingredients
+            old_price = recipe.data['Materiaalkosten'][i] / recipe.data['Aantal (Basis)'][i]
+
+        elif flags[i] & PACKAGING: # packaging
+            old_price = 0
+
+        elif flags[i] & HF: # HFs
+            old_price = None
+
+        else: # unclassified
+            old_price = recipe.data['Materiaalkosten'][i] / recipe.data['Aantal (Basis)'][i]
+
+        old_prices.append(old_price)
+
+    recipe.data['Oude prijs'] = old_prices
+
+
+# ### Weight in kg ###
+
+def add_weights(recipe, lookups):
+    """
+    Add the 'Grammage' column.
+    Convert items not in kg. Items already in kg stay the same. Packaging goes to 0, regardless of the unit.
+    """
+    codes = recipe_codes(recipe, lookups)
+    flags = lookups.index.item_flags(codes)
+    weight_rows, weight_counts = lookups.index.price_rows(codes)
+    kg = lookups.price_weight_data['KG']
+    weights = []
+
+    for i in range(len(recipe.data)):
+
+        if flags[i] & PACKAGING: # packaging to 0
+            weight = 0.0
+
+        elif not recipe.data['Basiseenheid'][i] == 'KG':
+
+            if weight_counts[i] == 0: # no info about this item
+                weight = 'Geen conversie info'
+
+            elif weight_counts[i] == 1: # new info about this item
+                weight = kg.iloc[weight_rows[i]] * recipe.data['Aantal (Basis)'][i]
+
+            else:
+                weight = 'Dubbele conversie info'
+
+        else:
+            weight = recipe.data['Aantal (Basis)'][i]
+
+        weights.append(weight)
+
+    recipe.data['Grammage'] = weights
+
+
+# ### Waste ###
+
+def add_waste(recipe, lookups):
+    """
+    Add the 'Waste NAV', 'Waste FIN' and 'Waste USE' columns.
+    For items at level 1: find the waste in the waste data. For all other items, find the parent item at level 1, and take the waste from there.
+    """
+    codes = recipe_codes(recipe, lookups)
+    flags = lookups.index.item_flags(codes)
+    waste_rows, waste_counts = lookups.index.waste_rows(recipe.id, codes)
+    levels = recipe.data['Niveau'].to_numpy()
+    waste_columns = [lookups.waste_data[col] for col in ['WASTE-NAV', 'WASTE-FIN', 'WASTE-USE']]
+
+    def waste_of(j):
+        """ the waste of the item on row j, in this meal """
+        if waste_counts[j] == 0:
+            # return 'Geen waste info', 'Geen waste info', 'Geen waste info'
+            return 0, 0, 0
+
+        elif waste_counts[j] == 1:
+            return tuple(col.iloc[waste_rows[j]] for col in waste_columns)
+
+        else:
+            return 'Dubbele waste info', 'Dubbele waste info', 'Dubbele waste info'
+
+    waste_nav_col = []
+    waste_fin_col = []
+    waste_use_col = []
+
+    for i in range(len(recipe.data)):
+
+        if levels[i] == 1: # waste is only determined at level 1
+            waste_nav, waste_fin, waste_use = waste_of(i)
+
+        else:
+            for j in range(i, -1, -1): # loop backwards to find the closest level 1 item
+                if levels[j] == 1:
+
+                    if flags[j] & HF:
+                        waste_nav, waste_fin, waste_use = waste_of(j)
+
+                    else:
+                        waste_nav = 'Geen bijbehorend HF'
+                        waste_fin = 'Geen bijbehorend HF'
+                        waste_use = 'Geen bijbehorend HF'
+
+                    break
+
+        waste_nav_col.append(waste_nav)
+        waste_fin_col.append(waste_fin)
+        waste_use_col.append(waste_use)
+
+    recipe.data['Waste NAV'] = waste_nav_col
+    recipe.data['Waste FIN'] = waste_fin_col
+    recipe.data['Waste USE'] = waste_use_col
+
+
+# ### Quantities ###
+
+def add_quantities(recipe, lookups):
+    """
+    Add the 'Aantal (zonder waste)' and 'Aantal (nieuw)' columns.
+    Calculate the quantities based on the known waste data.
+    """
+    q_no_waste_col = []
+    q_new_col = []
+
+    for i in range(len(recipe.data)):
+
+        try:
+            q_no_waste = recipe.data['Aantal (Basis)'][i] / (1 + recipe.data['Waste NAV'][i])
+        except TypeError:
+            q_no_waste = 'Kan niet berekenen'
+
+        try:
+            q_new = q_no_waste * (1 + recipe.data['Waste USE'][i])
+        except TypeError:
+            q_new = 'Kan niet berekenen'
+
+        q_no_waste_col.append(q_no_waste)
+        q_new_col.append(q_new)
+
+    recipe.data['Aantal (zonder waste)'] = q_no_waste_col
+    recipe.data['Aantal (nieuw)'] = q_new_col
+
+
+# ### Costs ###
+# Several costs are calculated:
+# - new p * old q ("vvp")
+# - new p * new q ("materiaalkosten")
+#
+# Costs are first calculated for the non-HF items, based on row-level info. Afterwards the HF item costs are calculated and inserted based on hierarchical info.
+
+# #### Non-HF costs ####
+
+def add_costs(recipe, lookups):
+    """
+    Add the 'Nieuwe vvp' and 'Materiaalkosten (nieuw)' columns for the non-HF items
+    """
+    flags = lookups.index.item_flags(recipe_codes(recipe, lookups))
+    newp_oldq_col = []
+    newp_newq_col = []
+
+    for i in range(len(recipe.data)):
+
+        if flags[i] & (INGREDIENT | PACKAGING):
+            try:
+                newp_oldq = recipe.data['Nieuwe prijs'][i] * recipe.data['Aantal (Basis)'][i]
+                newp_newq = recipe.data['Nieuwe prijs'][i] * recipe.data['Aantal (nieuw)'][i]
+
+            except TypeError: # could use the old price here as well
+                newp_oldq = 'Kan niet berekenen'
+                newp_newq = 'Kan niet berekenen'
+
+        elif flags[i] & HF:
+            newp_oldq = None
+            newp_newq = None
+
+        else:
+            newp_oldq = 'Ongeclassificeerd item'
+            newp_newq = 'Ongeclassificeerd item'
+
+        newp_oldq_col.append(newp_oldq)
+        newp_newq_col.append(newp_newq)
+
+    recipe.data['Nieuwe vvp'] = newp_oldq_col
+    recipe.data['Materiaalkosten (nieuw)'] = newp_newq_col
+
+
+# #### HF costs ####
+# The reference implementation (add_hf_costs, an inner loop per HF) is in okm_reference.
+
+def subtree_ends(levels):
+    """
+    Find where the subtree of every row ends, in one pass over the levels
+
+    Parameters:
+    - levels: sequence of 'Niveau' values of a recipe
+
+    Returns:
+    - List with for every row the index of the first row after its subtree
+    """
+    ends = [len(levels)] * len(levels)
+    open_rows = []
+
+    for j in range(len(levels)):
+        while open_rows and levels[open_rows[-1]] >= levels[j]:
+            ends[open_rows.pop()] = j
+        open_rows.append(j)
+
+    return ends
+
+
+# #### HF rollups ####
+# Column summed over the children of an HF, and the column the total is written to on the HF row. The same sums over the whole
+# recipe give the totals of the meal.
+
+HF_ROLLUPS = {'Nieuwe vvp': 'Nieuwe vvp',
+              'Materiaalkosten (nieuw)': 'Materiaalkosten (nieuw)',
+              'Materiaalkosten': 'Materiaalkosten HF (berekend)',
+              'Grammage': 'Grammage HF (berekend)'}
+
+
+def add_hf_rollups(recipe, lookups):
+    """
+    Fill in the costs and weights of the HF items, and the totals of the meal, in one pass over the recipe.
+
+    Like okm_reference.add_hf_costs, but the subtree of every HF is found once from the levels (subtree_ends), and its rows are
+    summed as a slice of a NumPy array instead of walking the rows below every HF.
+    """
+    data = recipe.data
+    ends = subtree_ends(data['Niveau'].to_numpy())
+    is_hf = (lookups.index.item_flags(recipe_codes(recipe, lookups)) & HF) > 0
+
+    # non-numeric values (HFs, sentinels) are skipped in the sums, as in okm_reference.add_hf_costs
+    values = np.column_stack([pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=float) for column in HF_ROLLUPS])
+    values[is_hf] = 0.0
+    values[np.isnan(values)] = 0.0
+
+    hf_rows = np.flatnonzero(is_hf)
+    totals = np.array([values[i + 1:ends[i]].sum(axis=0) for i in hf_rows]).reshape(len(hf_rows), len(HF_ROLLUPS))
+
+    if len(hf_rows):
+        for k, target in enumerate(HF_ROLLUPS.values()):
+            column = data[target].to_numpy(copy=True) if target in data else np.full(len(data), np.nan)
+            column[hf_rows] = totals[:, k]
+            data[target] = column
+
+    recipe.totals = dict(zip(HF_ROLLUPS, [float(total) for total in values.sum(axis=0)]))
+
+
+# ### Deltas ###
+
+def add_deltas(recipe, lookups):
+    """
+    Add the 'Delta Q', 'Delta prijs', 'Delta materiaalkosten' and 'Delta FIN waste' columns
+    """
+    delta_q_col = []
+    delta_p_col = []
+    delta_cost_col = []
+    fin_waste_impact_col = []
+
+    for i in range(len(recipe.data)):
+
+        try:
+            delta_q = (recipe.data['Aantal (nieuw)'][i] - recipe.data['Aantal (Basis)'][i]) * recipe.data['Oude prijs'][i]
+            delta_p = (recipe.data['Nieuwe prijs'][i] - recipe.data['Oude prijs'][i]) * recipe.data['Aantal (nieuw)'][i]
+            delta_cost = recipe.data['Materiaalkosten (nieuw)'][i] - recipe.data['Materiaalkosten'][i]
+            fin_waste_impact = recipe.data['Materiaalkosten (nieuw)'][i] - recipe.data['Nieuwe vvp'][i]
+
+        except TypeError:
+            delta_q = 'Kan niet berekenen'
+            delta_p = 'Kan niet berekenen'
+            delta_cost = 'Kan niet berekenen'
+            fin_waste_impact = 'Kan niet berekenen'
+
+        delta_q_col.append(delta_q)
+        delta_p_col.append(delta_p)
+        delta_cost_col.append(delta_cost)
+        fin_waste_impact_col.append(fin_waste_impact)
+
+    recipe.data['Delta Q'] = delta_q_col
+    recipe.data['Delta prijs'] = delta_p_col
+    recipe.data['Delta materiaalkosten'] = delta_cost_col
+    recipe.data['Delta FIN waste'] = fin_waste_impact_col
+
+
+# ### Step dependencies ###
+# Every step, in the order in which they have to run, with the inputs and earlier steps it depends on.
+# Inputs are the input files ('bom_file', 'price_weight_file', 'waste_file') and run parameters ('price_period').
+
+MODEL_STEPS = {
+    'categories': (add_categories, ['bom_file']),
+    'new_prices': (add_new_prices, ['bom_file', 'price_weight_file', 'price_period']),
+    'old_prices': (add_old_prices, ['bom_file']),
+    'weights': (add_weights, ['bom_file', 'price_weight_file']),
+    'waste': (add_waste, ['bom_file', 'waste_file']),
+    'quantities': (add_quantities, ['waste']),
+    'costs': (add_costs, ['new_prices', 'quantities']),
+    'hf_rollups': (add_hf_rollups, ['costs', 'weights']),
+    'deltas': (add_deltas, ['old_prices', 'new_prices', 'quantities', 'hf_rollups']),
+}
+
+
+def invalidated_steps(changed_inputs):
+    """
+    Determine which modeling steps have to be re-run when some of the inputs changed
+
+    Parameters:
+    - changed_inputs: iterable of input names (keys used in MODEL_STEPS) that changed
+
+    Returns:
+    - List of step names, in run order
+    """
+    invalid = set(changed_inputs)
+    steps = []
+
+    for step, (_, dependencies) in MODEL_STEPS.items():
+        if invalid.intersection(dependencies):
+            invalid.add(step)
+            steps.append(step)
+
+    return steps
+
+
+def model_recipe(recipe, lookups, steps=None, timings=None):
+    """
+    Run the modeling steps on a recipe
+
+    Parameters:
+    - recipe: recipe to model, its data is updated in place
+    - lookups: lookup_tables
+    - steps: names of the steps to run, defaults to all steps
+    - timings: dict to add the wall time, CPU time, number of calls and number of rows of every step to, as
+      {step: [wall, cpu, calls, rows]}; None to not time the steps
+
+    Returns:
+    - The modeled recipe
+    """
+    for step, (function, _) in MODEL_STEPS.items():
+        if steps is None or step in steps:
+            if timings is None:
+                function(recipe, lookups)
+                continue
+
+            start_wall, start_cpu = time.perf_counter(), time.process_time()
+            function(recipe, lookups)
+            timing = timings.setdefault(step, [0.0, 0.0, 0, 0])
+            timing[0] += time.perf_counter() - start_wall
+            timing[1] += time.process_time() - start_cpu
+            timing[2] += 1
+            timing[3] += len(recipe.data)
+
+    return recipe
+
+
+def merge_timings(timings, other):
+    """ add the step timings of other (see model_recipe) to timings """
+    for step, (wall, cpu, calls, rows) in other.items():
+        timing = timings.setdefault(step, [0.0, 0.0, 0, 0])
+        timing[0] += wall
+        timing[1] += cpu
+        timing[2] += calls
+        timing[3] += rows
+
+
+# ### Parallel modeling ###
+# Recipes are independent once the lookup tables exist. With more than one worker the recipes are split into contiguous batches
+# over a pool of processes. The lookup tables are sent to every worker once, when it starts, and are only read from there. The
+# modeled data is sent back and put in the recipes, in their original order.
+
+_worker_lookups = None
+
+
+def init_worker(lookups):
+    """ keep the lookup tables in the worker process, for all batches it models """
+    global _worker_lookups
+    _worker_lookups = lookups
+
+
+def model_batch(batch, steps, timed=False):
+    """
+    Model a batch of recipes in a worker process
+
+    Returns:
+    - Tuple of the modeled (data, totals, codes) of every recipe and the step timings of the batch (None if not timed)
+    """
+    timings = {} if timed else None
+
+    for recipe in batch:
+        model_recipe(recipe, _worker_lookups, steps, timings)
+
+    return [(recipe.data, recipe.totals, recipe.codes) for recipe in batch], timings
+
+
+def model_recipes(recipes, lookups, steps=None, workers=1, batch_size=None, shared_memory=False, timings=None):
+    """
+    Run the modeling steps on a list of recipes, in parallel if more than one worker is given
+
+    Parameters:
+    - recipes: list of recipes to model, their data is updated in place
+    - lookups: lookup_tables
+    - steps: names of the steps to run, defaults to all steps
+    - workers: number of worker processes, 1 models the recipes in this process
+    - batch_size: number of recipes sent to a worker at a time, defaults to a quarter of the recipes per worker
+    - shared_memory: put the lookup tables in shared memory for the workers to attach to, instead of sending every worker a copy
+      (see okm_shared)
+    - timings: dict to add the timings of every step to, see model_recipe; with more than one worker the times are summed over
+      the workers
+
+    Returns:
+    - The modeled recipes, in the same order
+    """
+    if workers <= 1 or len(recipes) < 2:
+        for recipe in recipes:
+            model_recipe(recipe, lookups, steps, timings)
+        return recipes
+
+    batch_size = batch_size or math.ceil(len(recipes) / (workers * 4))
+    batches = [recipes[k:k + batch_size] for k in range(0, len(recipes), batch_size)]
+
+    shared = None
+    initializer, initargs = init_worker, (lookups,)
+
+    if shared_memory:
+        from okm_shared import shared_lookup_tables, init_shared_worker # okm_shared builds on this module
+
+        shared = shared_lookup_tables(lookups)
+        initializer, initargs = init_shared_worker, (shared.handle,)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+            for batch, (results, batch_timings) in zip(batches, pool.map(model_batch, batches, repeat(steps),
+                                                                         repeat(timings is not None))):
+                for recipe, (data, totals, codes) in zip(batch, results):
+                    recipe.data = data
+                    recipe.totals = totals
+                    recipe.codes = codes
+
+                if timings is not None:
+                    merge_timings(timings, batch_timings)
+
+    finally:
+        if shared is not None:
+            shared.close()
+
+    return recipes
@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - output #
+# Writing the modeled BOM to the output file.
+
+import math
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+
+# Maximum number of rows of an Excel sheet, including the header
+EXCEL_MAX_ROWS = 1048576
+
+
+# ### Output columns ###
+# Column in the model, header in the output file and number format, in the order of the output file.
+
+OUTPUT_COLUMNS = [
+    ('index', 'Index', '0'),
+    ('id_nr', 'Meal ID', None),
+    ('Product Naam', 'Meal Name', None),
+    ('nr', 'Volgnummer', '0'),
+    ('Niveau', 'Level', '0'),
+    ('hf_nr', 'Ingredient ID', None),
+    ('Omschrijving', 'Ingredient Name', None),
+    ('Aantal (Basis)', 'Aantal (Basis) (#)', '0.0000'),
+    ('Basiseenheid', 'Eenheid (€ / KG-Stuk-Liter-Mtr)', None),
+    ('Materiaalkosten', 'Materiaalkosten 1.0 (P BOM + Q BOM) (€)', '#,##0.0000'),
+    ('Categorie', 'Categorie Master', None),
+    ('Nieuwe prijs', 'Ingredientprijs p.e. (Actueel) (€)', '#,##0.0000'),
+    ('Oude prijs', 'Ingredientprijs p.e. (BOM - Berekend) (€)', '#,##0.0000'),
+    ('Nieuwe vvp', 'Materiaalkosten 2.0 (P actueel) (€)', '#,##0.0000'),
+    ('Waste NAV', 'Uitval NAV (%)', '0.00%'),
+    ('Waste FIN', 'Uitval FIN (%)', '0.00%'),
+    ('Waste USE', 'Uitval USE (%)', '0.00%'),
+    ('Aantal (zonder waste)', 'Aantal uitval EXL (#)', '0.0000'),
+    ('Aantal (nieuw)', 'Aantal uitval USE (#)', '0.0000'),
+    ('Materiaalkosten (nieuw)', 'Materiaalkosten 3.0 (P actueel + Q Waste update) (€)', '#,##0.0000'),
+    ('Delta materiaalkosten', 'Materiaalkosten (Delta 3.0 vs 1.0) (€)', '#,##0.0000'),
+    ('Delta Q', 'Materiaalkosten (Q-effect 3.0 vs 1.0) (€)', '#,##0.0000'),
+    ('Delta prijs', 'Materiaalkosten (P-effect 3.0 vs 1.0) (€)', '#,##0.0000'),
+    ('Delta FIN waste', 'FIN Waste Impact Waste Update (Delta 3.0 vs 2.0) (€)', '#,##0.0000'),
+    ('Grammage', 'Gewicht (kg)', '0.0000'),
+    ('Grammage HF (berekend)', 'Gewicht HF (berekend) (kg)', '0.0000'),
+]
+
+
+def cell_value(value):
+    """
+    Convert a value from the model to a value that can be written to an Excel cell: missing values become empty cells
+    """
+    if value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+
+    return value
+
+
+class bom_excel_writer:
+    """ writes the BOM to an Excel file, recipe by recipe, without building a combined copy of the BOM in memory """
+
+    def __init__(self, path : str, sheet_name : str = 'BOM', columns : list = OUTPUT_COLUMNS, max_rows : int = EXCEL_MAX_ROWS) -> None:
+        """ initialise an instance of bom_excel_writer"""
+        self.path = path
+        self.sheet_name = sheet_name
+        self.columns = columns
+        self.source_columns = [column for column, _, _ in columns]
+        self.max_rows = max_rows
+        self.sheet = None
+        self.row = 0
+
+        # in constant memory mode every row is flushed to disk once the next row is started, so the workbook does not hold the
+        # cells; the modeled recipes it is written from are still in memory
+        self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False})
+        self.header_format = self.workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        self.column_formats = [None if num_format is None else self.workbook.add_format({'num_format': num_format})
+                               for _, _, num_format in columns]
+
+    def start_sheet(self, sheet_name : str) -> None:
+        """ start a new BOM sheet, with the header and the column formats """
+        self.sheet = self.workbook.add_worksheet(sheet_name)
+
+        self.sheet.write_blank(0, 0, None, self.header_format) # above the row numbers within the recipe
+        for col, (_, header, _) in enumerate(self.columns, start=1):
+            self.sheet.write_string(0, col, header, self.header_format)
+
+        # number formats are set once per column
+        for col, column_format in enumerate(self.column_formats, start=1):
+            if column_format is not None:
+                self.sheet.set_column(col, col, None, column_format)
+
+        self.row = 1
+
+    def write_recipe(self, recipe) -> None:
+        """ write the rows of a modeled recipe to the current BOM sheet """
+        if self.sheet is None:
+            self.start_sheet(self.sheet_name)
+
+        if self.row + len(recipe.data) > self.max_rows:
+            raise ValueError(f'Recept {recipe} past niet meer op tabblad {self.sheet.name}')
+
+        data = recipe.data.reindex(columns=self.source_columns)
+
+        for row in data.itertuples(index=True, name=None):
+            self.sheet.write_row(self.row, 0, [cell_value(value) for value in row])
+            self.row += 1
+
+    def write_sheet(self, df : pd.DataFrame, sheet_name : str) -> None:
+        """ write a (small) table to a sheet of its own """
+        sheet = self.workbook.add_worksheet(sheet_name)
+
+        for col, header in enumerate(df.columns):
+            sheet.write_string(0, col, str(header), self.header_format)
+
+        for row, values in enumerate(df.itertuples(index=False, name=None), start=1):
+            sheet.write_row(row, 0, [cell_value(value) for value in values])
+
+    def close(self) -> None:
+        """ finish writing the Excel file """
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# ### Sharding ###
+# A BOM that does not fit on one sheet is split over several sheets ('BOM_1', 'BOM_2', ...) or several workbooks, along recipe
+# boundaries. An index sheet tells in which sheet (and workbook) every meal ended up.
+
+def plan_shards(recipes, max_rows=EXCEL_MAX_ROWS):
+    """
+    Split the recipes into shards that each fit on one sheet, without splitting a recipe
+
+    Parameters:
+    - recipes: list of modeled recipes, in output order
+    - max_rows: maximum number of rows of a sheet, including the header
+
+    Returns:
+    - List of shards, each a list of recipes
+    """
+    shards = [[]]
+    rows = 1
+
+    for recipe in recipes:
+        if len(recipe.data) + 1 > max_rows:
+            raise ValueError(f'Recept {recipe} heeft meer regels ({len(recipe.data)}) dan op een tabblad passen')
+
+        if rows + len(recipe.data) > max_rows:
+            shards.append([])
+            rows = 1
+
+        shards[-1].append(recipe)
+        rows += len(recipe.data)
+
+    return shards
+
+
+def shard_index(shards, sheet_names, file_names):
+    """
+    Build the index of which meal is in which shard
+
+    Parameters:
+    - shards: list of shards, as returned by plan_shards
+    - sheet_names: sheet name of every shard
+    - file_names: file name of every shard
+
+    Returns:
+    - DataFrame with one row per meal
+    """
+    index = []
+
+    for shard, sheet_name, file_name in zip(shards, sheet_names, file_names):
+        first_row = 2 # below the header, in Excel row numbers
+
+        for recipe in shard:
+            index.append({'Meal ID': recipe.id, 'Meal Name': recipe.name, 'Bestand': file_name, 'Tabblad': sheet_name,
+                          'Eerste regel': first_row, 'Aantal regels': len(recipe.data)})
+            first_row += len(recipe.data)
+
+    return pd.DataFrame(index, columns=['Meal ID', 'Meal Name', 'Bestand', 'Tabblad', 'Eerste regel', 'Aantal regels'])
+
+
+def write_bom_workbook(path, recipes, sheet_name='BOM'):
+    """
+    Write a shard of the BOM to a workbook of its own (also used as worker function for writing shards in parallel)
+    """
+    with bom_excel_writer(path, sheet_name=sheet_name) as writer:
+        for recipe in recipes:
+            writer.write_recipe(recipe)
+
+    return path
+
+
+def write_bom_excel(path, recipes, extra_sheets=None, max_rows=EXCEL_MAX_ROWS, split_workbooks=False, workers=1):
+    """
+    Write the BOM to Excel, split into shards if it does not fit on one sheet
+
+    Parameters:
+    - path: path of the output file
+    - recipes: list of modeled recipes
+    - extra_sheets: dict of sheet name to DataFrame, written after the BOM
+    - max_rows: maximum number of rows of a sheet, including the header
+    - split_workbooks: write every shard to a workbook of its own ("<output> (1).xlsx", ...) instead of to a sheet of the output
+    - workers: number of processes writing the shard workbooks in parallel (only with split_workbooks)
+
+    Returns:
+    - List of paths written
+    """
+    shards = plan_shards(recipes, max_rows)
+    sharded = len(shards) > 1
+
+    sheet_names = [f'BOM_{n}' for n in range(1, len(shards) + 1)] if sharded else ['BOM']
+
+    if split_workbooks and sharded:
+        stem, extension = os.path.splitext(path)
+        shard_paths = [f'{stem} ({n}){extension}' for n in range(1, len(shards) + 1)]
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(write_bom_workbook, shard_paths, shards, sheet_names))
+        else:
+            for shard_path, shard, sheet_name in zip(shard_paths, shards, sheet_names):
+                write_bom_workbook(shard_path, shard, sheet_name)
+
+    else:
+        shard_paths = [path] * len(shards)
+
+    with bom_excel_writer(path, max_rows=max_rows) as writer:
+        if shard_paths[0] == path:
+            for shard, sheet_name in zip(shards, sheet_names):
+                writer.start_sheet(sheet_name)
+                for recipe in shard:
+                    writer.write_recipe(recipe)
+
+        if sharded:
+            writer.write_sheet(shard_index(shards, sheet_names, [os.path.basename(p) for p in shard_paths]), 'Index')
+
+        for sheet_name, df in (extra_sheets or {}).items():
+            writer.write_sheet(df, sheet_name)
+
+    return [path] + [p for p in shard_paths if p != path]
+
+
+# ### Typed output table ###
+# For Parquet, Feather and SQLite the BOM is built once as a table with typed columns. Text in numeric columns (e.g. 'Kan niet
+# berekenen') can not be stored in a numeric column; it is moved to the 'Opmerkingen' column, with the header of the column it
+# came from ('Uitval NAV (%): Dubbele waste info; ...'), and the numeric cell is left empty. So the typed formats do not hold
+# the same cells as the Excel output; restore_text puts the text back, after which both have the same values.
+
+OUTPUT_FORMATS = ['xlsx', 'parquet', 'feather', 'sqlite']
+
+INTEGER_COLUMNS = ['index', 'nr', 'Niveau']
+
+
+def bom_table(recipes, columns=OUTPUT_COLUMNS, compact=False, float32=False):
+    """
+    Combine the modeled recipes into one table, with the output headers and typed columns
+
+    Parameters:
+    - recipes: list of modeled recipes
+    - columns: output columns, as in OUTPUT_COLUMNS
+    - compact, float32: convert the table to the compact schema, see compact_bom_table
+
+    Returns:
+    - DataFrame with one row per BOM row
+    """
+    source_columns = [column for column, _, _ in columns]
+    table = pd.concat([recipe.data.reindex(columns=source_columns) for recipe in recipes], ignore_index=True)
+    table.columns = [header for _, header, _ in columns]
+
+    notes = pd.Series(pd.NA, index=table.index, dtype='string')
+
+    for source, header, num_format in columns:
+        if source in INTEGER_COLUMNS:
+            table[header] = pd.to_numeric(table[header]).astype('Int64')
+
+        elif num_format is None:
+            table[header] = table[header].astype('string')
+
+        else:
+            if not pd.api.types.is_numeric_dtype(table[header]):
+                is_text = table[header].map(lambda value: isinstance(value, str)).astype(bool)
+                text = (header + ': ' + table[header].where(is_text).astype('string'))
+                notes = notes.mask(notes.notna() & text.notna(), notes + '; ' + text).fillna(text)
+
+            table[header] = pd.to_numeric(table[header], errors='coerce').astype('float64')
+
+    table['Opmerkingen'] = notes
+
+    if compact:
+        table = compact_bom_table(table, columns, float32)
+
+    return table
+
+
+def restore_text(table, columns=OUTPUT_COLUMNS):
+    """
+    Put the text that bom_table moved to the 'Opmerkingen' column back in the columns it came from
+
+    Parameters:
+    - table: typed BOM table, as returned by bom_table or read back from Parquet, Feather or SQLite
+    - columns: output columns the table was built with
+
+    Returns:
+    - DataFrame with the values of the Excel output, without the 'Opmerkingen' column; a numeric column that had text becomes
+      an object column with numbers and text
+    """
+    if 'Opmerkingen' not in table.columns:
+        return table
+
+    notes = table['Opmerkingen'].astype('string').dropna()
+    table = table.drop(columns='Opmerkingen')
+
+    if len(notes) == 0:
+        return table
+
+    # every note is 'header: text', several notes of a row are separated by '; '
+    notes = notes.str.split('; ').explode().str.split(': ', n=1, expand=True)
+    numeric_headers = [header for source, header, num_format in columns if num_format is not None and source not in INTEGER_COLUMNS]
+
+    for header, texts in notes.groupby(0):
+        if header in numeric_headers and header in table.columns:
+            column = table[header].astype(object)
+            column[texts.index] = texts[1].to_numpy(dtype=object)
+            table[header] = column
+
+    return table
+
+
+# ### Compact schema ###
+# The typed table repeats the meal name, item name, unit and category as a full string on every row. In the compact schema text
+# columns are categoricals (every distinct value is stored once, the rows refer to it by a small integer), the integer columns
+# get the smallest integer type their values fit in, and the numeric columns can be stored as float32 (about 7 significant
+# digits) instead of float64.
+
+def smallest_integer_type(column):
+    """ the smallest nullable integer type the values of an integer column fit in """
+    if column.notna().any():
+        low, high = column.min(), column.max()
+
+        for dtype in ['Int8', 'Int16', 'Int32']:
+            info = np.iinfo(dtype.lower())
+            if info.min <= low and high <= info.max:
+                return dtype
+
+    elif len(column) > 0:
+        return 'Int8'
+
+    return 'Int64'
+
+
+def compact_bom_table(table, columns=OUTPUT_COLUMNS, float32=False):
+    """
+    Convert a typed BOM table, as returned by bom_table, to the compact schema
+
+    Parameters:
+    - table: typed BOM table
+    - columns: output columns the table was built with
+    - float32: store the numeric columns as float32 instead of float64
+
+    Returns:
+    - DataFrame with the same columns and values (within float32 precision, with float32)
+    """
+    table = table.copy(deep=False)
+
+    for source, header, num_format in columns:
+        if source in INTEGER_COLUMNS:
+            table[header] = table[header].astype(smallest_integer_type(table[header]))
+
+        elif num_format is None:
+            table[header] = table[header].astype('category')
+
+        elif float32:
+            table[header] = table[header].astype('float32')
+
+    table['Opmerkingen'] = table['Opmerkingen'].astype('category')
+
+    return table
+
+
+def bytes_per_row(table):
+    """ the memory of every column of a table, in bytes per row, including the strings """
+    return table.memory_usage(index=False, deep=True) / max(len(table), 1)
+
+
+def memory_report(before, after):
+    """
+    Compare the memory of two versions of the same table, e.g. the typed and the compact BOM table
+
+    Returns:
+    - DataFrame with the dtype and bytes per row of every column before and after, and a 'Totaal' row
+    """
+    report = pd.DataFrame({'Type voor': before.dtypes.astype(str), 'Bytes per regel voor': bytes_per_row(before),
+                           'Type na': after.dtypes.astype(str), 'Bytes per regel na': bytes_per_row(after)})
+    report.loc['Totaal'] = ['', report['Bytes per regel voor'].sum(), '', report['Bytes per regel na'].sum()]
+    report['Besparing (%)'] = 100 * (1 - report['Bytes per regel na'] / report['Bytes per regel voor'])
+
+    return report.rename_axis('Kolom').reset_index()
+
+
+def write_bom_parquet(path, table):
+    """ write the typed BOM table to a Parquet file """
+    table.to_parquet(path, index=False)
+
+
+def write_bom_feather(path, table):
+    """ write the typed BOM table to a Feather file """
+    table.to_feather(path)
+
+
+def write_bom_sqlite(path, table, extra_tables=None):
+    """
+    Write the typed BOM table to the 'BOM' table of a SQLite database, indexed on Meal ID and Ingredient ID
+
+    Parameters:
+    - path: path of the database, an existing database is replaced
+    - table: typed BOM table, as returned by bom_table
+    - extra_tables: dict of table name to DataFrame, written next to the BOM
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    with sqlite3.connect(path) as con:
+        table.to_sql('BOM', con, index=False, chunksize=50000)
+        con.execute('CREATE INDEX "ix_BOM_Meal_ID" ON "BOM" ("Meal ID")')
+        con.execute('CREATE INDEX "ix_BOM_Ingredient_ID" ON "BOM" ("Ingredient ID")')
+
+        for name, df in (extra_tables or {}).items():
+            df.to_sql(name, con, index=False)
+
+    con.close()
+
+
+def write_bom_outputs(output_name, recipes, output_formats, extra_sheets=None, split_workbooks=False, workers=1, compact=False,
+                      float32=False, table=None):
+    """
+    Write the BOM to every selected output format
+
+    Parameters:
+    - output_name: name of the Excel output file; the other formats get the same name with their own extension
+    - recipes: list of modeled recipes
+    - output_formats: list of formats from OUTPUT_FORMATS
+    - extra_sheets: dict of sheet (table) name to DataFrame, written next to the BOM in Excel and SQLite
+    - split_workbooks, workers: see write_bom_excel
+    - compact, float32: write the other formats in the compact schema, see compact_bom_table
+    - table: the BOM table of the recipes, if it was already built with bom_table
+
+    Returns:
+    - List of paths written
+    """
+    unknown = set(output_formats) - set(OUTPUT_FORMATS)
+    if unknown:
+        raise ValueError(f'Onbekend output formaat: {unknown}. Kies uit: {OUTPUT_FORMATS}')
+
+    stem = os.path.splitext(output_name)[0]
+    paths = []
+
+    if 'xlsx' in output_formats:
+        paths += write_bom_excel(output_name, recipes, extra_sheets, split_workbooks=split_workbooks, workers=workers)
+
+    # the typed table is built once and shared by all other formats
+    if set(output_formats) - {'xlsx'}:
+        if table is None:
+            table = bom_table(recipes, compact=compact, float32=float32)
+
+        if 'parquet' in output_formats:
+            write_bom_parquet(f'{stem}.parquet', table)
+            paths.append(f'{stem}.parquet')
+
+        if 'feather' in output_formats:
+            write_bom_feather(f'{stem}.feather', table)
+            paths.append(f'{stem}.feather')
+
+        if 'sqlite' in output_formats:
+            write_bom_sqlite(f'{stem}.sqlite', table, extra_sheets)
+            paths.append(f'{stem}.sqlite')
+
+    return paths
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - planning #
+# Total ingredient demand and material costs for the planned meal volumes ('VOLUME' in the waste table).
+
+import pandas as pd
+
+
+# Columns of the modeled BOM needed for the planning
+PLANNING_COLUMNS = ['id_nr', 'hf_nr', 'Omschrijving', 'Basiseenheid', 'Categorie', 'Aantal (Basis)', 'Aantal (nieuw)', 'Grammage',
+                    'Materiaalkosten (nieuw)']
+
+
+def meal_volumes(waste_data):
+    """
+    Get the planned volume per meal from the waste table
+
+    The volume is stored on every waste row of a meal; the first filled in value of a meal is used.
+
+    Parameters:
+    - waste_data: waste table, with the 'MEAL CODE' and 'VOLUME' columns
+
+    Returns:
+    - Series of volumes, indexed by meal code
+    """
+    volumes = waste_data[['MEAL CODE', 'VOLUME']].dropna()
+
+    return volumes.groupby('MEAL CODE', sort=False)['VOLUME'].first()
+
+
+def ingredient_demand(BOM_df, waste_data):
+    """
+    Calculate the total demand and material costs per ingredient and per category, for the planned meal volumes
+
+    Only rows that are not an HF are counted, as the costs and quantities of an HF are those of its children. Quantities include
+    the new waste ('Aantal (nieuw)'); the weight in kg is scaled along with it.
+
+    Parameters:
+    - BOM_df: modeled BOM of all recipes, at least the PLANNING_COLUMNS
+    - waste_data: waste table, with the 'MEAL CODE' and 'VOLUME' columns
+
+    Returns:
+    - Tuple of DataFrames with the demand per ingredient, and per category
+    """
+    bom = BOM_df.reset_index(drop=True)
+
+    volume = bom['id_nr'].map(meal_volumes(waste_data)).astype('float64')
+    quantity = pd.to_numeric(bom['Aantal (nieuw)'], errors='coerce')
+    weight = pd.to_numeric(bom['Grammage'], errors='coerce') / bom['Aantal (Basis)'] * quantity
+    costs = pd.to_numeric(bom['Materiaalkosten (nieuw)'], errors='coerce')
+
+    demand = bom[['id_nr', 'hf_nr', 'Omschrijving', 'Basiseenheid', 'Categorie']].assign(**{
+        'Benodigd (#)': quantity * volume,
+        'Benodigd (kg)': weight * volume,
+        'Materiaalkosten totaal (€)': costs * volume})
+
+    demand = demand[demand['Categorie'] != 'Halffabrikaat']
+
+    totals = ['Benodigd (#)', 'Benodigd (kg)', 'Materiaalkosten totaal (€)']
+
+    per_ingredient = (demand.groupby(['hf_nr', 'Categorie'], sort=False)
+                      .agg(**{'Ingredient Name': ('Omschrijving', 'first'),
+                              'Eenheid': ('Basiseenheid', 'first'),
+                              'Aantal maaltijden': ('id_nr', 'nunique'),
+                              **{col: (col, 'sum') for col in totals}})
+                      .reset_index()
+                      .rename(columns={'hf_nr': 'Ingredient ID'}))
+
+    per_category = demand.groupby('Categorie')[['Benodigd (kg)', 'Materiaalkosten totaal (€)']].sum().reset_index()
+
+    return per_ingredient, per_category
+
+
+def meal_summary(recipes):
+    """
+    Collect the totals of every meal, with the material costs per kg
+
+    Parameters:
+    - recipes: list of modeled recipes, with their totals filled in by the HF rollups
+
+    Returns:
+    - DataFrame with one row per meal
+    """
+    summary = pd.DataFrame([{'Meal ID': recipe.id,
+                             'Meal Name': recipe.name,
+                             'Gewicht (kg)': recipe.totals['Grammage'],
+                             'Materiaalkosten 1.0 (P BOM + Q BOM) (€)': recipe.totals['Materiaalkosten'],
+                             'Materiaalkosten 2.0 (P actueel) (€)': recipe.totals['Nieuwe vvp'],
+                             'Materiaalkosten 3.0 (P actueel + Q Waste update) (€)': recipe.totals['Materiaalkosten (nieuw)']}
+                            for recipe in recipes])
+
+    weight = summary['Gewicht (kg)'].where(summary['Gewicht (kg)'] != 0)
+    summary['Materiaalkosten 1.0 per kg (€/kg)'] = summary['Materiaalkosten 1.0 (P BOM + Q BOM) (€)'] / weight
+    summary['Materiaalkosten 3.0 per kg (€/kg)'] = summary['Materiaalkosten 3.0 (P actueel + Q Waste update) (€)'] / weight
+
+    return summary
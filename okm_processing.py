@@ -2,42 +2,52 @@
 # coding: utf-8
 
 # # OKM Model #
+# The pipeline is a chain of stage functions; run_pipeline runs them for one configuration and returns the result tables.
+# Nothing runs on import, so runs can be driven from another script (or several runs from one interpreter):
+#
+#     from okm_processing import run_pipeline
+#     result = run_pipeline({'price_period': 'PRICE Q3', 'output_name': 'Output v7 - Q3.xlsx'})
+#     result.bom.head()
+#
+# From the command line, the parameters are read from a TOML or JSON file, with a list of jobs (e.g. several quarters or several
+# BOM downloads) that run one after the other in the same process, sharing the input files they have in common:
+#
+#     python okm_processing.py okm_jobs.toml
+#
+# With --watch the jobs run again whenever their input files in a folder change (see okm_watch); with --serve the first job is
+# modeled and kept in memory to answer cost queries over HTTP (see okm_server).
 
 # ## Set-up ##
 
 # ### Imports ###
 
-# In[240]:
+import argparse
+import copy
+import json
+import multiprocessing
+import os
 
+try:
+    import tomllib # Python 3.11+
+except ImportError:
+    tomllib = None
 
 import pandas as pd
 import numpy as np
 
-
-# ### Objects ###
-
-# In[241]:
-
-
-class recipe:
-    """ a recipe """
-
-    def __init__(self, name : str, id : str, data : pd.DataFrame) -> None:
-        """ initialise an instance of recipe"""
-        self.name = name
-        self.id = id
-        self.data = data
-
-    def __str__(self) -> str:
-        """ set the string representation of a recipe """
-        return f'{self.id} {self.name}'
+from okm_model import lookup_tables, model_recipes, invalidated_steps
+from okm_bom import read_bom, split_recipes
+from okm_state import file_hash, load_run_state, save_run_state, changed_inputs, diff_price_tables
+from okm_state import input_signatures, recipe_result_key, reuse_recipe_result
+from okm_planning import PLANNING_COLUMNS, meal_volumes, ingredient_demand, meal_summary
+from okm_output import write_bom_outputs, bom_table, compact_bom_table
+from okm_history import append_run
+from okm_cache import cache_key, stage_cache
+from okm_profile import run_report, stage, active_report, print_summary
 
 
 # ### Functions ###
 
-# In[ ]:
-
-
 def rename_nan_columns(df, prefix="col"):
     """
     Rename DataFrame columns whose header could not be inferred, and have 'NaN' as header
@@ -85,133 +95,190 @@ def clean_dataframe(df, replace_empty_with_na=True):
     return df
 
 
-# ## Data preparation ##
-
-# ### Input parameters ###
-
-# In[242]:
-
-
-bom_name = "250416 Recepten download NAV 16-4.xlsx"
-bom_sheet_name = "Budget"
-price_weight_name = "Input Price List + Grammage.xlsx"
-price_weight_sheet_name = "PriceList"
-waste_name = "Input Waste Table.xlsx"
-waste_sheet_name = 'WASTE'
-
-
-# ### Data loading & initial validation ###
-
-# #### BOM ####
-# 
-
-# In[243]:
+# ## Input parameters ##
+# Every run is configured with a dict of these parameters; parameters that are left out get the value below.
+
+DEFAULT_CONFIG = {
+    'bom_name': "250416 Recepten download NAV 16-4.xlsx",
+    'bom_sheet_name': "Budget",
+    'price_weight_name': "Input Price List + Grammage.xlsx",
+    'price_weight_sheet_name': "PriceList",
+    'waste_name': "Input Waste Table.xlsx",
+    'waste_sheet_name': 'WASTE',
+    'price_period': 'PRICE Q2',
+    'output_name': "Output v7 - Q2.xlsx",
+    'output_formats': ['xlsx'], # any of 'xlsx', 'parquet', 'feather' (both need pyarrow) and 'sqlite'
+    'output_split_workbooks': False, # when the BOM does not fit on one sheet: split it over several workbooks instead of several sheets
+    'output_workers': 1, # number of processes writing split workbooks in parallel
+    'output_compact': True, # write Parquet, Feather & SQLite with categorical text and small integer columns (see okm_output.compact_bom_table)
+    'output_float32': False, # with output_compact: store the numeric columns as float32 instead of float64
+    'model_workers': 1, # number of processes modeling the recipes in parallel
+    'model_shared_memory': False, # with model_workers > 1: share the lookup tables with the processes, instead of a copy per process
+    'history_dir': None, # directory of the run history (e.g. 'OKM historie'), None to not keep a history
+    'history_period': None, # period the run is filed under in the history, None for the period of price_period ('PRICE Q3' -> 'Q3')
+    'state_dir': '.okm_state',
+    'cache_dir': '.okm_cache', # directory of the stage cache (see okm_cache), None to not cache the stages
+    'run_report': True, # time every stage and write a JSON run report next to the output (see okm_profile)
+    'run_report_trace_memory': False, # with run_report: also record the peak memory allocated by Python (tracemalloc, slower)
+}
+
+
+def run_config(config=None):
+    """
+    Complete a run configuration with the default parameters
 
+    Parameters:
+    - config: dict with (some of) the parameters in DEFAULT_CONFIG
 
-bom_data_raw = pd.read_excel(bom_name, sheet_name=bom_sheet_name, skiprows=1, header=None, decimal=",")
+    Returns:
+    - Dict with all parameters
+    """
+    config = dict(config or {})
 
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f'Onbekende parameter(s): {sorted(unknown)}. Kies uit: {list(DEFAULT_CONFIG)}')
 
-# In[244]:
+    return {**DEFAULT_CONFIG, **config}
 
 
-print(f'BOM ingelezen: {bom_name} || Tabblad: {bom_sheet_name}')
+class input_cache:
+    """
+    the parsed input files of a run, for the next runs in the same process that read the same files
 
+    Only the latest version of every file is kept: when a file is modified, the hash and the parsed table of its previous
+    contents are dropped, so a long-running process (okm_watch) does not keep every version it ever read.
+    """
 
-# #### Prices & weights ####
+    def __init__(self) -> None:
+        """ initialise an instance of input_cache"""
+        self.hashes = {} # path -> (modification time, size, hash)
+        self.tables = {} # stage key -> parsed table
+        self.latest = {} # (reader, path, sheet) -> stage key of the latest contents read
 
-# In[ ]:
+    def file_hash(self, path : str) -> str:
+        """ the hash of a file, only computed again if the file was modified """
+        stat = os.stat(path)
+        path = os.path.abspath(path)
 
+        if self.hashes.get(path, (None, None, None))[:2] != (stat.st_mtime_ns, stat.st_size):
+            self.hashes[path] = (stat.st_mtime_ns, stat.st_size, file_hash(path))
 
-price_weight_data_raw = pd.read_excel(price_weight_name, sheet_name=price_weight_sheet_name, header=None)
+        return self.hashes[path][2]
 
-# Drop leading empty rows
-price_weight_data_trimmed = price_weight_data_raw.loc[~price_weight_data_raw.isnull().all(axis=1)].reset_index(drop=True)
+    def key(self, reader, path : str, sheet_name : str) -> str:
+        """ the stage key of reading an input file with a reader function """
+        return cache_key(reader.__name__, self.file_hash(path), sheet_name)
 
-# Promote the first non-empty row to header
-header = price_weight_data_trimmed.iloc[0]
-price_weight_data = price_weight_data_trimmed[1:]
-price_weight_data.columns = header
-price_weight_data = price_weight_data.reset_index(drop=True)
+    def read(self, reader, path : str, sheet_name : str, cache : stage_cache = None):
+        """
+        Read an input file with a reader function, or take it from the cache if the same contents were read before
 
-# Rename any columns named: "NaN"
-price_weight_data = rename_nan_columns(price_weight_data)
+        The result is shared between runs and must not be modified; see run_pipeline.
 
-# Clean DataFrame values
-price_weight_data = clean_dataframe(price_weight_data).astype({"INGREDIENT CODE": 'string', "INGREDIENTS": 'string'}) # fix incorrect type inferences
+        Parameters:
+        - reader: function reading the file, with the path and sheet name as arguments
+        - path, sheet_name: file to read
+        - cache: stage cache on disk to look in after this cache, the reader's name is the stage
+        """
+        key = self.key(reader, path, sheet_name)
 
+        if key not in self.tables:
+            compute = lambda: reader(path, sheet_name)
+            self.tables[key] = compute() if cache is None else cache.get(reader.__name__, key, compute)
 
-# In[222]:
+        # the table of the previous contents of the file is dropped, unless another file has the same contents
+        slot = (reader.__name__, os.path.abspath(path), sheet_name)
+        previous = self.latest.get(slot)
+        self.latest[slot] = key
 
+        if previous is not None and previous != key and previous not in self.latest.values():
+            del self.tables[previous]
 
-print(f'Prijs en gewicht lijst ingelezen: {price_weight_name} || Tabblad: {price_weight_sheet_name}')
+        return self.tables[key]
 
 
-# #### Waste ####
+# ## Data preparation ##
 
-# In[ ]:
+# ### Data loading & initial validation ###
+# The BOM is read and split into recipes by okm_bom. The price & weight list and the waste table are sheets with some empty rows
+# above the header.
 
+def read_input_sheet(name, sheet_name):
+    """
+    Read an input sheet whose header is the first non-empty row
 
-waste_data_raw = pd.read_excel(waste_name, sheet_name=waste_sheet_name, header=None)
+    Parameters:
+    - name: path of the Excel file
+    - sheet_name: sheet to read
 
-# Drop leading empty rows
-waste_data_trimmed = waste_data_raw.loc[~waste_data_raw.isnull().all(axis=1)].reset_index(drop=True)
+    Returns:
+    - Cleaned DataFrame, with pandas' best-guess column types
+    """
+    with stage('load') as record:
+        data_raw = pd.read_excel(name, sheet_name=sheet_name, header=None)
+        record['rows'] = len(data_raw)
 
-# Promote the first non-empty row to header
-header = waste_data_trimmed.iloc[0]
-waste_data = waste_data_trimmed[1:]
-waste_data.columns = header
-df = waste_data.reset_index(drop=True)
+    with stage('clean') as record:
+        data = clean_input_sheet(data_raw)
+        record['rows'] = len(data)
 
-# Rename any columns named: "NaN"
-waste_data = rename_nan_columns(waste_data)
+    return data
 
-# Clean DataFrame values
-waste_data = clean_dataframe(waste_data).astype({'MEAL CODE': 'string', 'INGREDIENT CODE': 'string', 'UNITS': 'string', 'VOLUME': 'float64'}) # fix incorrect type inferences
 
+def clean_input_sheet(data_raw):
+    """ promote the first non-empty row of a sheet read without header to header, and clean the values """
+    # Drop leading empty rows
+    data_trimmed = data_raw.loc[~data_raw.isnull().all(axis=1)].reset_index(drop=True)
 
-# ##### Add unique id column #####
+    # Promote the first non-empty row to header
+    header = data_trimmed.iloc[0]
+    data = data_trimmed[1:]
+    data.columns = header
+    data = data.reset_index(drop=True)
 
-# In[346]:
+    # Rename any columns named: "NaN"
+    data = rename_nan_columns(data)
 
+    # Clean DataFrame values
+    return clean_dataframe(data)
 
-waste_data['id'] = waste_data[['MEAL CODE', 'INGREDIENT CODE']].agg('_'.join, axis=1).astype('string')
 
+def read_price_weight_data(price_weight_name, price_weight_sheet_name):
+    """ read the price & weight list """
+    price_weight_data = read_input_sheet(price_weight_name, price_weight_sheet_name)
+    price_weight_data = price_weight_data.astype({"INGREDIENT CODE": 'string', "INGREDIENTS": 'string'}) # fix incorrect type inferences
 
-# In[293]:
+    print(f'Prijs en gewicht lijst ingelezen: {price_weight_name} || Tabblad: {price_weight_sheet_name}')
 
+    return price_weight_data
 
-print(f'Waste lijst ingelezen: {waste_name} || Tabblad: {waste_sheet_name}')
 
+def read_waste_data(waste_name, waste_sheet_name):
+    """ read the waste table, and add the unique 'id' column (MEAL CODE_INGREDIENT CODE) """
+    waste_data = read_input_sheet(waste_name, waste_sheet_name)
+    waste_data = waste_data.astype({'MEAL CODE': 'string', 'INGREDIENT CODE': 'string', 'UNITS': 'string', 'VOLUME': 'float64'}) # fix incorrect type inferences
 
-# ### Data cleaning ###
+    waste_data['id'] = (waste_data['MEAL CODE'] + '_' + waste_data['INGREDIENT CODE']).astype('string')
 
-# #### BOM ####
+    print(f'Waste lijst ingelezen: {waste_name} || Tabblad: {waste_sheet_name}')
 
-# ##### Split data into recipes #####
+    return waste_data
 
-# In[192]:
 
+def read_recipes(bom_name, bom_sheet_name):
+    """ read the BOM and split it into recipes; the recipe markers ('Omschrijving' & 'Kostenaandeel voor dit artikel') are found in okm_bom """
+    with stage('load') as record:
+        bom_data_raw = read_bom(bom_name, bom_sheet_name)
+        record['rows'] = len(bom_data_raw)
 
-recipes = []
+    print(f'BOM ingelezen: {bom_name} || Tabblad: {bom_sheet_name}')
 
-for i in range(len(bom_data_raw)):
-    # a new recipe starts
-    if bom_data_raw[4][i] == 'Omschrijving':
-        start_idx = i + 1
-        recipe_name = bom_data_raw[4][i + 1]
-        recipe_id = bom_data_raw[3][i + 1]
+    with stage('segment') as record:
+        recipes = split_recipes(bom_data_raw)
+        record['rows'] = sum(len(recipe.data) for recipe in recipes)
 
-        # the recipe ends
-        for j in range(i, len(bom_data_raw)):
-            if bom_data_raw[3][j] == 'Kostenaandeel voor dit artikel':
-                end_idx = j
-                recipe_data = bom_data_raw.iloc[(i + 2):j].drop(range(8, 13), axis='columns').reset_index()
-                recipe_data = recipe_data.rename(columns={0: "id_nr", 1: "nr", 2: "Niveau", 3: "hf_nr", 4: "Omschrijving", 5: "Aantal (Basis)", 6: "Basiseenheid", 7: "Materiaalkosten"})
-                recipe_data = recipe_data.astype({"id_nr": str, "nr": int, "Niveau": int, "hf_nr": str, "Omschrijving": str, "Aantal (Basis)": float, "Basiseenheid": str, "Materiaalkosten": float})
-                recipe_data.insert(loc=2, column="Product Naam", value=[recipe_name for i in range(len(recipe_data))])
-                recipes.append(recipe(name=recipe_name, id=recipe_id, data=recipe_data))
-                i += j
-                break
+    return recipes
 
 
 # ### Product master creation ###
@@ -220,473 +287,483 @@ for i in range(len(bom_data_raw)):
 # - If an item has a child --> **HF**, else
 # - Item --> **ingredient**
 
-# In[193]:
-
-
-product_master_dict = {}
-
-for recipe in recipes:
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
-
-        if not item_id in product_master_dict.keys():
-            if item_id.startswith('3'):
-                classification = 'Verpakking'
-            elif not i + 1 == len(recipe.data):
-                if recipe.data['Niveau'][i + 1] > recipe.data['Niveau'][i]:
-                    classification = 'Halffabrikaat'
-                else:
-                    classification = 'Ingredient'
-            else:
-                classification = 'Ingredient'
-        
-            product_master_dict[item_id] = [item_id, classification]
-
-product_master = pd.DataFrame.from_dict(product_master_dict, orient='index', columns=['Nummer', 'Categorie']).reset_index(drop=True)
-
+def build_product_master(recipes):
+    """
+    Classify every item in the BOM
 
-# ##### Split product data by categorie #####
-# Store the ids ('hf_nr') in NumPy arrays for easy and fast checking against later.
+    Returns:
+    - DataFrame with the 'Nummer' and 'Categorie' of every item, in order of first appearance
+    """
+    item_ids, has_child = [], []
 
-# In[195]:
+    for recipe in recipes:
+        levels = recipe.data['Niveau'].to_numpy()
+        child = np.zeros(len(levels), dtype=bool)
+        child[:-1] = levels[1:] > levels[:-1] # the next row is one level deeper
 
+        item_ids.append(recipe.data['hf_nr'].to_numpy(dtype=object))
+        has_child.append(child)
 
-product_data_ingredient = np.array(product_master[product_master['Categorie'] == 'Ingredient']['Nummer'])
-product_data_packaging = np.array(product_master[product_master['Categorie'] == 'Verpakking']['Nummer'])
-product_data_HF = np.array(product_master[product_master['Categorie'] == 'Halffabrikaat']['Nummer'])
+    if not recipes:
+        return pd.DataFrame({'Nummer': [], 'Categorie': []})
 
+    # every item is classified where it first appears
+    first = ~pd.Series(np.concatenate(item_ids), dtype=object).duplicated().to_numpy()
+    item_ids, has_child = np.concatenate(item_ids)[first], np.concatenate(has_child)[first]
 
-# ## Data validation ##
-# Validating the correctness of the input data.
+    packaging = np.array([item_id.startswith('3') for item_id in item_ids], dtype=bool)
+    categories = np.select([packaging, has_child], ['Verpakking', 'Halffabrikaat'], 'Ingredient')
 
-# ### Checking if all items classified as ingredients have a new price ###
+    return pd.DataFrame({'Nummer': item_ids, 'Categorie': categories})
 
-# In[ ]:
 
+def split_product_data(product_master):
+    """
+    Split the product master by categorie, into NumPy arrays of ids ('hf_nr') for easy and fast checking against later
 
-for recipe in recipes:
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
+    Returns:
+    - Tuple of the ingredient, packaging and HF ids
+    """
+    product_data_ingredient = np.array(product_master[product_master['Categorie'] == 'Ingredient']['Nummer'])
+    product_data_packaging = np.array(product_master[product_master['Categorie'] == 'Verpakking']['Nummer'])
+    product_data_HF = np.array(product_master[product_master['Categorie'] == 'Halffabrikaat']['Nummer'])
 
-        
+    return product_data_ingredient, product_data_packaging, product_data_HF
 
 
 # ## Modeling ##
+# The modeling steps (categories, prices, weights, waste, quantities, costs, HF costs & deltas) are defined in okm_model.
+# Recipes whose BOM rows, item categories, prices and waste rows are the same as in the previous run are reused from that run.
+# If only the price list changed, the parsed and modeled recipes of the previous run are reused, and only the price dependent
+# steps are re-run for the recipes with a changed ingredient price.
+# With model_workers > 1 the recipes to model are split over that many processes (see okm_model.model_recipes).
 
-# ### Add categories ###
-
-# In[196]:
-
-
-for recipe in recipes:
-    categories = []
-
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
-
-        if item_id in product_data_ingredient:
-            categories.append('Ingredient')
-
-        elif item_id in product_data_HF:
-            categories.append('Halffabrikaat')
-
-        elif item_id in product_data_packaging:
-            categories.append('Verpakking')
-        
-        else:
-            categories.append('Ongeclassificeerd')
-    
-    recipe.data['Categorie'] = categories
-
-
-# ### New prices ###
-# From price list for ingredients & gas; 0 for packaging; and empty for HFs.
-
-# In[197]:
-
-
-for recipe in recipes:
-    new_prices = []
-
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
-
-        if item_id in product_data_ingredient: # ingredients
-            subset_price_df = price_weight_data[price_weight_data['INGREDIENT CODE'] == item_id]
-            new_price = subset_price_df['PRICE Q2'].iloc[0]
-        
-        elif item_id in product_data_packaging: # packaging
-            new_price = 0
-
-        elif item_id in product_data_HF: # HFs
-            new_price = None
-        
-        else: # unclassified
-            new_price = 'Geen nieuwe prijs'
-    
-        new_prices.append(new_price)
-        
-    recipe.data['Nieuwe prijs'] = new_prices
-
-
-# ### Old prices ###
-# Old costs / old quantity for ingredients & gas; 0 for packaging; and empty for HFs.
-
-# In[198]:
-
-
-for recipe in recipes:
-    old_prices = []
-
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
-
-        if item_id in product_data_ingredient: # ingredients
-            old_price = recipe.data['Materiaalkosten'][i] / recipe.data['Aantal (Basis)'][i]
-        
-        elif item_id in product_data_packaging: # packaging
-            old_price = 0
-
-        elif item_id in product_data_HF: # HFs
-            old_price = None
-
-        else: # unclassified
-            old_price = recipe.data['Materiaalkosten'][i] / recipe.data['Aantal (Basis)'][i]
-    
-        old_prices.append(old_price)
-        
-    recipe.data['Oude prijs'] = old_prices
-
-
-# ### Weight in kg ###
-# Convert items not in kg. Items already in kg stay the same. Packaging goes to 0, regardless of the unit.
+def model_stage(recipes, lookups, signatures, previous_state, changed_codes=None, steps=None, workers=1, shared_memory=False):
+    """
+    Model the recipes whose result can not be taken over from the previous run
 
-# In[199]:
+    Parameters:
+    - recipes: list of parsed (or, in a price only run, previously modeled) recipes
+    - lookups: lookup_tables of this run
+    - signatures: as returned by okm_state.input_signatures
+    - previous_state: state of the previous run, as returned by okm_state.load_run_state, or None
+    - changed_codes: in a price only run, the codes whose price or weight changed; only recipes with such an item are re-run
+    - steps: in a price only run, the modeling steps to re-run
+    - workers, shared_memory: see okm_model.model_recipes
+    """
+    to_model = []
+    timings = {} if active_report() is not None else None
 
+    if changed_codes is not None:
+        for recipe in recipes:
+            recipe.result_key = recipe_result_key(recipe, signatures)
 
-for recipe in recipes:
-    weights = []
+            if recipe.data['hf_nr'].isin(changed_codes).any():
+                to_model.append(recipe)
 
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
+        model_recipes(to_model, lookups, steps, workers=workers, shared_memory=shared_memory, timings=timings)
 
-        if item_id in product_data_packaging: # packaging to 0
-            weight = 0.0
+        print(f'Prijs gewijzigd voor {len(changed_codes)} item(s)')
 
-        elif not recipe.data['Basiseenheid'][i] == 'KG':
+    else:
+        previous_recipes = {} if previous_state is None else {r.result_key: r for r in previous_state['recipes']}
 
-            subset_weight_data = price_weight_data[price_weight_data['INGREDIENT CODE'] == item_id]
+        for recipe in recipes:
+            recipe.result_key = recipe_result_key(recipe, signatures)
 
-            if len(subset_weight_data) == 0: # no info about this item
-                weight = 'Geen conversie info'
-            
-            elif len(subset_weight_data) == 1: # new info about this item
-                weight = subset_weight_data['KG'].iloc[0] * recipe.data['Aantal (Basis)'][i]
+            if not reuse_recipe_result(recipe, previous_recipes):
+                to_model.append(recipe)
 
-            else:
-                weight = 'Dubbele conversie info'
-        
-        else:
-            weight = recipe.data['Aantal (Basis)'][i]
+        model_recipes(to_model, lookups, workers=workers, shared_memory=shared_memory, timings=timings)
 
-        weights.append(weight)
+        reused = len(recipes) - len(to_model)
+        print(f'{reused} van {len(recipes)} recepten ongewijzigd sinds de vorige run')
 
-    recipe.data['Grammage'] = weights
+    # the steps are timed per recipe, and reported summed over all recipes
+    for step, (wall, cpu, calls, rows) in (timings or {}).items():
+        active_report().add(step, wall, cpu, rows, calls)
 
 
-# ### Waste ###
-# For items at level 1: find the waste in the waste data. For all other items, find the parent item at level 1, and take the waste from there.
+# ## Planning ##
+# Total demand and material costs per ingredient and per category, for the planned volume of every meal ('VOLUME' in the waste table).
 
-# In[200]:
+def planning_stage(recipes, waste_data):
+    """
+    Returns:
+    - Tuple of the demand per ingredient, the demand per category and the summary per meal
+    """
+    # the rows are matched to the volume of their meal on the recipe id, as the waste rows are (see okm_model.add_waste); the
+    # 'id_nr' column of the download can be read as a number ('5000000.0')
+    planning_df = pd.concat([recipe.data[PLANNING_COLUMNS].assign(id_nr=str(recipe.id)) for recipe in recipes])
 
+    demand_ingredient, demand_category = ingredient_demand(planning_df, waste_data)
+    meals = meal_summary(recipes)
 
-for recipe in recipes:
-    waste_nav_col = []
-    waste_fin_col = []
-    waste_use_col = []
+    print(f'Inkoopvolumes berekend voor {planning_df["id_nr"].isin(meal_volumes(waste_data).index).sum()} BOM regels met een volume')
 
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
+    return demand_ingredient, demand_category, meals
 
-        if recipe.data['Niveau'][i] == 1: # waste is only determined at level 1
-            subset_waste_data = waste_data[waste_data['id'] == f'{recipe.id}_{item_id}']
 
-            if len(subset_waste_data) == 0:
-                # waste_nav = 'Geen waste info'
-                # waste_fin = 'Geen waste info'
-                # waste_use = 'Geen waste info'
+# ## Pipeline ##
 
-                waste_nav = 0
-                waste_fin = 0
-                waste_use = 0
+def model_pipeline(config, inputs, run_inputs, price_weight_data, waste_data, cache=None, model_key=None):
+    """
+    Parse and model the recipes, reusing what can be reused from the previous run (see okm_state)
 
-            elif len(subset_waste_data) == 1:
-                waste_nav = subset_waste_data['WASTE-NAV'].iloc[0]
-                waste_fin = subset_waste_data['WASTE-FIN'].iloc[0]
-                waste_use = subset_waste_data['WASTE-USE'].iloc[0]
+    Parameters:
+    - config: complete run configuration
+    - inputs: input_cache of the run
+    - run_inputs: dict of input names to their hashes / parameter values, to compare with the previous run
+    - price_weight_data, waste_data: the lookup tables of the run
+    - cache: stage cache the parsed BOM is looked up in, and the modeled recipes are saved in
+    - model_key: key of the modeled recipes in the stage cache
 
-            else:
-                waste_nav = 'Dubbele waste info'
-                waste_fin = 'Dubbele waste info'
-                waste_use = 'Dubbele waste info'
-        
+    Returns:
+    - List of modeled recipes
+    """
+    # ### Incremental run check ###
+    # Compare the inputs with those of the previous run.
+    with stage('load_state'):
+        previous_state = load_run_state(config['state_dir'])
+    changed = changed_inputs(previous_state, run_inputs)
+    price_only_run = previous_state is not None and changed == {'price_weight_file'}
+
+    if price_only_run:
+        print('Alleen de prijslijst is gewijzigd: vorige run wordt hergebruikt')
+        recipes = previous_state['recipes']
+    else:
+        # the recipes get the modeled columns added, so every run models its own copy of the parsed recipes
+        with stage('bom') as record:
+            recipes = copy.deepcopy(inputs.read(read_recipes, config['bom_name'], config['bom_sheet_name'], cache))
+            record['rows'] = sum(len(recipe.data) for recipe in recipes)
+
+    with stage('classify') as record:
+        product_master = build_product_master(recipes)
+        record['rows'] = len(product_master)
+
+    with stage('index'):
+        lookups = lookup_tables(*split_product_data(product_master), price_weight_data, waste_data, config['price_period'])
+        signatures = input_signatures(product_master, price_weight_data, waste_data, config['price_period'])
+
+    with stage('model') as record:
+        if price_only_run:
+            changed_codes = diff_price_tables(previous_state['price_weight_data'], price_weight_data, config['price_period'])
+            model_stage(recipes, lookups, signatures, previous_state, changed_codes, invalidated_steps(changed),
+                        workers=config['model_workers'], shared_memory=config['model_shared_memory'])
         else:
-            for j in range(i, -1, -1): # loop backwards to find the closest level 1 item
-                if recipe.data['Niveau'].iloc[j] == 1:
-
-                    if recipe.data['hf_nr'].iloc[j] in product_data_HF:
-                        parent_hf_id = recipe.data["hf_nr"].iloc[j]
-                        subset_waste_data_parent = waste_data[waste_data['id'] == f'{recipe.id}_{parent_hf_id}']
-
-                        if len(subset_waste_data_parent) == 0:
-                            # waste_nav = 'Geen waste info'
-                            # waste_fin = 'Geen waste info'
-                            # waste_use = 'Geen waste info'
-
-                            waste_nav = 0
-                            waste_fin = 0
-                            waste_use = 0
+            model_stage(recipes, lookups, signatures, previous_state,
+                        workers=config['model_workers'], shared_memory=config['model_shared_memory'])
+        record['rows'] = sum(len(recipe.data) for recipe in recipes)
 
-                        elif len(subset_waste_data_parent) == 1:
-                            waste_nav = subset_waste_data_parent['WASTE-NAV'].iloc[0]
-                            waste_fin = subset_waste_data_parent['WASTE-FIN'].iloc[0]
-                            waste_use = subset_waste_data_parent['WASTE-USE'].iloc[0]
+    # ### Save run state ###
+    # With a stage cache, the modeled recipes are saved in it and the run state refers to them.
+    with stage('save_state'):
+        save_run_state(config['state_dir'], run_inputs, recipes, price_weight_data, cache, model_key)
 
-                        else:
-                            waste_nav = 'Dubbele waste info'
-                            waste_fin = 'Dubbele waste info'
-                            waste_use = 'Dubbele waste info'
+    return recipes
 
-                    else:
-                        waste_nav = 'Geen bijbehorend HF'
-                        waste_fin = 'Geen bijbehorend HF'
-                        waste_use = 'Geen bijbehorend HF'
-                    
-                    break
 
-        waste_nav_col.append(waste_nav)
-        waste_fin_col.append(waste_fin)
-        waste_use_col.append(waste_use)
+class pipeline_result:
+    """ the result tables of a run """
 
-    recipe.data['Waste NAV'] = waste_nav_col
-    recipe.data['Waste FIN'] = waste_fin_col
-    recipe.data['Waste USE'] = waste_use_col
+    def __init__(self, config : dict, recipes : list, bom : pd.DataFrame, meals : pd.DataFrame, demand_ingredient : pd.DataFrame,
+                 demand_category : pd.DataFrame, output_files : list) -> None:
+        """ initialise an instance of pipeline_result"""
+        self.config = config
+        self.recipes = recipes
+        self._bom = bom
+        self.meals = meals
+        self.demand_ingredient = demand_ingredient
+        self.demand_category = demand_category
+        self.output_files = output_files
+        self.report = None
 
+    @property
+    def bom(self) -> pd.DataFrame:
+        """ the typed BOM table (okm_output.bom_table); built on first use if the run did not need it for its outputs """
+        if self._bom is None:
+            self._bom = bom_table(self.recipes)
 
-# ### Quantities ###
-# Calculate the quantities based on the known waste data.
+        return self._bom
 
-# In[201]:
+    def bom_rows(self) -> int:
+        """ the number of BOM rows, without building the BOM table """
+        return sum(len(recipe.data) for recipe in self.recipes)
 
+    def __str__(self) -> str:
+        """ set the string representation of a pipeline_result """
+        return f'{len(self.recipes)} recepten, {self.bom_rows()} BOM regels: {", ".join(self.output_files)}'
 
-for recipe in recipes:
-    q_no_waste_col = []
-    q_new_col = []
-
-    for i in range(len(recipe.data)):
-        
-        try:
-            q_no_waste = recipe.data['Aantal (Basis)'][i] / (1 + recipe.data['Waste NAV'][i])
-        except TypeError:
-            q_no_waste = 'Kan niet berekenen'
-
-        try:
-            q_new = q_no_waste * (1 + recipe.data['Waste USE'][i])
-        except TypeError:
-            q_new = 'Kan niet berekenen'
-
-        q_no_waste_col.append(q_no_waste)
-        q_new_col.append(q_new)
-
-    recipe.data['Aantal (zonder waste)'] = q_no_waste_col
-    recipe.data['Aantal (nieuw)'] = q_new_col
-
-
-# ### Costs ###
-# Several costs are calculated: 
-# - new p * old q ("vvp")
-# - new p * new q ("materiaalkosten")
-# 
-# Costs are first calculated for the non-HF items, based on row-level info. Afterwards the HF item costs are calculated and inserted based on hierarchical info.
-
-# #### Non-HF costs ####
 
-# In[202]:
+def run_pipeline(config=None, inputs=None):
+    """
+    Run the OKM model: read the inputs, model the recipes, and write the outputs
 
+    Parameters:
+    - config: dict of parameters, see DEFAULT_CONFIG; parameters that are left out get their default value
+    - inputs: input_cache shared with other runs, so input files they read already are not parsed again
 
-for recipe in recipes:
-    newp_oldq_col = []
-    newp_newq_col = []
+    Returns:
+    - pipeline_result, with the modeled recipes, the typed BOM table (okm_output.bom_table; built when it is first used if no
+      output needed it), the planning tables, the paths of the output files and the run report (None if not made)
+    """
+    config = run_config(config)
+    inputs = input_cache() if inputs is None else inputs
 
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
+    if not config['run_report']:
+        return run_stages(config, inputs)
 
-        if (item_id in product_data_ingredient) or (item_id in product_data_packaging):
-            try:
-                newp_oldq = recipe.data['Nieuwe prijs'][i] * recipe.data['Aantal (Basis)'][i]
-                newp_newq = recipe.data['Nieuwe prijs'][i] * recipe.data['Aantal (nieuw)'][i]
-            
-            except TypeError: # could use the old price here as well
-                newp_oldq = 'Kan niet berekenen'
-                newp_newq = 'Kan niet berekenen'
-        
-        elif item_id in product_data_HF:
-            newp_oldq = None
-            newp_newq = None
-        
-        else:
-            newp_oldq = 'Ongeclassificeerd item'
-            newp_newq = 'Ongeclassificeerd item'
+    # ### Run report ###
+    # Every stage is timed (see okm_profile); the summary is printed and the report is written next to the output.
+    with run_report(trace_memory=config['run_report_trace_memory']) as report:
+        result = run_stages(config, inputs)
 
-        newp_oldq_col.append(newp_oldq)
-        newp_newq_col.append(newp_newq)
+    report.info.update({'config': config, 'recipes': len(result.recipes), 'bom_rows': result.bom_rows()})
 
-    recipe.data['Nieuwe vvp'] = newp_oldq_col
-    recipe.data['Materiaalkosten (nieuw)'] = newp_newq_col
+    report_path = os.path.splitext(config['output_name'])[0] + ' - run report.json'
+    report.write(report_path)
+    result.output_files.append(report_path)
+    result.report = report
 
+    print_summary(report)
 
-# #### HF costs ####
-# For an HF the costs are determined based on the costs of the individual ingredients which make up the HF.
+    return result
 
-# In[203]:
 
+def stage_keys(config, inputs):
+    """
+    The keys of the stages of a run in the stage cache (see okm_cache)
 
-for recipe in recipes:
-    for i in range(len(recipe.data)):
-        item_id = recipe.data['hf_nr'][i]
+    Parameters:
+    - config: complete run configuration
+    - inputs: input_cache of the run
 
-        if item_id in product_data_HF:
+    Returns:
+    - Dict of stage name to key: the three input readers and 'model_recipes'
+    """
+    keys = {reader.__name__: inputs.key(reader, config[name], config[sheet_name])
+            for reader, name, sheet_name in [(read_recipes, 'bom_name', 'bom_sheet_name'),
+                                             (read_price_weight_data, 'price_weight_name', 'price_weight_sheet_name'),
+                                             (read_waste_data, 'waste_name', 'waste_sheet_name')]}
+
+    keys['model_recipes'] = cache_key('model_recipes', keys['read_recipes'], keys['read_price_weight_data'], keys['read_waste_data'],
+                                      config['price_period'])
+
+    return keys
+
+
+def run_stages(config, inputs):
+    """ run the stages of run_pipeline, with a complete run configuration """
+    # the inputs are compared with those of the previous run (see model_pipeline); an input file is identified by the key of
+    # reading it, so another sheet of the same file counts as a changed input too
+    with stage('hash_inputs'):
+        keys = stage_keys(config, inputs)
+        run_inputs = {'bom_file': keys['read_recipes'],
+                      'price_weight_file': keys['read_price_weight_data'],
+                      'waste_file': keys['read_waste_data'],
+                      'price_period': config['price_period']}
+
+    # ### Stage cache ###
+    # The modeled recipes only depend on the three input files, their sheets and the price period. If they are in the stage
+    # cache, parsing and modeling are skipped; only the planning and the outputs are made again.
+    cache = stage_cache(config['cache_dir']) if config['cache_dir'] is not None else None
+    model_key = keys['model_recipes']
+
+    # the lookup tables are only read from
+    with stage('price_weight') as record:
+        price_weight_data = inputs.read(read_price_weight_data, config['price_weight_name'], config['price_weight_sheet_name'], cache)
+        record['rows'] = len(price_weight_data)
+
+    with stage('waste') as record:
+        waste_data = inputs.read(read_waste_data, config['waste_name'], config['waste_sheet_name'], cache)
+        record['rows'] = len(waste_data)
+
+    if cache is not None and cache.has('model_recipes', model_key):
+        print('Uit de cache: model_recipes')
+        with stage('load_cache') as record:
+            recipes = cache.load('model_recipes', model_key)
+            record['rows'] = sum(len(recipe.data) for recipe in recipes)
+
+        # the next run compares with this one; the state only refers to the cache entry, so this is cheap
+        with stage('save_state'):
+            save_run_state(config['state_dir'], run_inputs, recipes, price_weight_data, cache, model_key)
+
+    else:
+        recipes = model_pipeline(config, inputs, run_inputs, price_weight_data, waste_data, cache, model_key)
+
+    with stage('planning') as record:
+        demand_ingredient, demand_category, meals = planning_stage(recipes, waste_data)
+        record['rows'] = len(demand_ingredient)
+
+    # ### Output files ###
+    # The BOM is streamed to the Excel file recipe by recipe, from the modeled recipes. They are all in memory by then (the
+    # planning, the run state and the stage cache need them), so streaming saves the combined copy of the BOM and the cells of
+    # the workbook, but peak memory still grows with the size of the BOM. Column order, headers and number formats are set in
+    # okm_output.OUTPUT_COLUMNS. If the BOM does not fit on one sheet it is split over the sheets 'BOM_1', 'BOM_2', ... (or over
+    # several workbooks) along recipe boundaries, with an 'Index' sheet telling where every meal is.
+    # Next to Excel, the BOM can be written with typed columns to Parquet, Feather and SQLite ('output_formats'), by default in
+    # the compact schema ('output_compact'). The typed table is only built if one of those formats or the run history needs it,
+    # and then only once: the compact schema is converted from it.
+    typed_formats = set(config['output_formats']) - {'xlsx'}
+    bom = None
+
+    if typed_formats or config['history_dir'] is not None:
+        with stage('bom_table') as record:
+            bom = bom_table(recipes)
+            record['rows'] = len(bom)
+
+    output_table = bom
+    if typed_formats and config['output_compact']:
+        output_table = compact_bom_table(bom, float32=config['output_float32'])
+
+    with stage('export') as record:
+        output_files = write_bom_outputs(config['output_name'], recipes, config['output_formats'],
+                                         extra_sheets={"Maaltijden": meals,
+                                                       "Inkoop per ingredient": demand_ingredient,
+                                                       "Inkoop per categorie": demand_category},
+                                         split_workbooks=config['output_split_workbooks'],
+                                         workers=config['output_workers'],
+                                         table=output_table)
+        record['rows'] = sum(len(recipe.data) for recipe in recipes)
+
+    print(f'Output opgeslagen: {", ".join(output_files)}')
+
+    # ### Run history ###
+    # Append the BOM of this run to the run history, to compare cost trends across periods (see okm_history).
+    if config['history_dir'] is not None:
+        # the history keeps the typed schema, so the runs in it all have the same column types
+        with stage('history'):
+            history_path = append_run(config['history_dir'], bom, config['history_period'] or config['price_period'].split()[-1])
+        print(f'Run toegevoegd aan de historie: {history_path}')
+
+    return pipeline_result(config, recipes, bom, meals, demand_ingredient, demand_category, output_files)
+
+
+# ## Command line ##
+# A config file holds parameters for all jobs at the top level, and a list of 'jobs' with the parameters that differ per job:
+#
+#     price_weight_name = "Input Price List + Grammage.xlsx"
+#
+#     [[jobs]]
+#     name = "Q2"
+#     price_period = "PRICE Q2"
+#     output_name = "Output v7 - Q2.xlsx"
+#
+#     [[jobs]]
+#     name = "Q3"
+#     price_period = "PRICE Q3"
+#     output_name = "Output v7 - Q3.xlsx"
+#
+# A config without 'jobs' is a single job. TOML needs Python 3.11+ (tomllib); JSON works with the same structure everywhere.
+
+def read_config(path):
+    """
+    Read a TOML or JSON config file
 
-            hf_newp_oldq = 0.0
-            hf_newp_newq = 0.0
-            hf_oldp_oldq = 0.0
+    Returns:
+    - Dict with the parameters, and optionally 'jobs'
+    """
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
 
-            hf_level = recipe.data['Niveau'][i]
-            for j in range(i + 1, len(recipe.data)):
-                if recipe.data['Niveau'][j] > hf_level:
+    if path.lower().endswith('.toml'):
+        if tomllib is None:
+            raise ValueError(f'TOML configuratie ({path}) heeft Python 3.11 of hoger nodig, gebruik een JSON bestand')
 
-                    try:
-                        if not np.isnan(recipe.data['Nieuwe vvp'][j]):
-                            hf_newp_oldq += recipe.data['Nieuwe vvp'][j]
-                    except:
-                        pass
-                    
-                    try:
-                        if not np.isnan(recipe.data['Materiaalkosten (nieuw)'][j]):
-                            hf_newp_newq += recipe.data['Materiaalkosten (nieuw)'][j]
-                    except:
-                        pass
-                    
-                    try:
-                        if not np.isnan(recipe.data['Materiaalkosten'][j]):
-                            if not recipe.data['hf_nr'][j] in product_data_HF:
-                                hf_oldp_oldq += recipe.data['Materiaalkosten'][j]
-                    except:
-                        pass
-                    
-                else:
-                    break
-        
-            recipe.data.at[i, 'Nieuwe vvp'] = hf_newp_oldq
-            recipe.data.at[i, 'Materiaalkosten (nieuw)'] = hf_newp_newq
-            recipe.data.at[i, 'Materiaalkosten HF (berekend)'] = hf_oldp_oldq
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
 
+    raise ValueError(f'Onbekend configuratie formaat: {path}. Gebruik .toml of .json')
 
-# ### Deltas ###
 
-# In[204]:
+def job_configs(config):
+    """
+    Split a config into the configs of its jobs
 
+    Returns:
+    - List of (name, config) tuples, one per job
+    """
+    shared = {key: value for key, value in config.items() if key != 'jobs'}
+    jobs = config.get('jobs') or [{}]
 
-for recipe in recipes:
-    delta_q_col = []
-    delta_p_col = []
-    delta_cost_col = []
-    fin_waste_impact_col = []
+    configs = []
+    for number, job in enumerate(jobs, start=1):
+        job = {**shared, **job}
+        configs.append((str(job.pop('name', number)), job))
 
-    for i in range(len(recipe.data)):
+    return configs
 
-        try:
-            delta_q = (recipe.data['Aantal (nieuw)'][i] - recipe.data['Aantal (Basis)'][i]) * recipe.data['Oude prijs'][i]
-            delta_p = (recipe.data['Nieuwe prijs'][i] - recipe.data['Oude prijs'][i]) * recipe.data['Aantal (nieuw)'][i]
-            delta_cost = recipe.data['Materiaalkosten (nieuw)'][i] - recipe.data['Materiaalkosten'][i]
-            fin_waste_impact = recipe.data['Materiaalkosten (nieuw)'][i] - recipe.data['Nieuwe vvp'][i]
 
-        except TypeError:
-            delta_q = 'Kan niet berekenen'
-            delta_p = 'Kan niet berekenen'
-            delta_cost = 'Kan niet berekenen'
-            fin_waste_impact = 'Kan niet berekenen'
+def run_jobs(config, jobs=None):
+    """
+    Run the jobs of a config one after the other, sharing the parsed input files
 
-        delta_q_col.append(delta_q)
-        delta_p_col.append(delta_p)
-        delta_cost_col.append(delta_cost)
-        fin_waste_impact_col.append(fin_waste_impact)
-    
-    recipe.data['Delta Q'] = delta_q_col
-    recipe.data['Delta prijs'] = delta_p_col
-    recipe.data['Delta materiaalkosten'] = delta_cost_col
-    recipe.data['Delta FIN waste'] = fin_waste_impact_col
+    Parameters:
+    - config: dict as read by read_config
+    - jobs: names of the jobs to run, defaults to all jobs
 
+    Returns:
+    - Dict of job name to pipeline_result
+    """
+    configs = job_configs(config)
 
-# ## Output Excel file ##
+    if jobs is not None:
+        unknown = set(jobs) - {name for name, _ in configs}
+        if unknown:
+            raise ValueError(f'Onbekende job(s): {sorted(unknown)}. Kies uit: {[name for name, _ in configs]}')
+        configs = [(name, job) for name, job in configs if name in jobs]
 
-# ### BOM ###
+    # validate every job before the first one runs
+    for name, job in configs:
+        run_config(job)
 
-# In[205]:
+    inputs = input_cache()
+    results = {}
 
+    for number, (name, job) in enumerate(configs, start=1):
+        if len(configs) > 1:
+            print(f'\n## Job {number} van {len(configs)}: {name} ##')
+        results[name] = run_pipeline(job, inputs)
 
-frames = []
-for recipe in recipes:
-    frames.append(recipe.data)
+    return results
 
-BOM_df = pd.concat(frames)
 
+def main(args=None):
+    parser = argparse.ArgumentParser(description='OKM model: kostprijsberekening van de recepten uit de NAV BOM')
+    parser.add_argument('config', nargs='?', help='TOML of JSON configuratie; zonder configuratie de standaard parameters')
+    parser.add_argument('--job', action='append', dest='jobs', help='alleen deze job draaien (kan vaker gegeven worden)')
+    parser.add_argument('--watch', metavar='MAP', help='blijven draaien en de jobs opnieuw draaien als de invoer in deze map wijzigt')
+    parser.add_argument('--interval', type=float, default=5.0, help='met --watch: seconden tussen twee controles van de map')
+    parser.add_argument('--serve', type=int, metavar='POORT', help='query service op deze poort (localhost) voor de eerste job')
+    args = parser.parse_args(args)
 
-# ### Excel file formatting ###
-# Change column order and names. Drop a few columns.
-
-# In[206]:
+    config = read_config(args.config) if args.config else {}
 
+    if args.serve is not None:
+        from okm_server import serve # okm_server builds on this module
 
-# Reorder and drop columns
-BOM_df = BOM_df[['index', 'id_nr', 'Product Naam', 'nr', 'Niveau', 'hf_nr', 'Omschrijving', 'Aantal (Basis)', 'Basiseenheid', 'Materiaalkosten', 'Categorie', 'Nieuwe prijs', 'Oude prijs',
-                 'Nieuwe vvp', 'Waste NAV', 'Waste FIN', 'Waste USE', 'Aantal (zonder waste)', 'Aantal (nieuw)', 'Materiaalkosten (nieuw)', 'Delta materiaalkosten', 'Delta Q', 
-                 'Delta prijs', 'Delta FIN waste', 'Grammage']]
-
-# Rename columns
-BOM_df = BOM_df.rename(columns={"index": "Index",
-                                'id_nr': 'Meal ID',
-                                'Product Naam': 'Meal Name',
-                                'nr': 'Volgnummer',
-                                'Niveau': 'Level',
-                                'hf_nr': 'Ingredient ID',
-                                'Omschrijving': 'Ingredient Name',
-                                'Aantal (Basis)': 'Aantal (Basis) (#)',
-                                'Basiseenheid': 'Eenheid (€ / KG-Stuk-Liter-Mtr)',
-                                'Materiaalkosten': 'Materiaalkosten 1.0 (P BOM + Q BOM) (€)',
-                                'Categorie': 'Categorie Master',
-                                'Nieuwe prijs': 'Ingredientprijs p.e. (Actueel) (€)',
-                                'Oude prijs': 'Ingredientprijs p.e. (BOM - Berekend) (€)',
-                                'Nieuwe vvp': 'Materiaalkosten 2.0 (P actueel) (€)',
-                                'Waste NAV': 'Uitval NAV (%)',
-                                'Waste FIN': 'Uitval FIN (%)',
-                                'Waste USE': 'Uitval USE (%)',
-                                'Aantal (zonder waste)': 'Aantal uitval EXL (#)',
-                                'Aantal (nieuw)': 'Aantal uitval USE (#)',
-                                'Materiaalkosten (nieuw)': 'Materiaalkosten 3.0 (P actueel + Q Waste update) (€)',
-                                'Delta materiaalkosten': 'Materiaalkosten (Delta 3.0 vs 1.0) (€)',
-                                'Delta Q': 'Materiaalkosten (Q-effect 3.0 vs 1.0) (€)',
-                                'Delta prijs': 'Materiaalkosten (P-effect 3.0 vs 1.0) (€)',
-                                'Delta FIN waste': 'FIN Waste Impact Waste Update (Delta 3.0 vs 2.0) (€)',
-                                'Grammage': 'Gewicht (kg)'
-                                })
+        serve([job for name, job in job_configs(config) if not args.jobs or name in args.jobs][0], port=args.serve)
+        return
 
+    if args.watch:
+        from okm_watch import folder_watcher # okm_watch builds on this module
 
-# ### Save to Excel ###
+        if args.jobs:
+            config = {**config, 'jobs': [{**job, 'name': name} for name, job in job_configs(config) if name in args.jobs]}
 
-# In[208]:
+        folder_watcher(args.watch, config, args.interval).watch()
+        return
+    results = run_jobs(config, args.jobs)
 
+    if len(results) > 1:
+        print()
+        for name, result in results.items():
+            print(f'{name}: {result}')
 
-with pd.ExcelWriter("Output v7 - Q2.xlsx") as writer:
-    BOM_df.to_excel(writer, sheet_name="BOM")
 
+# The guard keeps worker processes (model_workers, output_workers) from running the pipeline again when they import this module,
+# as they do with 'spawn' on Windows; freeze_support does the same for the PyInstaller executable.
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - run report #
+# Measures every stage of a run: wall time, CPU time, peak memory and the number of rows it handled. The stages are marked in
+# the code with stage(); while a run_report is active they are recorded in it, otherwise stage() does nothing:
+#
+#     with run_report() as report:
+#         with stage('read_bom') as record:
+#             bom_data_raw = read_bom(bom_name)
+#             record['rows'] = len(bom_data_raw)
+#
+#     print(report.summary())
+#     report.write('run.json')
+#
+# Peak memory is the peak resident memory (RSS) of this process during the stage; on Linux the peak is reset at the start of
+# every stage, elsewhere it is the peak of the process so far. Worker processes are not included. With trace_memory=True the
+# peak of the memory allocated by Python (tracemalloc) is recorded as well; that slows down the run, so it is off by default.
+
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+MB = 2**20
+
+_active_report = None
+
+
+# ### Peak memory ###
+
+def reset_peak_rss():
+    """ reset the peak resident memory of this process, where the OS allows it (Linux) """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """ the peak resident memory of this process, in bytes, None if it can not be read """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD), ('PeakWorkingSetSize', ctypes.c_size_t),
+                        ('WorkingSetSize', ctypes.c_size_t), ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPagedPoolUsage', ctypes.c_size_t), ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t),
+                        ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+        return None
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None
+
+
+# ### Report ###
+
+class run_report:
+    """ the measurements of the stages of a run """
+
+    def __init__(self, trace_memory : bool = False) -> None:
+        """ initialise an instance of run_report"""
+        self.trace_memory = trace_memory
+        self.records = []
+        self.open_records = [] # stages that have started and not ended, innermost last
+        self.started = None
+        self.info = {}
+
+    def __enter__(self):
+        global _active_report
+        self.previous_report, _active_report = _active_report, self
+
+        self.started = datetime.datetime.now()
+        self.start_wall, self.start_cpu = time.perf_counter(), time.process_time()
+        self.started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _active_report
+        _active_report = self.previous_report
+
+        self.wall = time.perf_counter() - self.start_wall
+        self.cpu = time.process_time() - self.start_cpu
+        self.peak_rss = peak_rss()
+
+        if self.started_tracing:
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name : str):
+        """ measure a stage; the record it yields can be given the number of 'rows' the stage handled """
+        record = {'stage': '/'.join([r['stage'] for r in self.open_records[-1:]] + [name]), 'rows': None}
+        self.records.append(record)
+        self.open_records.append(record)
+
+        reset_peak_rss()
+        record['child_peaks'] = []
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+
+        try:
+            yield record
+
+        finally:
+            record['wall_s'] = time.perf_counter() - start_wall
+            record['cpu_s'] = time.process_time() - start_cpu
+
+            # the peak was reset by stages within this one, so their peaks count as well
+            child_peaks = record.pop('child_peaks')
+            peak = peak_rss()
+            record['peak_rss_mb'] = None if peak is None else max([peak] + [p for p, _ in child_peaks]) / MB
+            if tracemalloc.is_tracing():
+                traced = tracemalloc.get_traced_memory()[1]
+                record['peak_traced_mb'] = max([traced] + [t for _, t in child_peaks]) / MB
+
+            self.open_records.pop()
+            if self.open_records:
+                self.open_records[-1]['child_peaks'].append(((record['peak_rss_mb'] or 0) * MB, record.get('peak_traced_mb', 0) * MB))
+
+    def add(self, name : str, wall_s : float, cpu_s : float, rows : int = None, calls : int = None) -> None:
+        """ add a stage that was measured elsewhere, e.g. a modeling step summed over all recipes """
+        parent = [r['stage'] for r in self.open_records[-1:]]
+        self.records.append({'stage': '/'.join(parent + [name]), 'rows': rows, 'calls': calls, 'wall_s': wall_s, 'cpu_s': cpu_s})
+
+    def summary(self) -> pd.DataFrame:
+        """ a table with a row per stage, and a 'Totaal' row for the whole run """
+        table = pd.DataFrame(self.records, columns=['stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'peak_traced_mb', 'rows', 'calls'])
+        table = table.dropna(axis=1, how='all')
+
+        if self.started is not None and hasattr(self, 'wall'):
+            total = {'stage': 'Totaal', 'wall_s': self.wall, 'cpu_s': self.cpu}
+            if 'peak_rss_mb' in table and self.peak_rss is not None:
+                total['peak_rss_mb'] = table['peak_rss_mb'].max()
+            table = pd.concat([table, pd.DataFrame([total])], ignore_index=True)
+
+        for col in ['rows', 'calls']:
+            if col in table:
+                table[col] = table[col].astype('Int64')
+
+        return table
+
+    def as_dict(self) -> dict:
+        """ the report as a JSON-serialisable dict """
+        return {'started': None if self.started is None else self.started.isoformat(timespec='seconds'),
+                'wall_s': getattr(self, 'wall', None),
+                'cpu_s': getattr(self, 'cpu', None),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'pid': os.getpid(),
+                **self.info,
+                'stages': self.records}
+
+    def write(self, path : str) -> None:
+        """ write the report to a JSON file """
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2, default=str)
+
+
+class null_record(dict):
+    """ the record of a stage while no report is active; whatever is put in it is dropped """
+
+    def __setitem__(self, key, value):
+        pass
+
+
+@contextmanager
+def stage(name : str):
+    """ measure a stage in the active run_report, if there is one """
+    if _active_report is None:
+        yield null_record()
+    else:
+        with _active_report.stage(name) as record:
+            yield record
+
+
+def active_report():
+    """ the active run_report, None if there is none """
+    return _active_report
+
+
+def print_summary(report):
+    """ print the summary table of a report """
+    summary = report.summary()
+
+    for col in ['rows', 'calls']:
+        if col in summary:
+            summary[col] = [('' if pd.isna(value) else str(value)) for value in summary[col]]
+
+    print(summary.to_string(index=False, float_format='{:.2f}'.format, na_rep=''))
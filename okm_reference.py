@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - reference steps #
+# The modeling steps as they were written first: row by row, looking every item up in the lookup tables by its string code.
+# okm_model runs faster versions of these steps (integer lookups, HF rollups); these are kept as the reference their results are
+# checked against. Every step is a frozen copy, the steps without lookups (quantities, deltas) too, so a change to a step in
+# okm_model is always checked against the original; only the step dependencies are taken from okm_model.
+
+import numpy as np
+
+from okm_model import MODEL_STEPS as OPTIMIZED_STEPS
+
+
+# ### Add categories ###
+
+def add_categories(recipe, lookups):
+    """
+    Add the 'Categorie' column, based on the product master
+    """
+    categories = []
+
+    for i in range(len(recipe.data)):
+        item_id = recipe.data['hf_nr'][i]
+
+        if item_id in lookups.product_data_ingredient:
+            categories.append('Ingredient')
+
+        elif item_id in lookups.product_data_HF:
+            categories.append('Halffabrikaat')
+
+        elif item_id in lookups.product_data_packaging:
+            categories.append('Verpakking')
+
+        else:
+            categories.append('Ongeclassificeerd')
+
+    recipe.data['Categorie'] = categories
+
+
+# ### New prices ###
+
+def add_new_prices(recipe, lookups):
+    """
+    Add the 'Nieuwe prijs' column.
+    From price list for ingredients & gas; 0 for packaging; and empty for HFs.
+    """
+    price_weight_data = lookups.price_weight_data
+    new_prices = []
+
+    for i in range(len(recipe.data)):
+        item_id = recipe.data['hf_nr'][i]
+
+        if item_id in lookups.product_data_ingredient: # ingredients
+            subset_price_df = price_weight_data[price_weight_data['INGREDIENT CODE'] == item_id]
+            new_price = subset_price_df[lookups.price_period].iloc[0]
+
+        elif item_id in lookups.product_data_packaging: # packaging
+            new_price = 0
+
+        elif item_id in lookups.product_data_HF: # HFs
+            new_price = None
+
+        else: # unclassified
+            new_price = 'Geen nieuwe prijs'
+
+        new_prices.append(new_price)
+
+    recipe.data['Nieuwe prijs'] = new_prices
+
+
+# ### Old prices ###
+
+def add_old_prices(recipe, lookups):
+    """
+    Add the 'Oude prijs' column.
+    Old costs / old quantity for ingredients & gas; 0 for packaging; and empty for HFs.
+    """
+    old_prices = []
+
+    for i in range(len(recipe.data)):
+        item_id = recipe.data['hf_nr'][i]
+
+        if item_id in lookups.product_data_ingredient: # ingredients
+            old_price = recipe.data['Materiaalkosten'][i] / recipe.data['Aantal (Basis)'][i]
+
+        elif item_id in lookups.product_data_packaging: # packaging
+            old_price = 0
+
+        elif item_id in lookups.product_data_HF: # HFs
+            old_price = None
+
+        else: # unclassified
+            old_price = recipe.data['Materiaalkosten'][i] / recipe.data['Aantal (Basis)'][i]
+
+        old_prices.append(old_price)
+
+    recipe.data['Oude prijs'] = old_prices
+
+
+# ### Weight in kg ###
+
+def add_weights(recipe, lookups):
+    """
+    Add the 'Grammage' column.
+    Convert items not in kg. Items already in kg stay the same. Packaging goes to 0, regardless of the unit.
+    """
+    price_weight_data = lookups.price_weight_data
+    weights = []
+
+    for i in range(len(recipe.data)):
+        item_id = recipe.data['hf_nr'][i]
+
+        if item_id in lookups.product_data_packaging: # packaging to 0
+            weight = 0.0
+
+        elif not recipe.data['Basiseenheid'][i] == 'KG':
+
+            subset_weight_data = price_weight_data[price_weight_data['INGREDIENT CODE'] == item_id]
+
+            if len(subset_weight_data) == 0: # no info about this item
+                weight = 'Geen conversie info'
+
+            elif len(subset_weight_data) == 1: # new info about this item
+                weight = subset_weight_data['KG'].iloc[0] * recipe.data['Aantal (Basis)'][i]
+
+            else:
+                weight = 'Dubbele conversie info'
+
+        else:
+            weight = recipe.data['Aantal (Basis)'][i]
+
+        weights.append(weight)
+
+    recipe.data['Grammage'] = weights
+
+
+# ### Waste ###
+
+def add_waste(recipe, lookups):
+    """
+    Add the 'Waste NAV', 'Waste FIN' and 'Waste USE' columns.
+    For items at level 1: find the waste in the waste data. For all other items, find the parent item at level 1, and take the waste from there.
+    """
+    waste_data = lookups.waste_data
+    waste_nav_col = []
+    waste_fin_col = []
+    waste_use_col = []
+
+    for i in range(len(recipe.data)):
+        item_id = recipe.data['hf_nr'][i]
+
+        if recipe.data['Niveau'][i] == 1: # waste is only determined at level 1
+            subset_waste_data = waste_data[waste_data['id'] == f'{recipe.id}_{item_id}']
+
+            if len(subset_waste_data) == 0:
+                # waste_nav = 'Geen waste info'
+                # waste_fin = 'Geen waste info'
+                # waste_use = 'Geen waste info'
+
+                waste_nav = 0
+                waste_fin = 0
+                waste_use = 0
+
+            elif len(subset_waste_data) == 1:
+                waste_nav = subset_waste_data['WASTE-NAV'].iloc[0]
+                waste_fin = subset_waste_data['WASTE-FIN'].iloc[0]
+                waste_use = subset_waste_data['WASTE-USE'].iloc[0]
+
+            else:
+                waste_nav = 'Dubbele waste info'
+                waste_fin = 'Dubbele waste info'
+                waste_use = 'Dubbele waste info'
+
+        else:
+            for j in range(i, -1, -1): # loop backwards to find the closest level 1 item
+                if recipe.data['Niveau'].iloc[j] == 1:
+
+                    if recipe.data['hf_nr'].iloc[j] in lookups.product_data_HF:
+                        parent_hf_id = recipe.data["hf_nr"].iloc[j]
+                        subset_waste_data_parent = waste_data[waste_data['id'] == f'{recipe.id}_{parent_hf_id}']
+
+                        if len(subset_waste_data_parent) == 0:
+                            # waste_nav = 'Geen waste info'
+                            # waste_fin = 'Geen waste info'
+                            # waste_use = 'Geen waste info'
+
+                            waste_nav = 0
+                            waste_fin = 0
+                            waste_use = 0
+
+                        elif len(subset_waste_data_parent) == 1:
+                            waste_nav = subset_waste_data_parent['WASTE-NAV'].iloc[0]
+                            waste_fin = subset_waste_data_parent['WASTE-FIN'].iloc[0]
+                            waste_use = subset_waste_data_parent['WASTE-USE'].iloc[0]
+
+                        else:
+                            waste_nav = 'Dubbele waste info'
+                            waste_fin = 'Dubbele waste info'
+                            waste_use = 'Dubbele waste info'
+
+                    else:
+                        waste_nav = 'Geen bijbehorend HF'
+                        waste_fin = 'Geen bijbehorend HF'
+                        waste_use = 'Geen bijbehorend HF'
+
+                    break
+
+        waste_nav_col.append(waste_nav)
+        waste_fin_col.append(waste_fin)
+        waste_use_col.append(waste_use)
+
+    recipe.data['Waste NAV'] = waste_nav_col
+    recipe.data['Waste FIN'] = waste_fin_col
+    recipe.data['Waste USE'] = waste_use_col
+
+
+# ### Quantities ###
+
+def add_quantities(recipe, lookups):
+    """
+    Add the 'Aantal (zonder waste)' and 'Aantal (nieuw)' columns.
+    Calculate the quantities based on the known waste data.
+    """
+    q_no_waste_col = []
+    q_new_col = []
+
+    for i in range(len(recipe.data)):
+
+        try:
+            q_no_waste = recipe.data['Aantal (Basis)'][i] / (1 + recipe.data['Waste NAV'][i])
+        except TypeError:
+            q_no_waste = 'Kan niet berekenen'
+
+        try:
+            q_new = q_no_waste * (1 + recipe.data['Waste USE'][i])
+        except TypeError:
+            q_new = 'Kan niet berekenen'
+
+        q_no_waste_col.append(q_no_waste)
+        q_new_col.append(q_new)
+
+    recipe.data['Aantal (zonder waste)'] = q_no_waste_col
+    recipe.data['Aantal (nieuw)'] = q_new_col
+
+
+# ### Costs ###
+
+# #### Non-HF costs ####
+
+def add_costs(recipe, lookups):
+    """
+    Add the 'Nieuwe vvp' and 'Materiaalkosten (nieuw)' columns for the non-HF items
+    """
+    newp_oldq_col = []
+    newp_newq_col = []
+
+    for i in range(len(recipe.data)):
+        item_id = recipe.data['hf_nr'][i]
+
+        if (item_id in lookups.product_data_ingredient) or (item_id in lookups.product_data_packaging):
+            try:
+                newp_oldq = recipe.data['Nieuwe prijs'][i] * recipe.data['Aantal (Basis)'][i]
+                newp_newq = recipe.data['Nieuwe prijs'][i] * recipe.data['Aantal (nieuw)'][i]
+
+            except TypeError: # could use the old price here as well
+                newp_oldq = 'Kan niet berekenen'
+                newp_newq = 'Kan niet berekenen'
+
+        elif item_id in lookups.product_data_HF:
+            newp_oldq = None
+            newp_newq = None
+
+        else:
+            newp_oldq = 'Ongeclassificeerd item'
+            newp_newq = 'Ongeclassificeerd item'
+
+        newp_oldq_col.append(newp_oldq)
+        newp_newq_col.append(newp_newq)
+
+    recipe.data['Nieuwe vvp'] = newp_oldq_col
+    recipe.data['Materiaalkosten (nieuw)'] = newp_newq_col
+
+
+# #### HF costs ####
+
+def add_hf_costs(recipe, lookups):
+    """
+    Fill in the costs of the HF items.
+    For an HF the costs are determined based on the costs of the individual ingredients which make up the HF.
+
+    The model runs okm_model.add_hf_rollups, which gives the same costs.
+    """
+    for i in range(len(recipe.data)):
+        item_id = recipe.data['hf_nr'][i]
+
+        if item_id in lookups.product_data_HF:
+
+            hf_newp_oldq = 0.0
+            hf_newp_newq = 0.0
+            hf_oldp_oldq = 0.0
+
+            hf_level = recipe.data['Niveau'][i]
+            for j in range(i + 1, len(recipe.data)):
+                if recipe.data['Niveau'][j] > hf_level:
+
+                    try:
+                        if not np.isnan(recipe.data['Nieuwe vvp'][j]):
+                            hf_newp_oldq += recipe.data['Nieuwe vvp'][j]
+                    except:
+                        pass
+
+                    try:
+                        if not np.isnan(recipe.data['Materiaalkosten (nieuw)'][j]):
+                            hf_newp_newq += recipe.data['Materiaalkosten (nieuw)'][j]
+                    except:
+                        pass
+
+                    try:
+                        if not np.isnan(recipe.data['Materiaalkosten'][j]):
+                            if not recipe.data['hf_nr'][j] in lookups.product_data_HF:
+                                hf_oldp_oldq += recipe.data['Materiaalkosten'][j]
+                    except:
+                        pass
+
+                else:
+                    break
+
+            recipe.data.at[i, 'Nieuwe vvp'] = hf_newp_oldq
+            recipe.data.at[i, 'Materiaalkosten (nieuw)'] = hf_newp_newq
+            recipe.data.at[i, 'Materiaalkosten HF (berekend)'] = hf_oldp_oldq
+
+
+# ### Deltas ###
+
+def add_deltas(recipe, lookups):
+    """
+    Add the 'Delta Q', 'Delta prijs', 'Delta materiaalkosten' and 'Delta FIN waste' columns
+    """
+    delta_q_col = []
+    delta_p_col = []
+    delta_cost_col = []
+    fin_waste_impact_col = []
+
+    for i in range(len(recipe.data)):
+
+        try:
+            delta_q = (recipe.data['Aantal (nieuw)'][i] - recipe.data['Aantal (Basis)'][i]) * recipe.data['Oude prijs'][i]
+            delta_p = (recipe.data['Nieuwe prijs'][i] - recipe.data['Oude prijs'][i]) * recipe.data['Aantal (nieuw)'][i]
+            delta_cost = recipe.data['Materiaalkosten (nieuw)'][i] - recipe.data['Materiaalkosten'][i]
+            fin_waste_impact = recipe.data['Materiaalkosten (nieuw)'][i] - recipe.data['Nieuwe vvp'][i]
+
+        except TypeError:
+            delta_q = 'Kan niet berekenen'
+            delta_p = 'Kan niet berekenen'
+            delta_cost = 'Kan niet berekenen'
+            fin_waste_impact = 'Kan niet berekenen'
+
+        delta_q_col.append(delta_q)
+        delta_p_col.append(delta_p)
+        delta_cost_col.append(delta_cost)
+        fin_waste_impact_col.append(fin_waste_impact)
+
+    recipe.data['Delta Q'] = delta_q_col
+    recipe.data['Delta prijs'] = delta_p_col
+    recipe.data['Delta materiaalkosten'] = delta_cost_col
+    recipe.data['Delta FIN waste'] = fin_waste_impact_col
+
+
+# ### Step dependencies ###
+# The reference steps under the names of okm_model.MODEL_STEPS, with the same dependencies; add_hf_costs stands in for the HF
+# rollups. okm_equivalence runs these next to an optimized engine and compares the results step by step.
+
+MODEL_STEPS = {
+    'categories': (add_categories, OPTIMIZED_STEPS['categories'][1]),
+    'new_prices': (add_new_prices, OPTIMIZED_STEPS['new_prices'][1]),
+    'old_prices': (add_old_prices, OPTIMIZED_STEPS['old_prices'][1]),
+    'weights': (add_weights, OPTIMIZED_STEPS['weights'][1]),
+    'waste': (add_waste, OPTIMIZED_STEPS['waste'][1]),
+    'quantities': (add_quantities, OPTIMIZED_STEPS['quantities'][1]),
+    'costs': (add_costs, OPTIMIZED_STEPS['costs'][1]),
+    'hf_rollups': (add_hf_costs, OPTIMIZED_STEPS['hf_rollups'][1]),
+    'deltas': (add_deltas, OPTIMIZED_STEPS['deltas'][1]),
+}
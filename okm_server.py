@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - query service #
+# A local HTTP service answering cost questions from the modeled BOM, instead of filtering the Excel output. The inputs are read
+# and modeled once per price period (okm_session.model_session) and kept in memory with their indexes, so a query only looks up
+# rows. Only the standard library is used; answers are JSON.
+#
+#     python okm_processing.py okm_jobs.toml --serve 8765
+#
+#     GET /meals                              totals of every meal
+#     GET /meals/<meal id>                    totals of one meal
+#     GET /meals/<meal id>/breakdown          BOM rows of the meal, with prices, waste and costs
+#     GET /items/<item id>/where-used         meals the item is used in, with quantities and costs
+#
+# Every query takes '?period=PRICE Q3' to answer for another price column of the price list (default: price_period of the
+# config). The service listens on localhost only, unless another host is given.
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import numpy as np
+import pandas as pd
+
+from okm_session import model_session
+from okm_processing import run_config, input_cache, read_config, job_configs, read_price_weight_data
+
+
+# Columns of the BOM table in a where-used answer
+WHERE_USED_COLUMNS = ['Meal ID', 'Meal Name', 'Level', 'Aantal (Basis) (#)', 'Aantal uitval USE (#)', 'Gewicht (kg)',
+                      'Ingredientprijs p.e. (Actueel) (€)', 'Materiaalkosten 3.0 (P actueel + Q Waste update) (€)']
+
+
+class query_service:
+    """ answers the queries of the HTTP service, from the modeled recipes of every price period asked for """
+
+    def __init__(self, config : dict = None, inputs : input_cache = None) -> None:
+        """ initialise an instance of query_service; the default price period is modeled right away """
+        self.config = run_config(config)
+        self.inputs = input_cache() if inputs is None else inputs
+        self.sessions = {}
+        self.meal_tables = {}
+        self.lock = threading.Lock()
+
+        self.session(self.config['price_period'])
+
+    def session(self, price_period : str = None) -> model_session:
+        """ the modeled recipes of a price period, modeled on the first query for it """
+        price_period = price_period or self.config['price_period']
+
+        with self.lock:
+            if price_period not in self.sessions:
+                price_weight_data = self.inputs.read(read_price_weight_data, self.config['price_weight_name'],
+                                                     self.config['price_weight_sheet_name'])
+                if price_period not in price_weight_data.columns:
+                    raise ValueError(f'Prijsperiode {price_period} staat niet in de prijslijst')
+
+                session = model_session({**self.config, 'price_period': price_period}, self.inputs)
+                self.sessions[price_period] = session
+
+                # meals are looked up by the id in the URL, so by the same text key as session.meal_recipes (a NAV meal id
+                # may be read as a number)
+                meals = session.meals()
+                meals.index = meals['Meal ID'].map(str).rename(None)
+                self.meal_tables[price_period] = meals
+
+        return self.sessions[price_period]
+
+    def meals(self, price_period : str = None) -> pd.DataFrame:
+        """ the totals of every meal """
+        self.session(price_period)
+        return self.meal_tables[price_period or self.config['price_period']]
+
+    def meal_cost(self, meal : str, price_period : str = None) -> pd.DataFrame:
+        """ the totals of a meal """
+        meals = self.meals(price_period)
+
+        if meal not in meals.index:
+            raise KeyError(f'Maaltijd {meal} niet gevonden')
+
+        return meals.loc[[meal]]
+
+    def meal_breakdown(self, meal : str, price_period : str = None) -> pd.DataFrame:
+        """ the BOM rows of a meal """
+        session = self.session(price_period)
+        positions = session.meal_recipes.get(meal)
+
+        if not positions:
+            raise KeyError(f'Maaltijd {meal} niet gevonden')
+
+        rows = np.concatenate([np.arange(session.starts[p], session.starts[p + 1]) for p in positions])
+        return session.bom.iloc[rows]
+
+    def where_used(self, item : str, price_period : str = None) -> pd.DataFrame:
+        """ the rows of every meal an item is used in """
+        session = self.session(price_period)
+        positions = session.item_recipes.get(item)
+
+        if not positions:
+            raise KeyError(f'Item {item} niet gevonden')
+
+        rows = np.concatenate([np.arange(session.starts[p], session.starts[p + 1]) for p in positions])
+        bom = session.bom.iloc[rows]
+
+        return bom.loc[bom['Ingredient ID'] == item, WHERE_USED_COLUMNS]
+
+
+def table_json(table):
+    """ a table as a list of JSON objects, missing values as null """
+    return json.loads(table.to_json(orient='records', force_ascii=False))
+
+
+def make_handler(service):
+    """ build the request handler class of a query_service """
+
+    class handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [unquote(part) for part in url.path.strip('/').split('/') if part]
+            period = parse_qs(url.query).get('period', [None])[0]
+
+            try:
+                if parts == ['meals']:
+                    body = {'period': period or service.config['price_period'], 'meals': table_json(service.meals(period))}
+
+                elif len(parts) == 2 and parts[0] == 'meals':
+                    body = table_json(service.meal_cost(parts[1], period))[0]
+
+                elif len(parts) == 3 and parts[0] == 'meals' and parts[2] == 'breakdown':
+                    body = {'meal': parts[1], 'rows': table_json(service.meal_breakdown(parts[1], period))}
+
+                elif len(parts) == 3 and parts[0] == 'items' and parts[2] == 'where-used':
+                    body = {'item': parts[1], 'rows': table_json(service.where_used(parts[1], period))}
+
+                else:
+                    self.send_json(404, {'error': f'Onbekende query: {url.path}'})
+                    return
+
+            except KeyError as error:
+                self.send_json(404, {'error': error.args[0]})
+                return
+
+            except ValueError as error:
+                self.send_json(400, {'error': str(error)})
+                return
+
+            self.send_json(200, body)
+
+        def send_json(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass # no line per query
+
+    return handler
+
+
+def make_server(service, host='127.0.0.1', port=8765):
+    """ build the HTTP server of a query_service; port 0 picks a free port (see server.server_address) """
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+def serve(config=None, host='127.0.0.1', port=8765):
+    """ model the inputs of a config and answer queries until interrupted (Ctrl+C) """
+    server = make_server(query_service(config), host, port)
+    print(f'Query service op http://{server.server_address[0]}:{server.server_address[1]}/meals (stoppen met Ctrl+C)')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Gestopt')
+    finally:
+        server.server_close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Lokale query service voor de kosten per maaltijd')
+    parser.add_argument('config', nargs='?', help='TOML of JSON configuratie; de parameters van de eerste job worden gebruikt')
+    parser.add_argument('--host', default='127.0.0.1', help='adres om op te luisteren (standaard: alleen deze computer)')
+    parser.add_argument('--port', type=int, default=8765, help='poort (standaard: 8765)')
+    args = parser.parse_args(args)
+
+    config = read_config(args.config) if args.config else {}
+    serve(job_configs(config)[0][1], args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
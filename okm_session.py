@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - what-if session #
+# For trying out assumptions in a notebook without running the whole pipeline again. A session reads, indexes and models the
+# inputs once; every change afterwards only re-runs the modeling steps that depend on it (see okm_model.MODEL_STEPS), only for
+# the recipes that contain the changed item or meal, and returns the updated BOM table:
+#
+#     from okm_session import model_session
+#     session = model_session({'price_period': 'PRICE Q2'})
+#     session.override_price('100234', 4.25)
+#     session.set_waste('500012', '200045', use=0.08)
+#     session.set_price_period('PRICE Q3')
+#     session.meals()
+#
+# Changes are only made in memory; the input files and the outputs of the pipeline are left alone.
+
+import copy
+
+import numpy as np
+import pandas as pd
+
+from okm_model import lookup_tables, model_recipes, invalidated_steps
+from okm_intern import build_lookup_index
+from okm_output import bom_table
+from okm_planning import meal_summary
+from okm_processing import run_config, input_cache, read_recipes, read_price_weight_data, read_waste_data
+from okm_processing import build_product_master, split_product_data
+
+
+WASTE_COLUMNS = {'nav': 'WASTE-NAV', 'fin': 'WASTE-FIN', 'use': 'WASTE-USE'}
+
+
+class model_session:
+    """ the modeled recipes of a run, kept in memory to try out other prices, waste and price periods """
+
+    def __init__(self, config : dict = None, inputs : input_cache = None) -> None:
+        """
+        Initialise an instance of model_session: read and model the inputs of a run
+
+        Parameters:
+        - config: dict of parameters, see okm_processing.DEFAULT_CONFIG; only the input files, sheets, price period and
+          model_workers are used
+        - inputs: input_cache to read the inputs from, shared with pipeline runs in the same process
+        """
+        self.config = run_config(config)
+        inputs = input_cache() if inputs is None else inputs
+
+        # the session changes its recipes and tables, so it works on copies of what is in the input cache
+        self.recipes = copy.deepcopy(inputs.read(read_recipes, self.config['bom_name'], self.config['bom_sheet_name']))
+        self.price_weight_data = inputs.read(read_price_weight_data, self.config['price_weight_name'],
+                                             self.config['price_weight_sheet_name']).copy()
+        self.waste_data = inputs.read(read_waste_data, self.config['waste_name'], self.config['waste_sheet_name']).copy()
+
+        self.lookups = lookup_tables(*split_product_data(build_product_master(self.recipes)), self.price_weight_data,
+                                     self.waste_data, self.config['price_period'])
+        model_recipes(self.recipes, self.lookups, workers=self.config['model_workers'])
+
+        # where every item and meal occurs, and where the rows of every recipe are in the BOM table
+        self.item_recipes = {}
+        self.meal_recipes = {}
+        for position, recipe in enumerate(self.recipes):
+            for item in set(recipe.data['hf_nr']):
+                self.item_recipes.setdefault(item, []).append(position)
+            self.meal_recipes.setdefault(str(recipe.id), []).append(position)
+
+        self.starts = np.concatenate([[0], np.cumsum([len(recipe.data) for recipe in self.recipes])])
+        self.bom = bom_table(self.recipes)
+
+    def rerun(self, positions, changed_inputs) -> pd.DataFrame:
+        """
+        Re-run the steps that depend on the changed inputs for some of the recipes, and update their rows in the BOM table
+
+        Parameters:
+        - positions: positions of the recipes to re-run, in self.recipes
+        - changed_inputs: input names, as used in okm_model.MODEL_STEPS
+
+        Returns:
+        - The updated BOM table
+        """
+        positions = sorted(set(positions))
+
+        if positions:
+            recipes = [self.recipes[position] for position in positions]
+            model_recipes(recipes, self.lookups, invalidated_steps(changed_inputs), workers=self.config['model_workers'])
+
+            rows = np.concatenate([np.arange(self.starts[position], self.starts[position + 1]) for position in positions])
+            updated = bom_table(recipes)
+
+            for col in updated.columns:
+                self.bom.iloc[rows, self.bom.columns.get_loc(col)] = updated[col].to_numpy()
+
+        return self.bom
+
+    def set_price_period(self, price_period : str) -> pd.DataFrame:
+        """ price all recipes with another price column of the price list, e.g. 'PRICE Q3' """
+        if price_period not in self.price_weight_data.columns:
+            raise ValueError(f'Prijsperiode {price_period} staat niet in de prijslijst')
+
+        self.lookups.price_period = price_period
+
+        return self.rerun(range(len(self.recipes)), ['price_period'])
+
+    def override_price(self, code : str, value : float) -> pd.DataFrame:
+        """ change the price of an item in the current price period """
+        rows = (self.price_weight_data['INGREDIENT CODE'] == code).fillna(False).to_numpy()
+
+        if not rows.any():
+            raise KeyError(f'Item {code} staat niet in de prijslijst')
+
+        # a price column without decimals in the price list is read as integers, which cannot hold a price like 4.25
+        price_period = self.lookups.price_period
+        if pd.api.types.is_integer_dtype(self.price_weight_data[price_period]):
+            self.price_weight_data[price_period] = self.price_weight_data[price_period].astype('Float64')
+
+        self.price_weight_data.loc[rows, price_period] = value
+
+        return self.rerun(self.item_recipes.get(code, []), ['price_period'])
+
+    def set_waste(self, meal : str, ingredient : str, nav : float = None, fin : float = None, use : float = None) -> pd.DataFrame:
+        """
+        Change the waste of an item (on level 1) in a meal; waste percentages that are not given stay the same
+
+        A meal & item without waste rows gets one, with 0 for the percentages that are not given.
+        """
+        meal, ingredient = str(meal), str(ingredient)
+        values = {WASTE_COLUMNS[name]: value for name, value in {'nav': nav, 'fin': fin, 'use': use}.items() if value is not None}
+        rows = (self.waste_data['id'] == f'{meal}_{ingredient}').fillna(False).to_numpy()
+
+        # a waste column without decimals (e.g. all zero) is read as integers, which cannot hold a percentage like 0.08
+        for col in WASTE_COLUMNS.values():
+            if pd.api.types.is_integer_dtype(self.waste_data[col]):
+                self.waste_data[col] = self.waste_data[col].astype('Float64')
+
+        if rows.any():
+            for col, value in values.items():
+                self.waste_data.loc[rows, col] = value
+
+        else:
+            row = {'MEAL CODE': meal, 'INGREDIENT CODE': ingredient, 'id': f'{meal}_{ingredient}',
+                   **{col: values.get(col, 0.0) for col in WASTE_COLUMNS.values()}}
+            new_row = pd.DataFrame([row]).astype({col: self.waste_data[col].dtype for col in row})
+            self.waste_data = pd.concat([self.waste_data, new_row], ignore_index=True)
+
+            self.lookups.waste_data = self.waste_data
+            self.lookups.index = build_lookup_index(self.lookups.product_data_ingredient, self.lookups.product_data_packaging,
+                                                    self.lookups.product_data_HF, self.price_weight_data, self.waste_data)
+
+        return self.rerun(self.meal_recipes.get(meal, []), ['waste_file'])
+
+    def meals(self) -> pd.DataFrame:
+        """ the totals of every meal, as on the 'Maaltijden' sheet """
+        return meal_summary(self.recipes)
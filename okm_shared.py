@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - shared lookup tables #
+# For parallel modeling (okm_model.model_recipes) the lookup tables can be put in shared memory once, instead of being pickled
+# to every worker process. The integer index on the tables (okm_intern) and the prices, weights and waste percentages are
+# arrays; every array is a shared memory block that the workers map into their own memory without copying it.
+#
+# The modeling steps only look codes up in the index, so the code columns of the tables are not shared at all: a worker holds
+# one string per distinct code (to intern the codes of its recipes), and no strings per row.
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from okm_intern import code_table, lookup_index
+from okm_model import lookup_tables, init_worker
+
+
+# Columns of the lookup tables the modeling steps use; the price column of the run ('price_period') is added to the price table
+PRICE_COLUMNS = ['KG']
+WASTE_COLUMNS = ['WASTE-NAV', 'WASTE-FIN', 'WASTE-USE']
+
+# Arrays of the lookup_index, besides its code table
+INDEX_ARRAYS = ['flags', 'price_keys', 'price_first', 'price_count', 'waste_keys', 'waste_first', 'waste_count']
+
+PRODUCT_DATA = ['product_data_ingredient', 'product_data_packaging', 'product_data_HF']
+
+
+class shared_lookup_tables:
+    """ the lookup tables of a run in shared memory, for worker processes to attach to """
+
+    def __init__(self, lookups : lookup_tables) -> None:
+        """ initialise an instance of shared_lookup_tables: copy the lookup tables to shared memory """
+        self.blocks = []
+        self.handle = {'price_period': lookups.price_period, 'token': lookups.index.token, 'arrays': {}, 'tables': {}}
+
+        tables = {'price_weight_data': lookups.price_weight_data[PRICE_COLUMNS + [lookups.price_period]],
+                  'waste_data': lookups.waste_data[WASTE_COLUMNS]}
+
+        index = lookups.index
+        self.share('codes', np.asarray(index.codes.strings, dtype=str))
+
+        for name in INDEX_ARRAYS:
+            self.share(name, getattr(index, name))
+
+        for name in PRODUCT_DATA:
+            self.share(name, index.item_codes(getattr(lookups, name)))
+
+        for table_name, table in tables.items():
+            self.handle['tables'][table_name] = [self.share_column(f'{table_name}/{col}', table[col]) for col in table]
+
+    def share(self, name : str, array : np.ndarray) -> None:
+        """ copy an array to a new shared memory block """
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+
+        self.blocks.append(block)
+        self.handle['arrays'][name] = (block.name, array.dtype.str, array.shape)
+
+    def share_column(self, name : str, column : pd.Series) -> tuple:
+        """
+        Copy a column of a lookup table to shared memory
+
+        Returns:
+        - Tuple of the column name, how it is stored, its dtype and (only if it is not in shared memory) its values
+        """
+        if isinstance(column.array, (pd.arrays.FloatingArray, pd.arrays.IntegerArray)):
+            self.share(name, column.to_numpy(dtype=column.dtype.numpy_dtype, na_value=0))
+            self.share(name + '/mask', column.isna().to_numpy())
+            return column.name, 'masked', column.dtype, None
+
+        if column.dtype.kind in 'fiu':
+            self.share(name, column.to_numpy())
+            return column.name, 'numpy', column.dtype, None
+
+        # anything else (e.g. a price column with text in it) is pickled to the workers along with the handle
+        return column.name, 'pickled', column.dtype, column.reset_index(drop=True)
+
+    def close(self) -> None:
+        """ release the shared memory, once the workers are done """
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach(handle):
+    """
+    Rebuild the lookup tables on top of the shared memory blocks
+
+    Parameters:
+    - handle: shared_lookup_tables.handle of the parent process
+
+    Returns:
+    - lookup_tables, with the index and the numeric columns as read-only views on the shared memory
+    """
+    blocks = []
+    arrays = {}
+
+    for name, (block_name, dtype, shape) in handle['arrays'].items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+
+    # one string per distinct code; the index and the product data refer to them by their shared code. The index keeps the token
+    # of the parent's index, as the codes are the same
+    index = lookup_index(code_table(arrays['codes'].astype(object)), *[arrays[name] for name in INDEX_ARRAYS],
+                         token=handle['token'])
+
+    tables = {}
+    for table_name, columns in handle['tables'].items():
+        table = {}
+
+        for col, kind, dtype, values in columns:
+            name = f'{table_name}/{col}'
+
+            if kind == 'masked':
+                array_type = pd.arrays.FloatingArray if dtype.kind == 'f' else pd.arrays.IntegerArray
+                table[col] = pd.Series(array_type(arrays[name], arrays[name + '/mask']), copy=False)
+            elif kind == 'numpy':
+                table[col] = pd.Series(arrays[name], copy=False)
+            else:
+                table[col] = values
+
+        tables[table_name] = pd.DataFrame(table, copy=False)
+
+    lookups = lookup_tables(*[index.codes.decode(arrays[name]) for name in PRODUCT_DATA], tables['price_weight_data'],
+                            tables['waste_data'], handle['price_period'], index=index)
+    lookups.shared_blocks = blocks # keeps the shared memory mapped as long as the lookup tables live
+
+    return lookups
+
+
+def init_shared_worker(handle):
+    """ attach a worker process of okm_model.model_recipes to the shared lookup tables """
+    init_worker(attach(handle))
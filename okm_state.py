@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - run state #
+# Keeps track of the inputs a run was made with, so that a next run only has to recompute what depends on a changed input.
+#
+# The modeled recipes of the run are kept once: when the run uses the stage cache (okm_cache), the state only refers to the
+# cache entry with the recipes; without a stage cache they are pickled in the state directory.
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from okm_cache import stage_cache
+
+
+STATE_VERSION = 5
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Calculate the SHA-256 hash of a file's contents
+
+    Parameters:
+    - path: path to the file
+    - chunk_size: number of bytes read at a time
+
+    Returns:
+    - Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def load_run_state(state_dir):
+    """
+    Load the state of the previous run
+
+    Parameters:
+    - state_dir: directory the state was saved in
+
+    Returns:
+    - Dict with the 'inputs' (hashes & parameters), the modeled 'recipes' and the 'price_weight_data' of the previous run,
+      or None if there is no (usable) previous run, e.g. when the cache entry with its recipes was deleted
+    """
+    manifest_path = os.path.join(state_dir, 'manifest.json')
+
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') != STATE_VERSION:
+        return None
+
+    entry = manifest['recipes']
+    if entry is None:
+        recipes = pd.read_pickle(os.path.join(state_dir, 'recipes.pkl'))
+    else:
+        cache = stage_cache(entry['cache_dir'])
+        if not cache.has(entry['stage'], entry['key']):
+            return None
+        recipes = cache.load(entry['stage'], entry['key'])
+
+    return {'inputs': manifest['inputs'],
+            'recipes': recipes,
+            'price_weight_data': pd.read_pickle(os.path.join(state_dir, 'price_weight_data.pkl'))}
+
+
+def save_run_state(state_dir, inputs, recipes, price_weight_data, cache=None, key=None):
+    """
+    Save the state of this run, for the next run to compare against
+
+    Parameters:
+    - state_dir: directory to save the state in
+    - inputs: dict of input names to their hashes / parameter values
+    - recipes: list of modeled recipes
+    - price_weight_data: the price & weight table the recipes were modeled with
+    - cache, key: stage cache and key of the 'model_recipes' entry holding the recipes; the state refers to it instead of
+      storing the recipes again
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    recipes_path = os.path.join(state_dir, 'recipes.pkl')
+
+    if cache is None:
+        entry = None
+        pd.to_pickle(recipes, recipes_path)
+    else:
+        entry = {'cache_dir': os.path.abspath(cache.cache_dir), 'stage': 'model_recipes', 'key': key}
+        cache.save('model_recipes', key, recipes)
+
+    pd.to_pickle(price_weight_data, os.path.join(state_dir, 'price_weight_data.pkl'))
+
+    # The manifest is written last, so an interrupted save never looks like a valid state
+    with open(os.path.join(state_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': STATE_VERSION, 'inputs': inputs, 'recipes': entry}, f, indent=2)
+
+    # the recipes of an earlier run without the stage cache
+    if entry is not None and os.path.exists(recipes_path):
+        os.remove(recipes_path)
+
+
+def changed_inputs(previous_state, inputs):
+    """
+    Compare the inputs of this run with those of the previous run
+
+    Parameters:
+    - previous_state: state as returned by load_run_state, or None
+    - inputs: dict of input names to their hashes / parameter values
+
+    Returns:
+    - Set of the names of the inputs that changed (all inputs if there is no previous state)
+    """
+    if previous_state is None:
+        return set(inputs)
+
+    return {name for name, value in inputs.items() if previous_state['inputs'].get(name) != value}
+
+
+def price_signatures(price_weight_data, price_period):
+    """
+    Summarise the price & weight information of every ingredient code
+
+    Parameters:
+    - price_weight_data: price & weight table
+    - price_period: name of the price column used
+
+    Returns:
+    - Dict of ingredient code to a tuple with the price & weight values of all its rows
+    """
+    columns = [col for col in [price_period, 'KG'] if col in price_weight_data.columns]
+    values = price_weight_data[columns].astype('string').fillna('<NA>')
+    values['INGREDIENT CODE'] = price_weight_data['INGREDIENT CODE']
+
+    # all rows of a code count, as duplicate rows change the outcome of the weight conversion
+    return values.groupby('INGREDIENT CODE', sort=False)[columns].agg(tuple).apply(tuple, axis=1).to_dict()
+
+
+def diff_price_tables(old, new, price_period):
+    """
+    Find the ingredients whose price or weight information differs between two price & weight tables
+
+    Parameters:
+    - old: price & weight table of the previous run
+    - new: price & weight table of this run
+    - price_period: name of the price column used
+
+    Returns:
+    - Set of ingredient codes that were added, removed or changed
+    """
+    old_signatures = price_signatures(old, price_period)
+    new_signatures = price_signatures(new, price_period)
+
+    return {code for code in old_signatures.keys() | new_signatures.keys()
+            if old_signatures.get(code) != new_signatures.get(code)}
+
+
+# ### Recipe fingerprints ###
+# A recipe's modeled result only depends on its own BOM rows, the product master categories, prices & weights of its items, and
+# the waste rows of its meal. Recipes for which none of these changed since the previous run are reused from that run.
+
+def recipe_fingerprint(recipe_data):
+    """
+    Fingerprint the contents of a recipe, as split from the BOM
+
+    The 'index' column (the row number in the BOM download) is left out, so a recipe that only moved in the download keeps its
+    fingerprint.
+
+    Parameters:
+    - recipe_data: DataFrame with the BOM rows of the recipe
+
+    Returns:
+    - Hex digest of the recipe contents
+    """
+    content = recipe_data.drop(columns='index', errors='ignore')
+    digest = hashlib.sha256('|'.join(map(str, content.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(content, index=False).to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+
+def input_signatures(product_master, price_weight_data, waste_data, price_period):
+    """
+    Summarise the lookup tables per item and per meal, to build recipe result keys from
+
+    Parameters:
+    - product_master: DataFrame with the 'Nummer' and 'Categorie' of every item
+    - price_weight_data: price & weight table
+    - waste_data: waste table, with the 'id' column
+    - price_period: name of the price column used
+
+    Returns:
+    - Dict with the 'categories', 'prices' and 'waste' signatures, and the 'price_period'
+    """
+    waste_values = waste_data.drop(columns='VOLUME', errors='ignore').astype('string').fillna('<NA>')
+    waste_values['meal'] = waste_data['MEAL CODE'].astype('string')
+
+    return {'categories': dict(zip(product_master['Nummer'], product_master['Categorie'])),
+            'prices': price_signatures(price_weight_data, price_period),
+            'waste': waste_values.groupby('meal', sort=False).agg(tuple).apply(tuple, axis=1).to_dict(),
+            'price_period': price_period}
+
+
+def recipe_result_key(recipe, signatures):
+    """
+    Build the key under which the modeled result of a recipe is stored
+
+    Parameters:
+    - recipe: recipe, with its fingerprint set
+    - signatures: as returned by input_signatures
+
+    Returns:
+    - Hex digest identifying the recipe contents and all input rows it depends on
+    """
+    items = sorted(set(recipe.data['hf_nr']))
+    dependencies = (recipe.fingerprint,
+                    signatures['price_period'],
+                    [(item, signatures['categories'].get(item), signatures['prices'].get(item)) for item in items],
+                    signatures['waste'].get(str(recipe.id)))
+
+    return hashlib.sha256(repr(dependencies).encode('utf-8')).hexdigest()
+
+
+def reuse_recipe_result(recipe, previous_recipes):
+    """
+    Take over the modeled data of a recipe from the previous run, if its result key is the same
+
+    Parameters:
+    - recipe: recipe, with its result key set
+    - previous_recipes: dict of result key to the recipes of the previous run
+
+    Returns:
+    - True if the result was reused
+    """
+    previous = previous_recipes.get(recipe.result_key)
+
+    if previous is None:
+        return False
+
+    data = previous.data.copy()
+    data['index'] = recipe.data['index'].to_numpy() # the rows may have moved in the BOM download
+    recipe.data = data
+    recipe.totals = previous.totals
+
+    return True
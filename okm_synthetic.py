@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - synthetic inputs #
+# Writes made-up input files in the layouts okm_processing reads, for testing and timing the model at any scale without real
+# recipe downloads:
+#
+#     python okm_synthetic.py "Synthetisch" --recipes 5000 --depth 3 --sharing 0.6 --errors 0.01
+#
+# - BOM download ('Budget' sheet): a recipe per meal between an 'Omschrijving' and a 'Kostenaandeel voor dit artikel' marker
+#   row, with nested 'Niveau' levels, HFs ('2...') with ingredients ('1...') and sub-HFs below them, packaging ('3...') and the
+#   quantities and costs as text with a decimal comma, as in the NAV download
+# - price & grammage list ('PriceList'): every ingredient, and every HF counted in pieces, with its weight and a price per period
+# - waste table ('WASTE'): waste percentages and the planned volume for most HFs on level 1 of every meal
+# - active recipes ('Actief'): whether every meal is active, per period
+#
+# HFs are taken from a pool shared by all recipes ('sharing') or made for one recipe only, so the share of repeated subtrees can
+# be set. Errors the model reports are injected at the given rates: duplicate waste rows ('Dubbele waste info'), duplicate and
+# missing weights of items counted in pieces ('Dubbele conversie info', 'Geen conversie info'), and packaging with items below it
+# ('Geen bijbehorend HF'). The same spec and seed always give the same files.
+
+import argparse
+import os
+
+import numpy as np
+import xlsxwriter
+
+
+DEFAULT_SPEC = {
+    'recipes': 100, # number of recipes (meals)
+    'rows': None, # number of BOM rows to make instead; recipes are added until there are at least this many
+    'depth': 3, # deepest 'Niveau' level
+    'sharing': 0.5, # chance that an HF is taken from the pool shared by all recipes, instead of made for one recipe
+    'shared_hfs': 200, # size of the shared pool of HFs, per level
+    'ingredients': 2000, # number of different ingredients
+    'packaging': 50, # number of different packaging items
+    'hfs_per_recipe': (1, 4), # range of the number of HFs on level 1 of a recipe
+    'ingredients_per_recipe': (2, 6), # range of the number of loose ingredients on level 1 of a recipe
+    'children_per_hf': (2, 6), # range of the number of items below an HF
+    'sub_hf_rate': 0.3, # chance that an item below an HF is an HF itself, above the deepest level
+    'piece_rate': 0.1, # share of the items counted in pieces ('ST') instead of kilograms
+    'waste_rate': 0.8, # share of the HFs on level 1 of a meal with a row in the waste table
+    'active_rate': 0.9, # share of the meals that are active in a period
+    'price_periods': ['PRICE Q1', 'PRICE Q2', 'PRICE Q3', 'PRICE Q4'],
+    'seed': 0,
+    'duplicate_waste_rate': 0.01, # share of the waste rows that are in the table twice, with other percentages
+    'duplicate_weight_rate': 0.01, # share of the items counted in pieces that are in the price list twice
+    'missing_weight_rate': 0.01, # share of the HFs counted in pieces that are missing from the price list
+    'orphan_rate': 0.01, # chance that a recipe has packaging with items below it
+}
+
+# Largest number of rows of an Excel sheet
+EXCEL_MAX_ROWS = 1048576
+
+# Columns of the BOM download after the eight that are read (see okm_bom.BOM_COLUMNS); okm_bom drops them, so they must be there
+BOM_EXTRA_COLUMNS = 5
+
+
+def spec_config(spec=None):
+    """
+    Complete a spec with the default values
+
+    Parameters:
+    - spec: dict with (some of) the values in DEFAULT_SPEC
+
+    Returns:
+    - Dict with all values
+    """
+    spec = dict(spec or {})
+
+    unknown = set(spec) - set(DEFAULT_SPEC)
+    if unknown:
+        raise ValueError(f'Onbekende parameter(s): {sorted(unknown)}. Kies uit: {list(DEFAULT_SPEC)}')
+
+    return {**DEFAULT_SPEC, **spec}
+
+
+def decimal_comma(value):
+    """ a number as text with a decimal comma, as in the NAV download """
+    return f'{value:.6g}'.replace('.', ',')
+
+
+class synthetic_inputs:
+    """ made-up inputs of the OKM model, as rows of the sheets they are written to """
+
+    def __init__(self, spec : dict = None) -> None:
+        """ initialise an instance of synthetic_inputs: make the inputs of a spec, see DEFAULT_SPEC """
+        self.spec = spec_config(spec)
+        self.rng = np.random.default_rng(self.spec['seed'])
+
+        rng = self.rng
+        self.ingredients = [str(100000 + k) for k in range(self.spec['ingredients'])]
+        self.packaging = [str(300000 + k) for k in range(self.spec['packaging'])]
+
+        # the price and weight of every ingredient do not change between recipes; the old price in the download is close to it
+        self.kg = dict(zip(self.ingredients, np.round(rng.uniform(0.05, 2.0, len(self.ingredients)), 4)))
+        self.old_prices = dict(zip(self.ingredients, np.round(rng.uniform(0.5, 25.0, len(self.ingredients)), 4)))
+        self.piece_items = set(np.array(self.ingredients)[rng.random(len(self.ingredients)) < self.spec['piece_rate']])
+
+        self.shared_pool = {} # (level, slot) -> HF
+        self.hf_count = 0
+        self.piece_hfs = {} # code -> weight of HFs counted in pieces
+
+        self.bom_rows = []
+        self.waste_rows = []
+        self.meals = []
+        self.row_count = 0
+
+        self.make_recipes()
+
+    # ### HFs ###
+    # An HF is a dict with its code, name, unit and items below it, as (item, quantity) tuples; the item is an ingredient code
+    # or another HF. A shared HF has the same items in every recipe it is used in.
+
+    def make_hf(self, level):
+        """ make an HF for the given level, with items below it down to the deepest level """
+        rng, spec = self.rng, self.spec
+        self.hf_count += 1
+
+        hf = {'code': str(2000000 + self.hf_count), 'name': f'HF {self.hf_count}', 'unit': 'KG', 'items': []}
+
+        if rng.random() < spec['piece_rate']:
+            hf['unit'] = 'ST'
+            self.piece_hfs[hf['code']] = round(rng.uniform(0.1, 3.0), 4)
+
+        for _ in range(rng.integers(spec['children_per_hf'][0], spec['children_per_hf'][1] + 1)):
+            if level + 1 < spec['depth'] and rng.random() < spec['sub_hf_rate']:
+                hf['items'].append((self.pick_hf(level + 1), round(rng.uniform(0.05, 1.0), 3)))
+            else:
+                hf['items'].append((self.ingredients[rng.integers(len(self.ingredients))], round(rng.uniform(0.01, 0.5), 3)))
+
+        return hf
+
+    def pick_hf(self, level):
+        """ an HF for the given level, from the shared pool or made for this recipe """
+        if self.rng.random() < self.spec['sharing']:
+            slot = (level, int(self.rng.integers(self.spec['shared_hfs'])))
+
+            if slot not in self.shared_pool:
+                self.shared_pool[slot] = self.make_hf(level)
+
+            return self.shared_pool[slot]
+
+        return self.make_hf(level)
+
+    # ### BOM ###
+
+    def add_rows(self, meal, item, quantity, level, rows):
+        """
+        Add the BOM rows of an item, and of the items below it if it is an HF
+
+        The items of an HF are per unit of the HF; as in the download, their rows hold the quantity and costs for the quantity of the
+        HF in the meal, and the costs of an HF are the sum of the costs of its items.
+
+        Returns:
+        - The old material costs of the item
+        """
+        if isinstance(item, dict):
+            position = len(rows)
+            rows.append(None)
+            costs = sum(self.add_rows(meal, child, round(child_quantity * quantity, 6), level + 1, rows)
+                        for child, child_quantity in item['items'])
+            rows[position] = [meal, None, level, item['code'], item['name'], quantity, item['unit'], costs]
+            return costs
+
+        unit = 'ST' if item in self.piece_items else 'KG'
+        costs = self.old_prices[item] * quantity
+        rows.append([meal, None, level, item, f'Ingredient {item}', quantity, unit, costs])
+
+        return costs
+
+    def make_recipe(self, number):
+        """ make the BOM rows of a meal, with its waste rows """
+        rng, spec = self.rng, self.spec
+        meal = str(5000000 + number)
+        name = f'Maaltijd {number}'
+        rows = []
+
+        hfs = [self.pick_hf(1) for _ in range(rng.integers(spec['hfs_per_recipe'][0], spec['hfs_per_recipe'][1] + 1))]
+
+        for hf in hfs:
+            self.add_rows(meal, hf, round(rng.uniform(0.05, 0.4), 3), 1, rows)
+
+        for item in rng.integers(len(self.ingredients), size=rng.integers(spec['ingredients_per_recipe'][0], spec['ingredients_per_recipe'][1] + 1)):
+            item = self.ingredients[item]
+            self.add_rows(meal, item, round(rng.uniform(0.005, 0.1), 3), 1, rows)
+
+        if rng.random() < spec['orphan_rate']:
+            # packaging with items below it: the items get no waste ('Geen bijbehorend HF')
+            packaging = self.packaging[rng.integers(len(self.packaging))]
+            rows.append([meal, None, 1, packaging, f'Verpakking {packaging}', 1, 'ST', 0.0])
+            for item in rng.integers(len(self.ingredients), size=2):
+                self.add_rows(meal, self.ingredients[item], 0.01, 2, rows)
+
+        packaging = self.packaging[rng.integers(len(self.packaging))]
+        rows.append([meal, None, 1, packaging, f'Verpakking {packaging}', 1, 'ST', round(rng.uniform(0.05, 0.5), 4)])
+
+        for nr, row in enumerate(rows, start=1):
+            row[1] = nr
+
+        # waste rows of the HFs on level 1, all with the planned volume of the meal
+        volume = float(rng.integers(100, 20000))
+        for hf in hfs:
+            if rng.random() < spec['waste_rate']:
+                waste = [meal, hf['code'], hf['unit'], volume] + list(np.round(rng.uniform(0.0, 0.25, 3), 4))
+                self.waste_rows.append(waste)
+
+                if rng.random() < spec['duplicate_waste_rate']:
+                    self.waste_rows.append(waste[:4] + list(np.round(rng.uniform(0.0, 0.25, 3), 4)))
+
+        self.meals.append((meal, name))
+        self.row_count += len(rows)
+
+        return meal, name, rows
+
+    def make_recipes(self):
+        """ make the recipes of the spec, as the rows of the 'Budget' sheet """
+        spec = self.spec
+        empty = [None] * BOM_EXTRA_COLUMNS
+        self.bom_rows = [[None] * (8 + BOM_EXTRA_COLUMNS), ['Budget'] + [None] * (7 + BOM_EXTRA_COLUMNS)]
+
+        number = 0
+        while (self.row_count < spec['rows']) if spec['rows'] is not None else (number < spec['recipes']):
+            meal, name, rows = self.make_recipe(number)
+            number += 1
+
+            self.bom_rows.append([None, None, None, 'Nr.', 'Omschrijving', None, None, None] + empty)
+            self.bom_rows.append([None, None, None, meal, name, None, None, None] + empty)
+
+            for meal_id, nr, level, code, description, quantity, unit, costs in rows:
+                self.bom_rows.append([meal_id, nr, level, code, description, decimal_comma(quantity), unit, decimal_comma(round(costs, 6)),
+                                      decimal_comma(round(costs / quantity, 6)) if quantity else None, 'EUR', unit, 'Budget', 'Ja'])
+
+            self.bom_rows.append([None, None, None, 'Kostenaandeel voor dit artikel', None, None, None, None] + empty)
+
+    # ### Price list, waste table & active recipes ###
+
+    def price_weight_rows(self):
+        """ the rows of the 'PriceList' sheet: header, then a row per ingredient and per HF counted in pieces """
+        rng, spec = self.rng, self.spec
+        rows = [[None] * (3 + len(spec['price_periods'])), ['INGREDIENT CODE', 'INGREDIENTS', 'KG'] + list(spec['price_periods'])]
+
+        items = [(code, f'Ingredient {code}', self.kg[code]) for code in self.ingredients]
+        items += [(code, f'HF {code}', kg) for code, kg in self.piece_hfs.items() if rng.random() >= spec['missing_weight_rate']]
+
+        for code, name, kg in items:
+            prices = list(np.round(self.old_prices.get(code, 1.0) * rng.uniform(0.85, 1.2, len(spec['price_periods'])), 4))
+            rows.append([int(code), name, kg] + prices)
+
+            if (code in self.piece_items or code in self.piece_hfs) and rng.random() < spec['duplicate_weight_rate']:
+                rows.append([int(code), name, round(kg * rng.uniform(0.5, 1.5), 4)] + prices)
+
+        return rows
+
+    def waste_rows_sheet(self):
+        """ the rows of the 'WASTE' sheet """
+        header = ['MEAL CODE', 'INGREDIENT CODE', 'UNITS', 'VOLUME', 'WASTE-NAV', 'WASTE-FIN', 'WASTE-USE']
+        return [header] + [[int(row[0]), int(row[1])] + row[2:] for row in self.waste_rows]
+
+    def active_rows(self):
+        """ the rows of the 'Actief' sheet: whether every meal is active, per period ('PRICE Q2' -> 'Q2') """
+        periods = [period.replace('PRICE', '').strip() for period in self.spec['price_periods']]
+        rows = [[None] * (2 + len(periods)), ['Artikel', 'Omschrijving'] + periods]
+
+        for meal, name in self.meals:
+            rows.append([int(meal), name] + ['Actief' if self.rng.random() < self.spec['active_rate'] else 'Inactief'
+                                             for _ in periods])
+
+        return rows
+
+
+def write_sheet(path, sheet_name, rows):
+    """ write rows to a new workbook with one sheet, as values; None leaves a cell empty """
+    if len(rows) > EXCEL_MAX_ROWS:
+        raise ValueError(f'{len(rows)} regels passen niet op één tabblad ({EXCEL_MAX_ROWS}): {path}')
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_numbers': False, 'strings_to_formulas': False,
+                                          'strings_to_urls': False})
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    for r, row in enumerate(rows):
+        worksheet.write_row(r, 0, row) # empty cells (None) are left out
+
+    workbook.close()
+
+
+def write_inputs(folder, spec=None):
+    """
+    Write the synthetic input files of a spec to a folder
+
+    Parameters:
+    - folder: folder to write to, made if it does not exist
+    - spec: dict with (some of) the values in DEFAULT_SPEC
+
+    Returns:
+    - Config for okm_processing.run_pipeline with the written input files and the second price period (or the only one)
+    """
+    inputs = synthetic_inputs(spec)
+    os.makedirs(folder, exist_ok=True)
+
+    config = {'bom_name': os.path.join(folder, 'Recepten download NAV (synthetisch).xlsx'),
+              'price_weight_name': os.path.join(folder, 'Input Price List + Grammage (synthetisch).xlsx'),
+              'waste_name': os.path.join(folder, 'Input Waste Table (synthetisch).xlsx'),
+              'price_period': inputs.spec['price_periods'][min(1, len(inputs.spec['price_periods']) - 1)],
+              'output_name': os.path.join(folder, 'Output (synthetisch).xlsx')}
+
+    write_sheet(config['bom_name'], 'Budget', inputs.bom_rows)
+    write_sheet(config['price_weight_name'], 'PriceList', inputs.price_weight_rows())
+    write_sheet(config['waste_name'], 'WASTE', inputs.waste_rows_sheet())
+    write_sheet(os.path.join(folder, 'Input Actieve Recepten Master (synthetisch).xlsx'), 'Actief', inputs.active_rows())
+
+    print(f'{len(inputs.meals)} recepten, {inputs.row_count} BOM regels, {len(inputs.waste_rows)} waste regels geschreven naar {folder}')
+
+    return config
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Synthetische invoerbestanden voor het OKM model')
+    parser.add_argument('folder', help='map om de bestanden in te schrijven')
+    parser.add_argument('--recipes', type=int, default=DEFAULT_SPEC['recipes'], help='aantal recepten')
+    parser.add_argument('--rows', type=int, default=None, help='aantal BOM regels (in plaats van het aantal recepten)')
+    parser.add_argument('--depth', type=int, default=DEFAULT_SPEC['depth'], help='diepste niveau')
+    parser.add_argument('--sharing', type=float, default=DEFAULT_SPEC['sharing'], help='kans dat een HF gedeeld wordt met andere recepten')
+    parser.add_argument('--errors', type=float, default=None, help='kans op elke soort fout (dubbele waste, dubbele of ontbrekende conversie, verpakking met items eronder)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SPEC['seed'])
+    args = parser.parse_args(args)
+
+    spec = {'recipes': args.recipes, 'rows': args.rows, 'depth': args.depth, 'sharing': args.sharing, 'seed': args.seed}
+    if args.errors is not None:
+        spec.update({rate: args.errors for rate in ['duplicate_waste_rate', 'duplicate_weight_rate', 'missing_weight_rate', 'orphan_rate']})
+
+    write_inputs(args.folder, spec)
+
+
+if __name__ == '__main__':
+    main()
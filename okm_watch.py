@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # OKM Model - watch folder #
+# Keeps running, and makes the outputs again whenever new input files are put in a folder. The input names in the config can be
+# patterns, the newest matching file is used; e.g. bom_name = "*Recepten download NAV*.xlsx" picks up every new BOM download.
+#
+#     python okm_processing.py okm_jobs.toml --watch "S:\OKM"
+#
+# The folder is checked every few seconds. A job runs again when the contents (hash) of one of its input files changed, once the
+# file has stopped changing (it may still be being copied). Between runs the parsed inputs stay in memory (okm_processing.input_cache)
+# and the stage cache and run state stay on disk, so a run only parses and models what depends on the changed file. Only the latest
+# version of every input file is kept in memory, and after every run the stage cache entries that the last run of no job used are
+# deleted, so neither grows with every new download.
+#
+# The outputs are written to a temporary folder first and then moved in place, so the output files are never half written. A
+# failed run (e.g. a workbook that can not be read) is reported and retried when its inputs change again.
+
+import glob
+import os
+import shutil
+import time
+import traceback
+import uuid
+
+from okm_cache import stage_cache
+from okm_processing import input_cache, job_configs, run_config, run_pipeline, stage_keys
+
+
+# Parameters that are paths, relative to the watched folder
+PATH_PARAMETERS = ['bom_name', 'price_weight_name', 'waste_name', 'output_name', 'state_dir', 'cache_dir', 'history_dir']
+
+# Parameters that are input files, and can be patterns
+INPUT_PARAMETERS = ['bom_name', 'price_weight_name', 'waste_name']
+
+
+def resolve_job(job, folder):
+    """
+    Resolve the paths of a job in the watched folder
+
+    Parameters:
+    - job: complete run configuration
+    - folder: watched folder; relative paths are relative to it
+
+    Returns:
+    - Run configuration with the paths resolved, or None if an input file is missing
+    """
+    job = dict(job)
+
+    for parameter in PATH_PARAMETERS:
+        if job[parameter] is not None and not os.path.isabs(job[parameter]):
+            job[parameter] = os.path.join(folder, job[parameter])
+
+    for parameter in INPUT_PARAMETERS:
+        # Excel keeps a lock file ('~$...') next to an open workbook
+        matches = [path for path in glob.glob(job[parameter]) if not os.path.basename(path).startswith('~$')]
+
+        if not matches:
+            return None
+
+        job[parameter] = max(matches, key=os.path.getmtime)
+
+    return job
+
+
+def run_atomic(job, inputs):
+    """
+    Run a job, writing its outputs to a temporary folder next to the output and moving them in place afterwards
+
+    Returns:
+    - pipeline_result, with the final output paths
+    """
+    output_dir = os.path.dirname(os.path.abspath(job['output_name']))
+    temp_dir = os.path.join(output_dir, f'.okm-{uuid.uuid4().hex}')
+    os.makedirs(temp_dir)
+
+    try:
+        result = run_pipeline({**job, 'output_name': os.path.join(temp_dir, os.path.basename(job['output_name']))}, inputs)
+
+        # the files keep their names, so the index sheet of split workbooks stays right
+        output_files = []
+        for path in result.output_files:
+            final_path = os.path.join(output_dir, os.path.basename(path))
+            os.replace(path, final_path)
+            output_files.append(final_path)
+
+        result.output_files = output_files
+        return result
+
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class folder_watcher:
+    """ runs the jobs of a config whenever their input files in a folder change """
+
+    def __init__(self, folder : str, config : dict, interval : float = 5.0) -> None:
+        """ initialise an instance of folder_watcher"""
+        self.folder = folder
+        self.jobs = job_configs(config)
+        self.interval = interval
+        self.inputs = input_cache()
+        self.seen = {} # job name -> size & modification time of its input files at the previous check
+        self.processed = {} # job name -> hashes of the input files of its last run
+        self.cache_entries = {} # job name -> cache directory and (stage, key) of the stage cache entries of its last run
+
+        # validate every job before watching
+        for _, job in self.jobs:
+            run_config(job)
+
+    def poll(self) -> list:
+        """
+        Check the folder once, and run the jobs whose input files changed
+
+        Returns:
+        - Names of the jobs that ran
+        """
+        ran = []
+
+        for name, job in self.jobs:
+            resolved = resolve_job(run_config(job), self.folder)
+
+            if resolved is None:
+                continue
+
+            stats = {parameter: (os.stat(resolved[parameter]).st_size, os.stat(resolved[parameter]).st_mtime_ns)
+                     for parameter in INPUT_PARAMETERS}
+
+            # a file that changed since the previous check may still be being written
+            if self.seen.get(name) != stats:
+                self.seen[name] = stats
+                continue
+
+            hashes = {parameter: self.inputs.file_hash(resolved[parameter]) for parameter in INPUT_PARAMETERS}
+
+            if self.processed.get(name) == hashes:
+                continue
+
+            print(f'\n## {time.strftime("%H:%M:%S")} Job {name}: '
+                  f'{", ".join(os.path.basename(resolved[parameter]) for parameter in INPUT_PARAMETERS)} ##')
+
+            if resolved['cache_dir'] is not None:
+                self.cache_entries[name] = (resolved['cache_dir'], set(stage_keys(resolved, self.inputs).items()))
+
+            try:
+                result = run_atomic(resolved, self.inputs)
+                print(f'Klaar: {result}')
+
+            except PermissionError as error:
+                # e.g. the output is open in Excel; retried at the next check
+                print(f'Output kan niet worden vervangen ({error}), volgende poging over {self.interval:g} s')
+                continue
+
+            except Exception:
+                traceback.print_exc()
+                print(f'Job {name} mislukt, opnieuw zodra de invoer wijzigt')
+
+            self.processed[name] = hashes
+            ran.append(name)
+
+        if ran:
+            self.prune_cache()
+
+        return ran
+
+    def prune_cache(self) -> None:
+        """ delete the stage cache entries that the last run of no job used """
+        keep = {}
+        for cache_dir, entries in self.cache_entries.values():
+            keep.setdefault(os.path.abspath(cache_dir), set()).update(entries)
+
+        for cache_dir, entries in keep.items():
+            deleted = stage_cache(cache_dir).prune(entries)
+            if deleted:
+                print(f'{deleted} oude cache entries verwijderd uit {cache_dir}')
+
+    def watch(self) -> None:
+        """ check the folder until interrupted (Ctrl+C) """
+        print(f'Map wordt bewaakt: {self.folder} (elke {self.interval:g} s, stoppen met Ctrl+C)')
+
+        try:
+            while True:
+                self.poll()
+                time.sleep(self.interval)
+
+        except KeyboardInterrupt:
+            print('Gestopt')
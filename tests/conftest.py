@@ -0,0 +1,65 @@
+# # OKM Model - test fixtures #
+# The tests run on small synthetic inputs (okm_synthetic), written once per test session.
+
+import os
+import shutil
+import sys
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from okm_synthetic import write_inputs
+
+
+@pytest.fixture(scope='session')
+def synthetic_inputs(tmp_path_factory):
+    """ the run config of synthetic inputs with every kind of injected error, without the output parameters """
+    folder = tmp_path_factory.mktemp('inputs')
+
+    return write_inputs(str(folder), {'recipes': 40, 'seed': 1,
+                                      **{rate: 0.05 for rate in ['duplicate_waste_rate', 'duplicate_weight_rate',
+                                                                 'missing_weight_rate', 'orphan_rate']}})
+
+
+@pytest.fixture
+def run_config(synthetic_inputs, tmp_path):
+    """ a run config on the synthetic inputs, with the outputs, run state and stage cache in a folder of the test """
+    return {**synthetic_inputs,
+            'output_name': str(tmp_path / 'Output.xlsx'),
+            'state_dir': str(tmp_path / '.okm_state'),
+            'cache_dir': str(tmp_path / '.okm_cache'),
+            'run_report': False}
+
+
+@pytest.fixture
+def inputs_copy(synthetic_inputs, tmp_path):
+    """ a copy of the synthetic input files in a folder of the test, to change them in """
+    folder = tmp_path / 'inputs'
+    folder.mkdir()
+
+    config = dict(synthetic_inputs)
+    for name in ['bom_name', 'price_weight_name', 'waste_name']:
+        config[name] = shutil.copy(synthetic_inputs[name], folder)
+
+    return config
+
+
+@pytest.fixture
+def change_prices():
+    """ a function raising the price of a share of the items in a synthetic price list, in place """
+
+    def change(path, price_period, share=0.1, factor=1.25):
+        workbook = openpyxl.load_workbook(path)
+        sheet = workbook.active
+
+        header = [cell.value for cell in sheet[2]]
+        column = header.index(price_period) + 1
+
+        for row in range(3, sheet.max_row + 1, int(round(1 / share))):
+            sheet.cell(row, column).value = round(sheet.cell(row, column).value * factor, 4)
+
+        workbook.save(path)
+
+    return change
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from okm_bom import read_bom, recipe_bounds
+from okm_bom_diff import diff_boms
+
+
+@pytest.fixture
+def bom(synthetic_inputs):
+    """ the synthetic BOM download and the rows of its first recipe """
+    raw = read_bom(synthetic_inputs['bom_name'])
+    _, _, start_idx, end_idx = recipe_bounds(raw)[0]
+
+    return raw, range(start_idx, end_idx)
+
+
+def changes_of(old_raw, new_raw):
+    changes, counts = diff_boms(old_raw, new_raw)
+    return list(changes['Wijziging']), counts
+
+
+def test_same_download(bom):
+    raw, _ = bom
+    changes, counts = changes_of(raw, raw.copy())
+
+    assert changes == []
+    assert counts['Gewijzigd'] == counts['Toegevoegd'] == counts['Verwijderd'] == 0
+
+
+def test_added_and_removed_row(bom):
+    raw, rows = bom
+    new_raw = raw.drop(rows[1]).reset_index(drop=True)
+
+    assert changes_of(raw, new_raw) == (['Item verwijderd'], {'Ongewijzigd': len(recipe_bounds(raw)) - 1, 'Gewijzigd': 1,
+                                                               'Toegevoegd': 0, 'Verwijderd': 0})
+    assert changes_of(new_raw, raw)[0] == ['Item toegevoegd']
+
+
+def test_changed_quantity_next_to_an_empty_unit(bom):
+    raw, rows = bom
+    # a unit left empty in both downloads is not a change
+    raw.loc[rows[0], 6] = np.nan
+    new_raw = raw.copy()
+    new_raw.loc[rows[1], 5] = new_raw.loc[rows[1], 5] + 1
+
+    assert changes_of(raw, new_raw)[0] == ['Aantal gewijzigd']
+
+
+def test_reordered_rows(bom):
+    raw, rows = bom
+    raw.loc[rows[0], 6] = np.nan
+    new_raw = raw.copy()
+    new_raw.loc[[rows[1], rows[2]]] = raw.loc[[rows[2], rows[1]]].to_numpy()
+
+    assert changes_of(raw, new_raw)[0] == ['Volgorde gewijzigd']
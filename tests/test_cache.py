@@ -0,0 +1,44 @@
+import pandas as pd
+
+from okm_cache import stage_cache, recipes_to_tables, recipes_from_tables
+from okm_processing import run_pipeline
+
+
+def test_recipes_round_trip(run_config, tmp_path):
+    recipes = run_pipeline({**run_config, 'cache_dir': None}).recipes
+    cache = stage_cache(str(tmp_path / 'cache'))
+    cache.save('model_recipes', 'key', recipes)
+    loaded = cache.load('model_recipes', 'key')
+
+    assert [(r.id, r.name, r.fingerprint, r.result_key, r.totals) for r in loaded] == \
+           [(r.id, r.name, r.fingerprint, r.result_key, r.totals) for r in recipes]
+
+    # numbers, missing values and sentinel texts come back in the same columns
+    for original, restored in zip(recipes, loaded):
+        for col in original.data.columns:
+            assert [None if pd.isna(value) else value for value in original.data[col].astype(object)] == \
+                   [None if pd.isna(value) else value for value in restored.data[col].astype(object)], col
+
+
+def test_tables_round_trip_without_recipes():
+    assert recipes_from_tables(*recipes_to_tables([])) == []
+
+
+def test_run_from_cache_equals_run_without(run_config, tmp_path, capsys):
+    first = run_pipeline(run_config)
+    capsys.readouterr()
+    cached = run_pipeline({**run_config, 'state_dir': str(tmp_path / 'other state')})
+
+    assert 'Uit de cache: model_recipes' in capsys.readouterr().out
+    pd.testing.assert_frame_equal(cached.bom, first.bom)
+    pd.testing.assert_frame_equal(cached.meals, first.meals)
+
+
+def test_prune(tmp_path):
+    cache = stage_cache(str(tmp_path / 'cache'))
+    table = pd.DataFrame({'a': [1, 2]})
+    for key in ['old', 'new']:
+        cache.save('stage', key, table)
+
+    assert cache.prune({('stage', 'new')}) == 1
+    assert not cache.has('stage', 'old') and cache.has('stage', 'new')
@@ -0,0 +1,48 @@
+import pandas as pd
+
+from okm_diff import read_run, diff_runs, main
+from okm_history import COST_COLUMNS
+from okm_processing import run_pipeline
+
+
+def summary(diff):
+    return dict(zip(diff['summary']['Omschrijving'], diff['summary']['Waarde']))
+
+
+def test_formats_of_a_run_are_the_same(run_config, tmp_path):
+    result = run_pipeline({**run_config, 'output_formats': ['xlsx', 'parquet', 'sqlite']})
+    xlsx, parquet, sqlite = result.output_files
+
+    for other in [parquet, sqlite]:
+        diff = diff_runs(read_run(xlsx), read_run(other))
+
+        assert summary(diff)['Regels gewijzigd'] == 0
+        assert len(diff['added']) == len(diff['removed']) == len(diff['changed']) == len(diff['meals']) == 0
+
+
+def test_price_change(inputs_copy, run_config, change_prices, tmp_path):
+    config = {**run_config, **inputs_copy, 'output_formats': ['parquet']}
+    old = run_pipeline({**config, 'output_name': str(tmp_path / 'old.xlsx')})
+    change_prices(config['price_weight_name'], config['price_period'])
+    new = run_pipeline({**config, 'output_name': str(tmp_path / 'new.xlsx')})
+
+    diff = diff_runs(read_run(old.output_files[0]), read_run(new.output_files[0]))
+
+    assert summary(diff)['Regels toegevoegd'] == summary(diff)['Regels verwijderd'] == 0
+    assert summary(diff)['Regels gewijzigd'] > 0
+    assert set(diff['meals']['Status']) == {'Gewijzigd'}
+
+    # the cost delta of every meal is the difference of its costs in the two runs
+    meals = diff['meals'].set_index('Meal ID')
+    old_costs = old.meals.set_index(old.meals['Meal ID'].astype(str))[COST_COLUMNS[-1]]
+    new_costs = new.meals.set_index(new.meals['Meal ID'].astype(str))[COST_COLUMNS[-1]]
+    pd.testing.assert_series_equal((new_costs - old_costs).loc[meals.index], meals[COST_COLUMNS[-1] + ' delta'],
+                                   check_names=False, check_index_type=False)
+
+
+def test_command_line(run_config, tmp_path, capsys):
+    output = run_pipeline(run_config).output_files[0]
+    main([output, output, str(tmp_path / 'diff.xlsx')])
+
+    assert (tmp_path / 'diff.xlsx').exists()
+    assert 'Regels gewijzigd' in capsys.readouterr().out
@@ -0,0 +1,26 @@
+import pytest
+
+from okm_equivalence import compare_engines, load_inputs
+from okm_model import MODEL_STEPS
+
+
+@pytest.fixture(scope='module')
+def inputs(synthetic_inputs):
+    """ the parsed synthetic recipes and lookup tables, with a share of the items left out of the product master """
+    return load_inputs(synthetic_inputs, unclassified=0.05)
+
+
+def test_model_equals_the_reference(inputs):
+    comparison = compare_engines(*inputs)
+
+    assert list(comparison['stap'].unique()) == list(MODEL_STEPS)
+    assert comparison['verschillen'].sum() == 0, comparison[comparison['verschillen'] > 0].to_string()
+
+
+def test_difference_is_reported_at_its_step(inputs):
+    engine_steps = {**MODEL_STEPS, 'deltas': (lambda recipe, lookups: None, MODEL_STEPS['deltas'][1])}
+    comparison = compare_engines(*inputs, engine_steps)
+
+    differences = comparison[comparison['verschillen'] > 0]
+    assert not differences.empty
+    assert differences['stap'].iloc[0] == 'deltas'
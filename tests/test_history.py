@@ -0,0 +1,48 @@
+import datetime
+
+import pandas as pd
+
+from okm_history import append_run, list_runs, meal_cost_trend, ingredient_cost_trend, COST_COLUMNS
+from okm_processing import run_pipeline
+
+
+def test_runs_in_the_same_second(tmp_path):
+    table = pd.DataFrame({'Level': [1]})
+    timestamp = datetime.datetime(2025, 4, 16, 9, 30)
+
+    paths = [append_run(str(tmp_path), table, 'Q2', timestamp) for _ in range(3)]
+
+    assert len(set(paths)) == 3
+    assert len(list_runs(str(tmp_path))) == 3
+
+
+def test_history_of_runs(run_config, tmp_path):
+    history_dir = str(tmp_path / 'history')
+    q2 = run_pipeline({**run_config, 'history_dir': history_dir})
+    q3 = run_pipeline({**run_config, 'history_dir': history_dir, 'price_period': 'PRICE Q3'})
+    run_pipeline({**run_config, 'history_dir': history_dir, 'price_period': 'PRICE Q3'})
+
+    # the period follows the price period, every run is kept
+    runs = list_runs(history_dir)
+    assert runs['period'].value_counts().to_dict() == {'Q3': 2, 'Q2': 1}
+
+    # the latest run of every period, with the costs of the meals
+    trend = meal_cost_trend(history_dir)
+    assert trend.groupby('period')['run'].nunique().to_dict() == {'Q2': 1, 'Q3': 1}
+
+    for period, result in [('Q2', q2), ('Q3', q3)]:
+        costs = trend[trend['period'] == period].set_index('Meal ID')[COST_COLUMNS[-1]]
+        expected = result.meals.set_index(result.meals['Meal ID'].astype(str))[COST_COLUMNS[-1]]
+        assert (costs - expected.loc[costs.index]).abs().max() < 1e-9
+
+    assert len(meal_cost_trend(history_dir, all_runs=True)) == 3 * len(q2.meals)
+
+    ingredients = ingredient_cost_trend(history_dir, periods=['Q2'])
+    assert set(ingredients['period']) == {'Q2'}
+    assert 'Halffabrikaat' not in set(q2.bom.loc[q2.bom['Ingredient ID'].isin(ingredients['Ingredient ID']), 'Categorie Master'])
+
+    # a meal with an ingredient on more than one row is counted once
+    bom = q2.bom[q2.bom['Categorie Master'] != 'Halffabrikaat']
+    meals = bom.groupby(bom['Ingredient ID'].astype(str))['Meal ID'].nunique()
+    assert (ingredients.set_index('Ingredient ID')['Aantal maaltijden'] == meals.loc[ingredients['Ingredient ID']].to_numpy()).all()
+    assert (bom.groupby(['Ingredient ID', 'Meal ID']).size() > 1).any()
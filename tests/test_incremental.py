@@ -0,0 +1,169 @@
+import copy
+import os
+import shutil
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from okm_diff import read_run, diff_runs
+from okm_processing import run_pipeline, input_cache, read_recipes, read_price_weight_data, read_waste_data
+from okm_processing import build_product_master
+from okm_state import input_signatures, recipe_result_key, recipe_fingerprint, load_run_state
+
+
+def assert_same_runs(result, expected):
+    """ the same BOM, meals and Excel output """
+    pd.testing.assert_frame_equal(result.bom, expected.bom)
+    pd.testing.assert_frame_equal(result.meals, expected.meals)
+
+    diff = diff_runs(read_run(expected.output_files[0]), read_run(result.output_files[0]))
+    assert len(diff['added']) == len(diff['removed']) == len(diff['changed']) == 0
+
+
+def full_run(config, tmp_path, name):
+    """ a run without a previous state and without the stage cache """
+    return run_pipeline({**config, 'output_name': str(tmp_path / f'{name}.xlsx'), 'state_dir': str(tmp_path / f'{name} state'),
+                         'cache_dir': None})
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_price_only_run_equals_full_run(inputs_copy, run_config, change_prices, tmp_path, cache):
+    config = {**run_config, **inputs_copy}
+    if not cache:
+        config['cache_dir'] = None
+
+    run_pipeline(config)
+    change_prices(config['price_weight_name'], config['price_period'])
+
+    incremental = run_pipeline(config)
+    full = full_run(config, tmp_path, 'full')
+
+    assert_same_runs(incremental, full)
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_waste_change_run_equals_full_run(inputs_copy, run_config, tmp_path, cache):
+    config = {**run_config, **inputs_copy}
+    if not cache:
+        config['cache_dir'] = None
+
+    run_pipeline(config)
+
+    # the waste of the first meal goes up, the other meals are reused from the previous run
+    workbook = openpyxl.load_workbook(config['waste_name'])
+    sheet = workbook.active
+    sheet.cell(2, 7).value = sheet.cell(2, 7).value + 0.1
+    workbook.save(config['waste_name'])
+
+    incremental = run_pipeline(config)
+    full = full_run(config, tmp_path, 'full')
+
+    assert_same_runs(incremental, full)
+
+
+def test_sheet_change_is_not_a_price_only_run(inputs_copy, run_config, change_prices, tmp_path, capsys):
+    config = {**run_config, **inputs_copy, 'cache_dir': None}
+
+    # a second BOM sheet in the same file, with another quantity
+    workbook = openpyxl.load_workbook(config['bom_name'])
+    sheet = workbook.copy_worksheet(workbook['Budget'])
+    sheet.title = 'Budget 2'
+    row = next(row for row in range(3, sheet.max_row + 1) if sheet.cell(row, 1).value is not None and sheet.cell(row, 6).value)
+    sheet.cell(row, 6).value = '1,5'
+    workbook.save(config['bom_name'])
+
+    run_pipeline(config)
+
+    # the other sheet of the same BOM file, together with new prices
+    change_prices(config['price_weight_name'], config['price_period'])
+    capsys.readouterr()
+    incremental = run_pipeline({**config, 'bom_sheet_name': 'Budget 2'})
+    assert 'Alleen de prijslijst is gewijzigd' not in capsys.readouterr().out
+
+    assert_same_runs(incremental, full_run({**config, 'bom_sheet_name': 'Budget 2'}, tmp_path, 'full'))
+
+
+def test_price_only_run_reuses_the_previous_run(inputs_copy, run_config, change_prices, capsys):
+    config = {**run_config, **inputs_copy}
+
+    run_pipeline(config)
+    change_prices(config['price_weight_name'], config['price_period'])
+    capsys.readouterr()
+    run_pipeline(config)
+
+    assert 'Alleen de prijslijst is gewijzigd' in capsys.readouterr().out
+
+
+def test_unchanged_recipes_are_reused(run_config, capsys):
+    first = run_pipeline({**run_config, 'cache_dir': None})
+    capsys.readouterr()
+    second = run_pipeline({**run_config, 'cache_dir': None})
+
+    assert f'{len(first.recipes)} van {len(first.recipes)} recepten ongewijzigd' in capsys.readouterr().out
+    pd.testing.assert_frame_equal(first.bom, second.bom)
+
+
+@pytest.fixture(scope='module')
+def parsed(synthetic_inputs):
+    """ the parsed recipes, the product master and the lookup tables of the synthetic inputs """
+    inputs = input_cache()
+    recipes = copy.deepcopy(inputs.read(read_recipes, synthetic_inputs['bom_name'], 'Budget'))
+    price_weight_data = inputs.read(read_price_weight_data, synthetic_inputs['price_weight_name'], 'PriceList')
+    waste_data = inputs.read(read_waste_data, synthetic_inputs['waste_name'], 'WASTE')
+
+    return recipes, build_product_master(recipes), price_weight_data, waste_data
+
+
+def result_keys(recipes, product_master, price_weight_data, waste_data, price_period):
+    signatures = input_signatures(product_master, price_weight_data, waste_data, price_period)
+    return [recipe_result_key(recipe, signatures) for recipe in recipes]
+
+
+def test_reuse_keys(parsed, synthetic_inputs):
+    recipes, product_master, price_weight_data, waste_data = parsed
+    price_period = synthetic_inputs['price_period']
+    keys = result_keys(recipes, product_master, price_weight_data, waste_data, price_period)
+
+    # the same inputs give the same keys, every recipe its own
+    assert keys == result_keys(recipes, product_master, price_weight_data, waste_data, price_period)
+    assert len(set(keys)) == len(recipes)
+
+    # a price change only changes the keys of the recipes with the item
+    item = recipes[0].data['hf_nr'][len(recipes[0].data) - 2]
+    changed_prices = price_weight_data.copy()
+    changed_prices.loc[changed_prices['INGREDIENT CODE'] == item, price_period] += 1
+    changed_keys = result_keys(recipes, product_master, changed_prices, waste_data, price_period)
+
+    assert [old != new for old, new in zip(keys, changed_keys)] == [item in set(recipe.data['hf_nr']) for recipe in recipes]
+
+    # another price period changes every key
+    other_keys = result_keys(recipes, product_master, price_weight_data, waste_data, 'PRICE Q3')
+    assert not set(keys) & set(other_keys)
+
+
+def test_fingerprint_ignores_the_position_in_the_download(parsed):
+    data = parsed[0][0].data
+    moved = data.assign(index=data['index'] + 100)
+
+    assert recipe_fingerprint(moved) == recipe_fingerprint(data)
+    assert recipe_fingerprint(data.assign(**{'Aantal (Basis)': data['Aantal (Basis)'] * 2})) != recipe_fingerprint(data)
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_state_keeps_the_recipes_once(run_config, cache):
+    config = run_config if cache else {**run_config, 'cache_dir': None}
+    result = run_pipeline(config)
+    state = load_run_state(config['state_dir'])
+
+    assert [recipe.result_key for recipe in state['recipes']] == [recipe.result_key for recipe in result.recipes]
+
+    # with the stage cache the state refers to the cache entry, instead of storing the recipes again
+    assert os.path.exists(os.path.join(config['state_dir'], 'recipes.pkl')) != cache
+
+
+def test_state_without_its_cache_entry(run_config):
+    run_pipeline(run_config)
+    shutil.rmtree(run_config['cache_dir'])
+
+    assert load_run_state(run_config['state_dir']) is None
@@ -0,0 +1,75 @@
+import os
+
+import pandas as pd
+import pytest
+
+from okm_output import plan_shards, write_bom_excel
+from okm_processing import run_pipeline
+
+
+MAX_ROWS = 200
+
+
+@pytest.fixture(scope='module')
+def recipes(synthetic_inputs, tmp_path_factory):
+    """ the modeled synthetic recipes """
+    folder = tmp_path_factory.mktemp('output')
+    config = {**synthetic_inputs, 'output_name': str(folder / 'Output.xlsx'), 'state_dir': str(folder / '.okm_state'),
+              'cache_dir': None, 'run_report': False}
+
+    return run_pipeline(config).recipes
+
+
+def read_sheets(path, sheet_names):
+    """ the BOM sheets of a workbook, as one table """
+    return pd.concat([pd.read_excel(path, sheet_name=sheet_name) for sheet_name in sheet_names], ignore_index=True)
+
+
+def test_shard_boundaries(recipes):
+    shards = plan_shards(recipes, MAX_ROWS)
+
+    assert len(shards) > 2
+    assert [recipe for shard in shards for recipe in shard] == recipes
+
+    sizes = [1 + sum(len(recipe.data) for recipe in shard) for shard in shards]
+    assert max(sizes) <= MAX_ROWS
+
+    # a shard is only closed when the next recipe does not fit on it
+    for size, next_shard in zip(sizes, shards[1:]):
+        assert size + len(next_shard[0].data) > MAX_ROWS
+
+    with pytest.raises(ValueError):
+        plan_shards(recipes, max(len(recipe.data) for recipe in recipes))
+
+
+def test_sharded_sheets(recipes, tmp_path):
+    unsharded = write_bom_excel(str(tmp_path / 'BOM.xlsx'), recipes)
+    sharded = write_bom_excel(str(tmp_path / 'BOM sharded.xlsx'), recipes, max_rows=MAX_ROWS)
+
+    assert len(unsharded) == len(sharded) == 1
+
+    shards = plan_shards(recipes, MAX_ROWS)
+    sheet_names = [f'BOM_{n}' for n in range(1, len(shards) + 1)]
+    table = read_sheets(sharded[0], sheet_names)
+
+    pd.testing.assert_frame_equal(table, read_sheets(unsharded[0], ['BOM']))
+
+    # the index points at the first row of every meal
+    index = pd.read_excel(sharded[0], sheet_name='Index')
+    assert list(index['Tabblad'].unique()) == sheet_names
+    assert (index.groupby('Tabblad', sort=False)['Aantal regels'].sum() + 1 <= MAX_ROWS).all()
+    assert index['Aantal regels'].sum() == len(table)
+
+
+def test_sharded_workbooks(recipes, tmp_path):
+    unsharded = write_bom_excel(str(tmp_path / 'BOM.xlsx'), recipes)
+    paths = write_bom_excel(str(tmp_path / 'BOM sharded.xlsx'), recipes, max_rows=MAX_ROWS, split_workbooks=True)
+
+    shards = plan_shards(recipes, MAX_ROWS)
+    assert [os.path.basename(path) for path in paths[1:]] == [f'BOM sharded ({n}).xlsx' for n in range(1, len(shards) + 1)]
+
+    table = pd.concat([read_sheets(path, [f'BOM_{n}']) for n, path in enumerate(paths[1:], start=1)], ignore_index=True)
+    pd.testing.assert_frame_equal(table, read_sheets(unsharded[0], ['BOM']))
+
+    index = pd.read_excel(paths[0], sheet_name='Index')
+    assert list(index['Bestand'].unique()) == [os.path.basename(path) for path in paths[1:]]
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from okm_processing import run_pipeline, planning_stage, read_waste_data
+
+
+def test_volumes_with_numeric_meal_ids(run_config):
+    result = run_pipeline({**run_config, 'cache_dir': None})
+    waste_data = read_waste_data(run_config['waste_name'], 'WASTE')
+    demand_ingredient, demand_category, _ = planning_stage(result.recipes, waste_data)
+
+    assert demand_category['Benodigd (kg)'].sum() > 0
+
+    # a download whose meal ids are read as numbers: 'id_nr' as float text, the recipe id as a number
+    for recipe in result.recipes:
+        recipe.id = int(recipe.id)
+        recipe.data['id_nr'] = str(float(recipe.id))
+
+    numeric_ingredient, numeric_category, _ = planning_stage(result.recipes, waste_data)
+
+    pd.testing.assert_frame_equal(numeric_ingredient, demand_ingredient)
+    pd.testing.assert_frame_equal(numeric_category, demand_category)
@@ -0,0 +1,97 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+import pytest
+
+from okm_processing import input_cache, read_recipes
+from okm_server import query_service, make_server
+
+
+@pytest.fixture(scope='module')
+def inputs(synthetic_inputs):
+    """ the parsed inputs, with the meal ids as numbers, as NAV downloads have them """
+    inputs = input_cache()
+
+    for recipe in inputs.read(read_recipes, synthetic_inputs['bom_name'], 'Budget'):
+        recipe.id = int(recipe.id)
+
+    return inputs
+
+
+@pytest.fixture(scope='module')
+def service(synthetic_inputs, inputs):
+    return query_service(synthetic_inputs, inputs)
+
+
+@pytest.fixture(scope='module')
+def server(service):
+    """ the query service on a free port """
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='module')
+def ids(service):
+    """ a meal id and an item id that are in the BOM """
+    session = service.session()
+    return str(session.recipes[0].id), session.recipes[0].data['hf_nr'][0]
+
+
+def get(server, path):
+    """ the status and JSON body of a query """
+    host, port = server.server_address[:2]
+
+    try:
+        with urllib.request.urlopen(f'http://{host}:{port}{path}') as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+ENDPOINTS = ['/meals', '/meals/{meal}', '/meals/{meal}/breakdown', '/items/{item}/where-used']
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_found(server, ids, endpoint):
+    status, body = get(server, endpoint.format(meal=ids[0], item=ids[1]))
+
+    assert status == 200
+    assert body
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_other_period(server, ids, endpoint):
+    status, _ = get(server, endpoint.format(meal=ids[0], item=ids[1]) + '?period=' + quote('PRICE Q3'))
+
+    assert status == 200
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_unknown_period(server, ids, endpoint):
+    status, body = get(server, endpoint.format(meal=ids[0], item=ids[1]) + '?period=' + quote('PRICE Q9'))
+
+    assert status == 400
+    assert 'PRICE Q9' in body['error']
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS[1:])
+def test_unknown_meal_or_item(server, endpoint):
+    status, _ = get(server, endpoint.format(meal='999999999', item='999999999'))
+
+    assert status == 404
+
+
+def test_meal_cost(server, ids):
+    _, meals = get(server, '/meals')
+    _, meal = get(server, f'/meals/{ids[0]}')
+
+    assert meal == next(row for row in meals['meals'] if str(row['Meal ID']) == ids[0])
@@ -0,0 +1,34 @@
+from okm_session import model_session
+
+
+PRICE = 'Ingredientprijs p.e. (Actueel) (€)'
+
+
+def test_override_price_in_an_integer_price_column(synthetic_inputs):
+    session = model_session(synthetic_inputs)
+    price_period = session.lookups.price_period
+
+    # a price list without decimals is read with an integer price column
+    session.price_weight_data[price_period] = session.price_weight_data[price_period].round().astype('Int64')
+    item = next(code for code in session.item_recipes if code in set(session.price_weight_data['INGREDIENT CODE']))
+
+    bom = session.override_price(item, 4.25)
+
+    assert set(bom.loc[bom['Ingredient ID'] == item, PRICE]) == {4.25}
+
+
+def test_set_waste_in_an_integer_waste_column(synthetic_inputs):
+    session = model_session(synthetic_inputs)
+
+    # a waste column that is all zero is read with an integer column
+    session.waste_data['WASTE-USE'] = 0
+    session.waste_data['WASTE-USE'] = session.waste_data['WASTE-USE'].astype('Int64')
+    meal, item = session.waste_data.loc[0, 'MEAL CODE'], session.waste_data.loc[0, 'INGREDIENT CODE']
+
+    # a meal & item with waste rows, and one without
+    session.set_waste(meal, item, use=0.08)
+    session.set_waste(meal, '999999', fin=0.05)
+
+    assert set(session.waste_data.loc[session.waste_data['id'] == f'{meal}_{item}', 'WASTE-USE']) == {0.08}
+    assert session.waste_data['id'].iloc[-1] == f'{meal}_999999'
+    assert session.waste_data['WASTE-FIN'].iloc[-1] == 0.05